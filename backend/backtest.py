@@ -0,0 +1,282 @@
+"""Backtest a served model over the stored hourly history.
+
+    python backtest.py --city nyc [--models models] [--history data/history] [--workers 4]
+
+Every usable hour of history becomes one evaluation window, chosen exactly
+as for training (train.select_windows: complete window, observed label hour
+``--horizon`` hours after it). The series is scaled once and
+``sliding_window_view`` exposes every window as a zero-copy (n, window, F)
+view, so a batch is one fancy-index into it. Scored batches are folded
+straight into running totals (BacktestStats) and discarded, so memory stays
+flat for millions of windows.
+
+With ``--workers N`` the scaled series is placed in shared memory and N
+processes, each with its own copy of the model and a 1/N share of the CPU
+threads, score contiguous chunks of window ends and send back only their
+totals.
+
+The report (printed, and as JSON with ``--output``) has accuracy,
+per-class precision/recall/F1, the multi-class Brier score, and reliability
+curves (top-class confidence against accuracy in ``--bins`` bins) overall,
+per month and per hour of day, each with its expected calibration error.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from history_store import HOUR, HistoryStore
+from labels import CLASSES
+from model_registry import artifact_paths, load_bundle
+from train import DEFAULT_HISTORY, DEFAULT_OUT, load_series, select_windows, time_feature_array
+
+GROUPS = {'all': 1, 'month': 12, 'hour': 24}
+
+
+class BacktestStats:
+    """Running confusion matrix, Brier sums and reliability bins; merge() combines partial totals."""
+
+    def __init__(self, n_classes, bins=10):
+        self.n_classes = n_classes
+        self.bins = bins
+        self.confusion = np.zeros((n_classes, n_classes), dtype=np.int64)
+        # Per group and confidence bin: [windows, summed confidence, correct]
+        self.calibration = {name: np.zeros((size, bins, 3)) for name, size in GROUPS.items()}
+        self.brier = {name: np.zeros(size) for name, size in GROUPS.items()}
+
+    def update(self, probs, labels, months, hours):
+        """Fold in (B, n_classes) probabilities for labels (B,), months 1-12 and hours 0-23."""
+        c = self.n_classes
+        pred = probs.argmax(axis=1)
+        confidence = probs[np.arange(len(pred)), pred]
+        correct = pred == labels
+        self.confusion += np.bincount(labels * c + pred, minlength=c * c).reshape(c, c)
+        onehot = np.zeros_like(probs)
+        onehot[np.arange(len(labels)), labels] = 1.0
+        brier = ((probs - onehot) ** 2).sum(axis=1)
+        conf_bin = np.minimum((confidence * self.bins).astype(np.int64), self.bins - 1)
+        for name, group in (('all', np.zeros(len(pred), dtype=np.int64)), ('month', months - 1), ('hour', hours)):
+            size = GROUPS[name]
+            cell = group * self.bins + conf_bin
+            for k, weights in enumerate((None, confidence, correct)):
+                self.calibration[name][..., k] += np.bincount(cell, weights=weights,
+                                                              minlength=size * self.bins).reshape(size, self.bins)
+            self.brier[name] += np.bincount(group, weights=brier, minlength=size)
+
+    def merge(self, other):
+        self.confusion += other.confusion
+        for name in GROUPS:
+            self.calibration[name] += other.calibration[name]
+            self.brier[name] += other.brier[name]
+        return self
+
+    @property
+    def count(self):
+        return int(self.confusion.sum())
+
+    def _curve(self, cal, brier):
+        n = cal[:, 0]
+        total = n.sum()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            confidence, accuracy = cal[:, 1] / n, cal[:, 2] / n
+        seen = n > 0
+        ece = float(np.sum(np.abs(accuracy[seen] - confidence[seen]) * n[seen]) / total) if total else None
+        return {
+            'windows': int(total),
+            'accuracy': float(cal[:, 2].sum() / total) if total else None,
+            'brier': float(brier / total) if total else None,
+            'ece': ece,
+            'curve': [{'bin': [i / self.bins, (i + 1) / self.bins], 'windows': int(n[i]),
+                       'confidence': float(confidence[i]), 'accuracy': float(accuracy[i])}
+                      for i in range(self.bins) if seen[i]],
+        }
+
+    def report(self, classes):
+        true, pred = self.confusion.sum(axis=1), self.confusion.sum(axis=0)
+        hits = np.diag(self.confusion)
+        per_class = {}
+        for i, name in enumerate(classes):
+            precision = hits[i] / pred[i] if pred[i] else None
+            recall = hits[i] / true[i] if true[i] else None
+            f1 = 2 * precision * recall / (precision + recall) if precision and recall else None
+            per_class[name] = {'support': int(true[i]), 'predicted': int(pred[i]),
+                               'precision': None if precision is None else float(precision),
+                               'recall': None if recall is None else float(recall),
+                               'f1': None if f1 is None else float(f1)}
+        overall = self._curve(self.calibration['all'][0], self.brier['all'][0])
+        return {
+            'windows': self.count,
+            'accuracy': overall['accuracy'],
+            'brier': overall['brier'],
+            'ece': overall['ece'],
+            'classes': per_class,
+            'confusion': {'labels': list(classes), 'matrix': self.confusion.tolist()},
+            'calibration': overall['curve'],
+            'by_month': {str(m + 1): self._curve(self.calibration['month'][m], self.brier['month'][m])
+                         for m in range(12)},
+            'by_hour': {str(h): self._curve(self.calibration['hour'][h], self.brier['hour'][h]) for h in range(24)},
+        }
+
+
+def window_view(series, window):
+    """Zero-copy (n - window + 1, window, F) view of every window of a (n, F) series."""
+    return sliding_window_view(series, (window, series.shape[1]))[:, 0]
+
+
+def score(bundle, windows, time_inputs, ends, labels, months, hours, batch_size, stats):
+    """Score windows ending at ``ends`` (indices into the series) in batches into stats."""
+    offset = bundle.window - 1  # windows[i] ends at series row i + offset
+    for i in range(0, len(ends), batch_size):
+        batch = ends[i:i + batch_size]
+        probs = bundle.predict(windows[batch - offset], time_inputs[i:i + batch_size], batch_size=len(batch))
+        stats.update(probs, labels[i:i + batch_size], months[i:i + batch_size], hours[i:i + batch_size])
+    return stats
+
+
+# -- process pool --------------------------------------------------------------
+
+_worker = {}
+
+
+def _init_worker(models_dir, city, version, shm_name, shape, threads):
+    import tensorflow as tf
+
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+    bundle = load_bundle(artifact_paths(models_dir, city))
+    if bundle.version != version:
+        raise RuntimeError(f'{city} artifacts changed during the backtest ({version} -> {bundle.version})')
+    shm = SharedMemory(name=shm_name)
+    series = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+    _worker.update(bundle=bundle, shm=shm, windows=window_view(series, bundle.window))
+
+
+def _score_chunk(args):
+    ends, time_inputs, labels, months, hours, batch_size, bins = args
+    bundle = _worker['bundle']
+    stats = BacktestStats(len(bundle.classes), bins)
+    return score(bundle, _worker['windows'], time_inputs, ends, labels, months, hours, batch_size, stats)
+
+
+# -- CLI -----------------------------------------------------------------------
+
+
+def backtest(bundle, store, models_dir, horizon=1, stride=1, start=None, end=None, batch_size=1024, workers=0,
+             bins=10, max_filled_fraction=0.25, log=print):
+    """Score every usable history window of store with bundle; returns the report dict."""
+    hours, values, quality = load_series(store, bundle.seq_features)
+    ends, labels = select_windows(values, quality, bundle.window, horizon, stride, max_filled_fraction,
+                                  bundle.seq_features)
+    if start is not None:
+        keep = hours[ends] >= np.datetime64(start, 'h')
+        ends, labels = ends[keep], labels[keep]
+    if end is not None:
+        keep = hours[ends] < np.datetime64(end, 'h')
+        ends, labels = ends[keep], labels[keep]
+    missing = [c for c in CLASSES if c not in bundle.classes]
+    if missing:
+        raise ValueError(f'{store.city} model has no class for {missing}')
+    labels = np.array([bundle.classes.index(c) for c in CLASSES])[labels]
+    if len(ends) == 0:
+        raise ValueError(f'no usable {bundle.window}-hour windows in the history of {store.city}')
+    log(f'{store.city}: scoring {len(ends)} windows with model {bundle.version}')
+
+    mean, scale = bundle.scaler.mean_, bundle.scaler.scale_
+    series = ((values - mean) / scale).astype(np.float32)
+    target = hours[ends] + horizon * HOUR
+    months = (target.astype('datetime64[M]').astype(np.int64) % 12 + 1)
+    hour_of_day = ((target - target.astype('datetime64[D]')) // HOUR).astype(np.int64)
+    time_inputs = bundle.scale_time(time_feature_array(hours[ends], bundle.time_features))
+
+    started = time.perf_counter()
+    stats = BacktestStats(len(bundle.classes), bins)
+    if workers > 1:
+        shm = SharedMemory(create=True, size=series.nbytes)
+        try:
+            np.ndarray(series.shape, dtype=np.float32, buffer=shm.buf)[:] = series
+            threads = max(1, (os.cpu_count() or 1) // workers)
+            chunks = np.array_split(np.arange(len(ends)), workers * 4)
+            tasks = [(ends[c], time_inputs[c], labels[c], months[c], hour_of_day[c], batch_size, bins)
+                     for c in chunks if len(c)]
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                                     initializer=_init_worker,
+                                     initargs=(models_dir, store.city, bundle.version, shm.name, series.shape,
+                                               threads)) as pool:
+                for partial in pool.map(_score_chunk, tasks):
+                    stats.merge(partial)
+        finally:
+            shm.close()
+            shm.unlink()
+    else:
+        windows = window_view(series, bundle.window)
+        score(bundle, windows, time_inputs, ends, labels, months, hour_of_day, batch_size, stats)
+    elapsed = time.perf_counter() - started
+
+    report = stats.report(bundle.classes)
+    report.update({
+        'city': store.city,
+        'model_version': bundle.version,
+        'horizon_hours': horizon,
+        'first_window_end': str(hours[ends[0]]),
+        'last_window_end': str(hours[ends[-1]]),
+        'seconds': round(elapsed, 2),
+        'windows_per_second': round(len(ends) / elapsed, 1) if elapsed else None,
+    })
+    return report
+
+
+def print_report(report, log=print):
+    log(f"{report['city']} model {report['model_version']}: {report['windows']} windows "
+        f"({report['first_window_end']} .. {report['last_window_end']}) in {report['seconds']}s")
+    log(f"accuracy {report['accuracy']:.4f}  brier {report['brier']:.4f}  ece {report['ece']:.4f}")
+    log(f"{'class':<12}{'support':>9}{'precision':>11}{'recall':>8}{'f1':>8}")
+    fmt = lambda v: f'{v:.3f}' if v is not None else '-'
+    for name, row in report['classes'].items():
+        log(f"{name:<12}{row['support']:>9}{fmt(row['precision']):>11}{fmt(row['recall']):>8}{fmt(row['f1']):>8}")
+    log('by month (accuracy / ece): ' + '  '.join(
+        f"{m}:{fmt(r['accuracy'])}/{fmt(r['ece'])}" for m, r in report['by_month'].items() if r['windows']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python backtest.py', description=__doc__.split('\n')[0])
+    parser.add_argument('--city', required=True)
+    parser.add_argument('--models', default=os.environ.get('MODELS_DIR', DEFAULT_OUT), help='artifact directory')
+    parser.add_argument('--history', default=os.environ.get('HISTORY_DIR', DEFAULT_HISTORY), help='history store root')
+    parser.add_argument('--horizon', type=int, default=1, help='hours after the window end that are labelled')
+    parser.add_argument('--stride', type=int, default=1, help='hours between consecutive window ends')
+    parser.add_argument('--start', help='first window end (YYYY-MM-DD[THH])')
+    parser.add_argument('--end', help='window ends before this time (YYYY-MM-DD[THH])')
+    parser.add_argument('--batch-size', type=int, default=1024)
+    parser.add_argument('--workers', type=int, default=0, help='scoring processes (0 = score in this process)')
+    parser.add_argument('--bins', type=int, default=10, help='confidence bins of the calibration curves')
+    parser.add_argument('--max-filled-fraction', type=float, default=0.25,
+                        help='share of interpolated/climatology hours allowed in a window')
+    parser.add_argument('--output', help='write the full report as JSON here')
+    args = parser.parse_args(argv)
+
+    bundle = load_bundle(artifact_paths(args.models, args.city))
+    try:
+        report = backtest(bundle, HistoryStore(args.history, args.city), args.models, args.horizon, args.stride,
+                          args.start, args.end, args.batch_size, args.workers, args.bins, args.max_filled_fraction)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,15 @@
+"""Microbenchmarks for every stage of the forecast path.
+
+Run from the backend directory:
+
+    python -m benchmarks --output bench_results.json
+    python -m benchmarks --save-baseline          # record benchmarks/baseline.json
+    python -m benchmarks --threshold 0.25         # fail if any stage is >25% slower
+    python -m benchmarks --import-time            # where process start-up time goes
+"""
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
@@ -0,0 +1,74 @@
+import argparse
+import os
+import sys
+
+from . import importtime, runner, stages
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Forecast pipeline microbenchmarks')
+    parser.add_argument('-k', '--select', action='append', help='only run stages whose name contains this (repeatable)')
+    parser.add_argument('--list', action='store_true', help='list stage names and exit')
+    parser.add_argument('--output', default='bench_results.json', help='where to write the JSON results')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline JSON to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='write the results to --baseline instead of comparing')
+    parser.add_argument('--threshold', type=float, default=float(os.environ.get('BENCH_REGRESSION_THRESHOLD', 0.2)),
+                        help='allowed slowdown as a fraction of the baseline median (default 0.2 = 20%%)')
+    parser.add_argument('--stage-threshold', action='append', default=[], metavar='NAME=FRACTION',
+                        help='per-stage threshold override (repeatable)')
+    parser.add_argument('--import-time', nargs='*', metavar='MODULE',
+                        help='print an import-time breakdown of the API modules (default: main, simple_main) and exit')
+    parser.add_argument('--top', type=int, default=15, help='packages shown per --import-time report')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.import_time is not None:
+        for module in args.import_time or importtime.DEFAULT_TARGETS:
+            importtime.print_report(importtime.measure(module, importtime.DEFAULT_TARGETS.get(module)), args.top)
+        return 0
+
+    benches = stages.all_benchmarks()
+    if args.list:
+        for bench in benches:
+            print(bench.name)
+        return 0
+
+    current = runner.run_all(benches, selected=args.select)
+    runner.write_json(args.output, current)
+    print(f"Results written to {args.output}")
+
+    if args.save_baseline:
+        runner.write_json(args.baseline, current)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one.")
+        return 0
+
+    overrides = {}
+    for item in args.stage_threshold:
+        name, _, value = item.partition('=')
+        overrides[name] = float(value)
+
+    rows = runner.compare(current, runner.load_json(args.baseline), args.threshold, overrides)
+    failed = [row for row in rows if row['regressed']]
+    for row in rows:
+        flag = 'REGRESSED' if row['regressed'] else 'ok'
+        print(f"{row['name']:<28} {row['baseline_us']:>12.1f} -> {row['current_us']:>12.1f} us"
+              f"  x{row['ratio']:.2f} (limit x{1 + row['threshold']:.2f})  {flag}")
+    current['comparison'] = rows
+    runner.write_json(args.output, current)
+
+    if failed:
+        print(f"{len(failed)} stage(s) regressed beyond the threshold")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
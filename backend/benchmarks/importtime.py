@@ -0,0 +1,66 @@
+"""Import-time breakdown of the API modules, from ``python -X importtime``.
+
+Each module is imported in a fresh interpreter (so nothing is already in
+sys.modules) and the per-module self times are summed by top-level package,
+which shows which dependency dominates process start-up.
+"""
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Module -> extra environment it is imported with.
+DEFAULT_TARGETS = {
+    'main': {'FAST_START': '1'},
+    'simple_main': {},
+}
+
+
+def parse_importtime(stderr):
+    """[(module, self_us, cumulative_us)] from -X importtime output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # header line
+        rows.append((parts[2].strip(), int(parts[0]), int(parts[1])))
+    return rows
+
+
+def measure(module, env=None):
+    """Import module in a fresh interpreter; returns wall time and the per-package breakdown."""
+    proc_env = dict(os.environ, **(env or {}))
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                          cwd=BACKEND_DIR, env=proc_env, capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - started) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError(f'import {module} failed:\n{proc.stderr[-2000:]}')
+
+    rows = parse_importtime(proc.stderr)
+    packages = defaultdict(int)
+    for name, self_us, _ in rows:
+        packages[name.split('.')[0]] += self_us
+    return {
+        'module': module,
+        'env': env or {},
+        'wall_ms': wall_ms,
+        'import_ms': sum(self_us for _, self_us, _ in rows) / 1000,
+        'modules': len(rows),
+        'packages': sorted(({'package': p, 'self_ms': us / 1000} for p, us in packages.items()),
+                           key=lambda r: r['self_ms'], reverse=True),
+    }
+
+
+def print_report(result, top=15):
+    env = ' '.join(f'{k}={v}' for k, v in result['env'].items())
+    print(f"import {result['module']} {env}".rstrip())
+    print(f"  wall {result['wall_ms']:.0f} ms, imports {result['import_ms']:.0f} ms over {result['modules']} modules")
+    for row in result['packages'][:top]:
+        share = row['self_ms'] / result['import_ms'] * 100 if result['import_ms'] else 0
+        print(f"  {row['package']:<28} {row['self_ms']:>9.1f} ms  {share:5.1f}%")
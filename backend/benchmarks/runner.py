@@ -0,0 +1,99 @@
+import json
+import platform
+import statistics
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+
+@dataclass
+class Benchmark:
+    name: str
+    setup: Callable[[], tuple]  # returns the positional args passed to func
+    func: Callable
+    number: int = 100  # calls per timed round
+    repeat: int = 7  # timed rounds
+    items: int = 1  # items processed per call (batch size), for per-item timings
+
+
+def run_benchmark(bench, warmup=3):
+    """Time bench.func and return a summary in microseconds per call."""
+    args = bench.setup()
+    for _ in range(warmup):
+        bench.func(*args)
+
+    rounds = []
+    for _ in range(bench.repeat):
+        start = time.perf_counter_ns()
+        for _ in range(bench.number):
+            bench.func(*args)
+        rounds.append((time.perf_counter_ns() - start) / bench.number / 1000)
+
+    rounds.sort()
+    median = statistics.median(rounds)
+    return {
+        'name': bench.name,
+        'number': bench.number,
+        'repeat': bench.repeat,
+        'items': bench.items,
+        'min_us': rounds[0],
+        'median_us': median,
+        'mean_us': statistics.fmean(rounds),
+        'max_us': rounds[-1],
+        'stdev_us': statistics.stdev(rounds) if len(rounds) > 1 else 0.0,
+        'per_item_us': median / bench.items,
+    }
+
+
+def run_all(benchmarks, selected=None, log=print):
+    results = {}
+    for bench in benchmarks:
+        if selected and not any(s in bench.name for s in selected):
+            continue
+        res = run_benchmark(bench)
+        results[bench.name] = res
+        log(f"{bench.name:<28} median {res['median_us']:>12.1f} us"
+            f"  min {res['min_us']:>12.1f} us  per-item {res['per_item_us']:>10.1f} us")
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results,
+    }
+
+
+def compare(current, baseline, threshold, overrides: Optional[dict] = None):
+    """Compare median timings to a baseline.
+
+    A stage regresses when its median is more than ``threshold`` (a fraction,
+    0.2 == 20%) slower than the baseline median. ``overrides`` maps stage
+    names to per-stage thresholds. Stages missing from either side are skipped.
+    """
+    overrides = overrides or {}
+    rows = []
+    for name, res in current['results'].items():
+        base = baseline.get('results', {}).get(name)
+        if base is None:
+            continue
+        limit = overrides.get(name, threshold)
+        ratio = res['median_us'] / base['median_us'] if base['median_us'] else float('inf')
+        rows.append({
+            'name': name,
+            'baseline_us': base['median_us'],
+            'current_us': res['median_us'],
+            'ratio': ratio,
+            'threshold': limit,
+            'regressed': ratio > 1 + limit,
+        })
+    return rows
+
+
+def load_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_json(path, data):
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write('\n')
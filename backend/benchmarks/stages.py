@@ -0,0 +1,175 @@
+import numpy as np
+
+from .runner import Benchmark
+
+SAMPLE_DATETIME = '2025-07-04T15:00:00'
+INFERENCE_BATCH_SIZES = (1, 8, 32, 128)
+
+
+def _main():
+    # Imported lazily so `--list` and the heuristic stages don't pay for TensorFlow.
+    import main
+    return main
+
+
+def _bundle():
+    main = _main()
+    return main.registry.get(main.DEFAULT_CITY)
+
+
+def _target():
+    main = _main()
+    return main, _bundle(), main.parse_target_time(SAMPLE_DATETIME)
+
+
+def _raw_inputs():
+    main, bundle, target_time = _target()
+    return main.synthesize_window(bundle, target_time), main.build_time_features(bundle, target_time)
+
+
+def _scaled_inputs():
+    main, bundle, _ = _target()
+    return main.scale_inputs(bundle, *_raw_inputs())
+
+
+def _sample_response():
+    main, bundle, target_time = _target()
+    yhat = np.array([0.1, 0.2, 0.05, 0.05, 0.5, 0.1], dtype=np.float32)
+    pred, probs = main.decode_probabilities(bundle, yhat)
+    return {'time': str(target_time), 'prediction': pred, 'probabilities': probs}
+
+
+def _inference(batch_size):
+    def setup():
+        seq_input, time_input = _scaled_inputs()
+        return (_main(), _bundle(), np.repeat(seq_input, batch_size, axis=0), np.repeat(time_input, batch_size, axis=0))
+
+    return Benchmark(
+        name=f'main.inference_b{batch_size}',
+        setup=setup,
+        func=lambda main, bundle, seq, tim: main.predict_batch(bundle, seq, tim),
+        number=5,
+        repeat=5,
+        items=batch_size,
+    )
+
+
+def _serialize(payload):
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    return JSONResponse(content=jsonable_encoder(payload)).body
+
+
+def main_benchmarks():
+    benches = [
+        Benchmark(
+            name='main.parse_datetime',
+            setup=lambda: (_main(), SAMPLE_DATETIME),
+            func=lambda main, value: main.parse_target_time(value),
+            number=1000,
+        ),
+        Benchmark(
+            name='main.window_synthesis',
+            setup=_target,
+            func=lambda main, bundle, t: main.synthesize_window(bundle, t),
+            number=5,
+        ),
+        Benchmark(
+            name='main.window_synthesis_b128',
+            setup=lambda: (_main(), _bundle(), [_target()[2]] * 128),
+            func=lambda main, bundle, times: main.synthesize_windows(times, bundle.seq_features, bundle.window),
+            number=2,
+            items=128,
+        ),
+        Benchmark(
+            name='main.time_features',
+            setup=_target,
+            func=lambda main, bundle, t: main.build_time_features(bundle, t),
+            number=1000,
+        ),
+        Benchmark(
+            name='main.scaling',
+            setup=lambda: (_main(), _bundle(), *_raw_inputs()),
+            func=lambda main, bundle, seq_raw, time_raw: main.scale_inputs(bundle, seq_raw, time_raw),
+            number=200,
+        ),
+    ]
+    benches += [_inference(b) for b in INFERENCE_BATCH_SIZES]
+    benches += [
+        Benchmark(
+            name='main.label_decoding',
+            setup=lambda: (_main(), _bundle(), np.array([0.1, 0.2, 0.05, 0.05, 0.5, 0.1], dtype=np.float32)),
+            func=lambda main, bundle, yhat: main.decode_probabilities(bundle, yhat),
+            number=1000,
+        ),
+        Benchmark(
+            name='main.json_serialization',
+            setup=lambda: (_sample_response(),),
+            func=_serialize,
+            number=1000,
+        ),
+    ]
+    return benches
+
+
+def simple_benchmarks():
+    def setup():
+        import simple_main
+        return simple_main, simple_main.parse_datetime(SAMPLE_DATETIME)
+
+    return [
+        Benchmark(
+            name='simple_main.heuristic',
+            setup=setup,
+            func=lambda simple_main, t: simple_main.heuristic_probabilities(t),
+            number=1000,
+        ),
+    ]
+
+
+def drift_benchmarks():
+    """Per-request drift tracking: one seq_features row and one time_features row, as main.single_forecast adds."""
+    def setup():
+        from drift import DriftMonitor
+        from sklearn.preprocessing import StandardScaler
+
+        rng = np.random.default_rng(0)
+        bundle = _DriftBundle(StandardScaler().fit(rng.normal(size=(256, 9))),
+                              StandardScaler().fit(rng.normal(size=(256, 6))))
+        monitor = DriftMonitor()
+        seq_row, time_row = rng.normal(size=9), rng.normal(size=6)
+        for _ in range(1000):
+            monitor.update(bundle, seq_row, time_row)
+        return monitor, bundle, seq_row, time_row
+
+    return [
+        Benchmark(
+            name='drift.update',
+            setup=setup,
+            func=lambda monitor, bundle, seq_row, time_row: monitor.update(bundle, seq_row, time_row),
+            number=1000,
+        ),
+        Benchmark(
+            name='drift.stats',
+            setup=setup,
+            func=lambda monitor, *_: monitor.stats(),
+            number=20,
+        ),
+    ]
+
+
+class _DriftBundle:
+    """The ModelBundle attributes DriftMonitor reads, without loading a model."""
+    city = 'bench'
+    version = 'bench'
+    seq_features = ['temp_c', 'pressure_hpa', 'rain_mmhr', 'humidity', 'wind_ms',
+                    'hour_sin', 'hour_cos', 'doy_sin', 'doy_cos']
+    time_features = ['hour_sin', 'hour_cos', 'doy_sin', 'doy_cos', 'month', 'dayofweek']
+
+    def __init__(self, scaler, time_scaler):
+        self.scaler = scaler
+        self.time_scaler = time_scaler
+
+
+def all_benchmarks():
+    return main_benchmarks() + simple_benchmarks() + drift_benchmarks()
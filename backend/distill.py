@@ -0,0 +1,300 @@
+"""Distil a served model into smaller, short-window students.
+
+    python distill.py --city nyc [--models models] [--out models/students] [--windows 24 48 168]
+
+The teacher's per-request cost is set by its window (720 hourly steps through
+an LSTM(256)). A student sees only the last ``L`` hours of the same windows,
+through a causal Conv1D and a small GRU, and is trained to reproduce the
+teacher's class probabilities (optionally softened by ``--temperature``)
+rather than the hard labels.
+
+Training windows come from the stored history (``--source history``: every
+usable window, selected as in train.py, thinned to ``--max-windows``) or from
+seeded synthetic windows (``--source synthetic``, see synthetic.py). The
+teacher scores them once; each student length trains on the last L hours of
+the same windows. Validation is chronological for history windows.
+
+For every length the report (printed and ``<out>/<city>_distill_report.json``)
+has the student's agreement with the teacher's top class, the mean KL
+divergence from the teacher, accuracy against the observed labels (history
+only), parameter count and single-request latency next to the teacher's.
+Each student is written to ``<out>/w<L>/`` in the layout ModelRegistry loads
+(the teacher's scalers and classes, plus a golden set from history), so
+pointing MODELS_DIR at it, or copying its files into models/, serves it.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from backtest import window_view
+from history_store import HistoryStore
+from labels import CLASSES
+from model_registry import artifact_paths, load_bundle
+from synthetic import synthesize_windows, time_feature_rows
+from train import (DEFAULT_HISTORY, DEFAULT_OUT, load_series, select_windows, split_windows, time_feature_array,
+                   write_artifacts, write_golden)
+
+DEFAULT_STUDENTS = os.path.join(DEFAULT_OUT, 'students')
+
+
+# -- teacher targets -------------------------------------------------------------
+
+
+def soften(probs, temperature):
+    """Teacher probabilities at a softmax temperature (1 leaves them unchanged)."""
+    if temperature == 1:
+        return probs.astype(np.float32)
+    logits = np.log(np.clip(probs, 1e-8, 1.0)) / temperature
+    logits -= logits.max(axis=1, keepdims=True)
+    soft = np.exp(logits)
+    return (soft / soft.sum(axis=1, keepdims=True)).astype(np.float32)
+
+
+def history_windows(teacher, store, horizon=1, stride=1, max_windows=200000, max_filled_fraction=0.25,
+                    batch_size=512, log=print):
+    """(series, ends, time_raw, teacher probs, label codes, extras) over the stored history.
+
+    series is the scaled float32 (hours, F) history; ends index its rows. extras carries
+    what write_golden needs.
+    """
+    hours, values, quality = load_series(store, teacher.seq_features)
+    ends, labels = select_windows(values, quality, teacher.window, horizon, stride, max_filled_fraction,
+                                  teacher.seq_features)
+    if len(ends) > max_windows:
+        pick = np.unique(np.linspace(0, len(ends) - 1, max_windows).astype(np.int64))
+        ends, labels = ends[pick], labels[pick]
+    if len(ends) == 0:
+        raise ValueError(f'no usable {teacher.window}-hour windows in the history of {store.city}')
+    series = ((values - teacher.scaler.mean_) / teacher.scaler.scale_).astype(np.float32)
+    time_raw = time_feature_array(hours[ends], teacher.time_features)
+    time_inputs = teacher.scale_time(time_raw)
+    windows = window_view(series, teacher.window)
+    log(f'{store.city}: teacher scoring {len(ends)} history windows')
+    probs = np.concatenate([teacher.predict(windows[ends[i:i + batch_size] - teacher.window + 1],
+                                            time_inputs[i:i + batch_size], batch_size=batch_size)
+                            for i in range(0, len(ends), batch_size)])
+    return series, ends, time_raw, probs, labels, {'values': values, 'hours': hours}
+
+
+def synthetic_windows(teacher, max_steps, samples=20000, seed=0, batch_size=512, log=print):
+    """Same as history_windows for seeded synthetic windows spread over a year (no labels).
+
+    Only the last max_steps hours of each window are kept, laid end to end as one series.
+    """
+    rng = np.random.default_rng(seed)
+    start = datetime(2024, 1, 1)
+    offsets = rng.integers(0, 8784, samples)
+    times = [start + timedelta(hours=int(h)) for h in offsets]
+    time_raw = time_feature_rows(times, teacher.time_features)
+    series = np.empty((samples, max_steps, len(teacher.seq_features)), dtype=np.float32)
+    probs = []
+    log(f'{teacher.city}: teacher scoring {samples} synthetic windows')
+    for i in range(0, samples, batch_size):
+        raw = synthesize_windows(times[i:i + batch_size], teacher.seq_features, teacher.window, rng=rng)
+        seq, tim = teacher.scale_batch(raw, time_raw[i:i + batch_size])
+        probs.append(teacher.predict(seq, tim, batch_size=batch_size))
+        series[i:i + batch_size] = seq[:, -max_steps:]
+    ends = np.arange(samples) * max_steps + max_steps - 1
+    return series.reshape(-1, series.shape[-1]), ends, time_raw, np.concatenate(probs), None, None
+
+
+# -- student ---------------------------------------------------------------------
+
+
+def make_dataset(series, ends, time_inputs, targets, window, batch_size, shuffle=False, seed=0):
+    """tf.data of ((seq (B, window, F), time (B, T)), target probabilities); time and targets align with ends."""
+    import tensorflow as tf
+
+    series = tf.constant(series, dtype=tf.float32)
+    offsets = tf.range(-window + 1, 1, dtype=tf.int64)
+
+    def to_batch(end, tim, target):
+        return (tf.gather(series, end[:, None] + offsets[None, :]), tim), target
+
+    ds = tf.data.Dataset.from_tensor_slices((ends.astype(np.int64), time_inputs.astype(np.float32),
+                                             targets.astype(np.float32)))
+    if shuffle:
+        ds = ds.shuffle(len(ends), seed=seed, reshuffle_each_iteration=True)
+    return ds.batch(batch_size).map(to_batch, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+
+
+def build_student(window, n_seq, n_time, n_classes, units=64, conv_filters=32, learning_rate=2e-3):
+    """Causal Conv1D (optional) + GRU over the window, Dense(32) over the time features."""
+    from tensorflow import keras
+    from tensorflow.keras import layers
+
+    seq_input = keras.Input(shape=(window, n_seq), name='seq_input')
+    time_input = keras.Input(shape=(n_time,), name='time_input')
+    x = seq_input
+    if conv_filters:
+        x = layers.Conv1D(conv_filters, 5, padding='causal', activation='relu')(x)
+    x = layers.Dropout(0.2)(layers.GRU(units)(x))
+    t = layers.Dense(32, activation='relu')(time_input)
+    h = layers.Dropout(0.2)(layers.Dense(64, activation='relu')(layers.Concatenate()([x, t])))
+    output = layers.Dense(n_classes, activation='softmax')(h)
+    model = keras.Model([seq_input, time_input], output)
+    # Cross-entropy against soft targets = KL divergence from the teacher plus a constant.
+    model.compile(optimizer=keras.optimizers.Adam(learning_rate), loss='categorical_crossentropy')
+    return model
+
+
+def request_latency_ms(model, runs=30):
+    """Median milliseconds of one single-window forward pass.
+
+    A traced call rather than predict(), whose fixed per-call overhead is the same for
+    every model and would hide the difference the window makes.
+    """
+    import tensorflow as tf
+
+    forward = tf.function(lambda inputs: model(inputs, training=False))
+    inputs = [tf.zeros((1,) + tuple(i.shape[1:])) for i in model.inputs]
+    forward(inputs)
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        forward(inputs)
+        samples.append((time.perf_counter() - started) * 1000)
+    return float(np.median(samples))
+
+
+def compare(student_probs, teacher_probs, labels=None):
+    """Agreement with the teacher's top class, mean KL(teacher || student) and accuracy against labels."""
+    p = np.clip(teacher_probs, 1e-8, 1.0)
+    q = np.clip(student_probs, 1e-8, 1.0)
+    result = {
+        'agreement': float(np.mean(student_probs.argmax(axis=1) == teacher_probs.argmax(axis=1))),
+        'kl': float(np.mean(np.sum(p * np.log(p / q), axis=1))),
+    }
+    if labels is not None:
+        result['accuracy'] = float(np.mean(student_probs.argmax(axis=1) == labels))
+        result['teacher_accuracy'] = float(np.mean(teacher_probs.argmax(axis=1) == labels))
+    return result
+
+
+# -- CLI -------------------------------------------------------------------------
+
+
+def distill(teacher, out_dir, windows=(24, 48, 168), source='history', store=None, samples=20000, units=64,
+            conv_filters=32, epochs=10, batch_size=128, val_fraction=0.1, patience=2, learning_rate=2e-3,
+            temperature=1.0, max_windows=200000, golden=256, seed=0, log=print):
+    """Train one student per window length; returns the report dict (also written to out_dir)."""
+    import tensorflow as tf
+
+    windows = sorted(set(windows))
+    if windows[-1] > teacher.window:
+        raise ValueError(f'student windows must not exceed the teacher window ({teacher.window})')
+    if teacher.classes != CLASSES and source == 'history':
+        raise ValueError(f'teacher classes {teacher.classes} do not match labels.CLASSES')
+    if source == 'history':
+        series, ends, time_raw, probs, labels, extras = history_windows(teacher, store, max_windows=max_windows,
+                                                                        log=log)
+        (_, train_idx), (_, val_idx) = split_windows(ends, np.arange(len(ends)), val_fraction, teacher.window)
+    else:
+        series, ends, time_raw, probs, labels, extras = synthetic_windows(teacher, windows[-1], samples, seed,
+                                                                          log=log)
+        cut = int(len(ends) * (1 - val_fraction))
+        train_idx, val_idx = np.arange(cut), np.arange(cut, len(ends))
+    if len(val_idx) == 0:
+        raise ValueError('no validation windows; raise --val-fraction or provide more data')
+    time_inputs = teacher.scale_time(time_raw)
+    targets = soften(probs, temperature)
+    n_seq, n_time, n_classes = len(teacher.seq_features), len(teacher.time_features), len(teacher.classes)
+    val_labels = labels[val_idx] if labels is not None else None
+
+    teacher_ms = request_latency_ms(teacher.model)
+    report = {'city': teacher.city, 'teacher_version': teacher.version, 'teacher_window': teacher.window,
+              'teacher_params': int(teacher.model.count_params()), 'teacher_latency_ms': round(teacher_ms, 2),
+              'source': source, 'train_windows': int(len(train_idx)), 'val_windows': int(len(val_idx)),
+              'temperature': temperature, 'students': []}
+    for window in windows:
+        tf.keras.utils.set_random_seed(seed)
+        model = build_student(window, n_seq, n_time, n_classes, units, conv_filters, learning_rate)
+        train_ds = make_dataset(series, ends[train_idx], time_inputs[train_idx], targets[train_idx], window,
+                                batch_size, shuffle=True, seed=seed)
+        val_ds = make_dataset(series, ends[val_idx], time_inputs[val_idx], targets[val_idx], window, batch_size)
+        callbacks = [tf.keras.callbacks.EarlyStopping(patience=patience, restore_best_weights=True)] \
+            if patience else []
+        started = time.perf_counter()
+        # train_ds is shuffled by tf.data already.
+        history = model.fit(train_ds, validation_data=val_ds, epochs=epochs, callbacks=callbacks, verbose=2,
+                            shuffle=False)
+        student_probs = model.predict(val_ds.map(lambda x, y: (x,)), verbose=0)
+        row = {'window': window, 'params': int(model.count_params()), 'epochs': len(history.history['loss']),
+               'train_seconds': round(time.perf_counter() - started, 1)}
+        row.update(compare(student_probs, probs[val_idx], val_labels))
+        ms = request_latency_ms(model)
+        row.update({'latency_ms': round(ms, 2), 'speedup': round(teacher_ms / ms, 2) if ms else None})
+
+        student_dir = os.path.join(out_dir, f'w{window}')
+        write_artifacts(student_dir, teacher.city, model, teacher.scaler, teacher.time_scaler, teacher.seq_features,
+                        teacher.time_features, teacher.classes, teacher.drift_reference)
+        row['artifacts'] = student_dir
+        if extras is not None:
+            write_golden(student_dir, teacher.city, extras['values'], extras['hours'], ends[val_idx], val_labels,
+                         window, golden, teacher.time_features)
+        report['students'].append(row)
+        log(f"w{window}: agreement {row['agreement']:.3f}, kl {row['kl']:.4f}, "
+            f"{row['latency_ms']} ms vs teacher {report['teacher_latency_ms']} ms")
+
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, f'{teacher.city}_distill_report.json'), 'w') as f:
+        json.dump(report, f, indent=1)
+    return report
+
+
+def print_report(report, log=print):
+    log(f"teacher {report['teacher_version']}: window {report['teacher_window']}, "
+        f"{report['teacher_params']} params, {report['teacher_latency_ms']} ms/request")
+    has_labels = 'accuracy' in (report['students'][0] if report['students'] else {})
+    log(f"{'window':>7}{'params':>9}{'agree':>8}{'kl':>8}" + (f"{'acc':>7}" if has_labels else '') +
+        f"{'ms':>8}{'speedup':>9}")
+    for row in report['students']:
+        log(f"{row['window']:>7}{row['params']:>9}{row['agreement']:>8.3f}{row['kl']:>8.4f}" +
+            (f"{row['accuracy']:>7.3f}" if has_labels else '') + f"{row['latency_ms']:>8}{row['speedup']:>9}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python distill.py', description=__doc__.split('\n')[0])
+    parser.add_argument('--city', required=True)
+    parser.add_argument('--models', default=os.environ.get('MODELS_DIR', DEFAULT_OUT), help='teacher artifact directory')
+    parser.add_argument('--out', default=DEFAULT_STUDENTS, help='student artifact directories go under here')
+    parser.add_argument('--windows', type=int, nargs='+', default=[24, 48, 168], help='student window lengths (hours)')
+    parser.add_argument('--source', choices=('history', 'synthetic'), default='history')
+    parser.add_argument('--history', default=os.environ.get('HISTORY_DIR', DEFAULT_HISTORY), help='history store root')
+    parser.add_argument('--samples', type=int, default=20000, help='synthetic windows')
+    parser.add_argument('--max-windows', type=int, default=200000, help='history windows (evenly thinned)')
+    parser.add_argument('--units', type=int, default=64, help='GRU units')
+    parser.add_argument('--conv-filters', type=int, default=32, help='causal Conv1D filters (0 disables)')
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=128)
+    parser.add_argument('--val-fraction', type=float, default=0.1)
+    parser.add_argument('--patience', type=int, default=2, help='early-stopping patience (0 disables)')
+    parser.add_argument('--learning-rate', type=float, default=2e-3)
+    parser.add_argument('--temperature', type=float, default=1.0, help='softens the teacher targets when > 1')
+    parser.add_argument('--golden', type=int, default=256, help='held-out windows saved for reload validation')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    teacher = load_bundle(artifact_paths(args.models, args.city))
+    try:
+        report = distill(teacher, args.out, args.windows, args.source, HistoryStore(args.history, args.city),
+                         args.samples, args.units, args.conv_filters, args.epochs, args.batch_size, args.val_fraction,
+                         args.patience, args.learning_rate, args.temperature, args.max_windows, args.golden,
+                         args.seed)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    print_report(report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,204 @@
+"""Online drift monitor for the model's input features.
+
+The scalers were fitted once, on the training data. Each request the model
+scores adds one row per input (the newest hour of the window and the time
+features) to a sliding time window, standardized with the bundle's scalers.
+Per feature the window keeps:
+
+* Welford running mean and variance of the standardized values, and
+* a histogram over fixed bins (EDGES, in standard deviations, plus two tails).
+
+Both live in ``buckets`` time buckets of ``window_seconds / buckets`` each. An
+update touches the current bucket only: O(features) numpy work, no per-bucket
+loop. Expired buckets are reset when their slot is reused. ``stats()`` merges
+the live buckets (Chan's parallel variance) and compares each histogram with a
+reference: PSI and KL(live || reference), plus the mean shift and
+standard-deviation ratio in training units. Features whose PSI is above
+``psi_alert`` (with at least ``min_samples`` rows) are listed as drifting.
+
+The reference is the training data's own histogram when train.py stored one
+with the scaler (``drift_reference``, see ``reference_histogram``). Older
+artifacts only have mean and scale, so the N(0, 1) bin probabilities stand in,
+except for SKEWED_CHANNELS: rain is zero most hours, and no normal curve
+describes it, so without a stored histogram it gets no PSI at all.
+
+Only weather seq_features raise alerts. The calendar channels (hour and day of
+year) and the time features follow the requested times, not the weather: over
+a short window they cover a narrow slice of the calendar, so their divergence
+from the whole-year training distribution is large by design. Their numbers
+are reported for information.
+"""
+import math
+import threading
+import time
+
+import numpy as np
+
+from history_store import CALENDAR_CHANNELS
+
+EDGES = np.linspace(-4.0, 4.0, 17)  # standard deviations; values outside fall in the two tail bins
+N_BINS = len(EDGES) + 1
+_cdf = np.array([0.5 * (1 + math.erf(e / math.sqrt(2))) for e in EDGES])
+REFERENCE = np.diff(np.concatenate([[0.0], _cdf, [1.0]]))  # N(0, 1) probability of each bin
+SMOOTHING = 1e-4  # added to empty bins so PSI/KL stay finite
+SKEWED_CHANNELS = ('rain_mmhr',)  # never compared with REFERENCE (see module docstring)
+
+
+def divergences(counts, reference=REFERENCE):
+    """(PSI, KL(live || reference)) per row of (features, N_BINS) histogram counts."""
+    live = counts + SMOOTHING
+    live = live / live.sum(axis=-1, keepdims=True)
+    log_ratio = np.log(live / reference)
+    return np.sum((live - reference) * log_ratio, axis=-1), np.sum(live * log_ratio, axis=-1)
+
+
+def reference_histogram(z, chunk=65536):
+    """Bin probabilities (features, N_BINS) of standardized rows (n, features); NaNs are skipped.
+
+    Features with no finite value get a NaN row, which ``DriftWindow`` treats as "no reference".
+    """
+    z = np.asarray(z)
+    counts = np.zeros((z.shape[1], N_BINS))
+    for start in range(0, len(z), chunk):
+        block = z[start:start + chunk]
+        for i in range(z.shape[1]):
+            column = block[:, i]
+            counts[i] += np.bincount(np.searchsorted(EDGES, column[np.isfinite(column)]), minlength=N_BINS)
+    total = counts.sum(axis=1, keepdims=True)
+    probs = (counts + SMOOTHING) / (total + SMOOTHING * N_BINS)
+    return np.where(total > 0, probs, np.nan)
+
+
+class DriftWindow:
+    """Sliding-window moments and histograms of standardized features (see module docstring).
+
+    ``reference`` is (features, N_BINS) bin probabilities, N(0, 1) for every feature when omitted;
+    a NaN row leaves that feature's PSI and KL unset.
+    """
+
+    def __init__(self, features, mean, scale, window_seconds=3600.0, buckets=12, reference=None):
+        self.features = list(features)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.reference = np.tile(REFERENCE, (len(self.features), 1)) if reference is None else \
+            np.asarray(reference, dtype=np.float64)
+        self.window_seconds = window_seconds
+        self.buckets = buckets
+        self.bucket_seconds = window_seconds / buckets
+        n = len(self.features)
+        self._slot_bucket = np.full(buckets, -1, dtype=np.int64)  # which time bucket each slot holds
+        self._count = np.zeros((buckets, n))
+        self._mean = np.zeros((buckets, n))
+        self._m2 = np.zeros((buckets, n))
+        self._hist = np.zeros((buckets, n, N_BINS), dtype=np.int64)
+        self._columns = np.arange(n)
+
+    def update(self, values, now=None):
+        """Add one raw row (len(features),); non-finite values are skipped per feature."""
+        bucket = int((time.time() if now is None else now) // self.bucket_seconds)
+        slot = bucket % self.buckets
+        if self._slot_bucket[slot] != bucket:
+            self._slot_bucket[slot] = bucket
+            self._count[slot] = self._mean[slot] = self._m2[slot] = 0
+            self._hist[slot] = 0
+        z = (np.asarray(values, dtype=np.float64) - self.mean) / self.scale
+        ok = np.isfinite(z)
+        count = self._count[slot]
+        count += ok
+        delta = np.where(ok, z - self._mean[slot], 0.0)
+        self._mean[slot] += np.divide(delta, count, out=np.zeros_like(delta), where=ok)
+        self._m2[slot] += delta * np.where(ok, z - self._mean[slot], 0.0)
+        bins = np.searchsorted(EDGES, z[ok])
+        self._hist[slot, self._columns[ok], bins] += 1
+
+    def merged(self, now=None):
+        """(count, mean, variance, histogram) of the standardized values over the live buckets."""
+        bucket = int((time.time() if now is None else now) // self.bucket_seconds)
+        live = self._slot_bucket > bucket - self.buckets
+        count, mean, m2 = self._count[live], self._mean[live], self._m2[live]
+        total = count.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            grand = np.where(total > 0, (count * mean).sum(axis=0) / total, np.nan)
+            # Chan et al.: M2 = sum(M2_i + n_i * (mean_i - grand)^2)
+            m2_total = (m2 + count * (mean - grand) ** 2).sum(axis=0)
+            variance = np.where(total > 1, m2_total / (total - 1), np.nan)
+        return total, grand, variance, self._hist[live].sum(axis=0)
+
+    def summary(self, now=None, min_samples=50):
+        total, z_mean, z_var, hist = self.merged(now)
+        with np.errstate(invalid='ignore'):
+            psi, kl = divergences(hist, self.reference)
+        out = {}
+        for i, name in enumerate(self.features):
+            n = int(total[i])
+            enough = n >= min_samples and np.isfinite(psi[i])
+            out[name] = {
+                'count': n,
+                'mean': None if n == 0 else float(z_mean[i] * self.scale[i] + self.mean[i]),
+                'training_mean': float(self.mean[i]),
+                'z_mean': None if n == 0 else float(z_mean[i]),
+                'std_ratio': None if n < 2 else float(np.sqrt(z_var[i])),
+                'psi': float(psi[i]) if enough else None,
+                'kl': float(kl[i]) if enough else None,
+            }
+        return out
+
+
+class DriftMonitor:
+    """One pair of DriftWindows (seq_features, time_features) per city, reset when the model version changes."""
+
+    def __init__(self, window_seconds=3600.0, buckets=12, psi_alert=0.25, min_samples=50):
+        self.window_seconds = window_seconds
+        self.buckets = buckets
+        self.psi_alert = psi_alert
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._cities = {}  # city -> (model version, reference source, seq DriftWindow, time DriftWindow)
+        self.updates = 0
+
+    def _windows(self, bundle):
+        entry = self._cities.get(bundle.city)
+        if entry is None or entry[0] != bundle.version:
+            reference = getattr(bundle, 'drift_reference', None)
+            if reference is None:
+                source = 'normal'
+                reference = np.tile(REFERENCE, (len(bundle.seq_features), 1))
+                reference[[name in SKEWED_CHANNELS for name in bundle.seq_features]] = np.nan
+            else:
+                source = 'training'
+            entry = self._cities[bundle.city] = (
+                bundle.version,
+                source,
+                DriftWindow(bundle.seq_features, bundle.scaler.mean_, bundle.scaler.scale_, self.window_seconds,
+                            self.buckets, reference),
+                DriftWindow(bundle.time_features, bundle.time_scaler.mean_, bundle.time_scaler.scale_,
+                            self.window_seconds, self.buckets),
+            )
+        return entry
+
+    def update(self, bundle, seq_row, time_row, now=None):
+        """Record the raw inputs of one request: the window's newest hour and the time features."""
+        with self._lock:
+            _, _, seq, tim = self._windows(bundle)
+            seq.update(seq_row, now)
+            tim.update(time_row, now)
+            self.updates += 1
+
+    def stats(self, now=None):
+        with self._lock:
+            cities = {city: (version, source, seq.summary(now, self.min_samples), tim.summary(now, self.min_samples))
+                      for city, (version, source, seq, tim) in self._cities.items()}
+        out = {'window_seconds': self.window_seconds, 'psi_alert': self.psi_alert, 'updates': self.updates,
+               'cities': {}}
+        for city, (version, source, seq, tim) in cities.items():
+            psis = {name: s['psi'] for name, s in seq.items()
+                    if s['psi'] is not None and name not in CALENDAR_CHANNELS}
+            out['cities'][city] = {
+                'model_version': version,
+                'reference': source,
+                'max_psi': max(psis.values()) if psis else None,
+                'drifting': sorted(name for name, psi in psis.items() if psi > self.psi_alert),
+                'seq_features': seq,
+                'time_features': tim,
+            }
+        return out
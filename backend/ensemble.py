@@ -0,0 +1,101 @@
+"""Monte Carlo ensemble forecasts over perturbed copies of the request's window.
+
+Every member starts from the base window the single forecast scores (see
+main.window_inputs: observations, stored history or the key-seeded synthetic
+window). Member 0 is the base window unchanged, so an ensemble always contains
+the single-draw answer. Member ``i > 0`` adds noise seeded by
+``key_seed("<key>#<i>")`` to the weather channels, at the per-hour scales of
+the synthetic generator (PERTURBATION; rain is scaled multiplicatively so dry
+hours stay dry), which keeps an ensemble reproducible for a given key and
+base window.
+
+Fixed mode scores all K members in one batched forward pass. Adaptive mode
+draws members in rounds that double in size (one forward pass each) and
+stops once the standard error of every class's mean probability is below a
+tolerance, so confident forecasts use few members and uncertain ones use up
+to K.
+"""
+import numpy as np
+
+from forecast_keys import key_seed
+from synthetic import time_feature_rows
+
+PERCENTILES = (5, 50, 95)
+# Standard deviation of the additive per-hour noise of each member; rain_mmhr is a log-scale factor.
+PERTURBATION = {'temp_c': 0.8, 'pressure_hpa': 2.0, 'humidity': 5.0, 'wind_ms': 1.0, 'rain_mmhr': 0.3}
+
+
+def member_seeds(key, start, stop):
+    return [key_seed(key if i == 0 else f'{key}#{i}') for i in range(start, stop)]
+
+
+def perturb_windows(base, seq_features, key, start, stop):
+    """(stop - start, steps, features) copies of the raw base window, perturbed per member (member 0 is not)."""
+    windows = np.repeat(np.asarray(base, dtype=np.float64)[None], stop - start, axis=0)
+    for row, seed in enumerate(member_seeds(key, start, stop)):
+        if start + row == 0:
+            continue
+        rng = np.random.default_rng(seed)
+        for name, scale in PERTURBATION.items():
+            if name not in seq_features:
+                continue
+            col = seq_features.index(name)
+            noise = rng.normal(0, scale, len(base))
+            if name == 'rain_mmhr':
+                windows[row, :, col] *= np.exp(noise)
+            else:
+                windows[row, :, col] += noise
+    for name, (lo, hi) in (('humidity', (0.0, 100.0)), ('wind_ms', (0.0, None))):
+        if name in seq_features:
+            col = seq_features.index(name)
+            windows[:, :, col] = np.clip(windows[:, :, col], lo, hi)
+    return windows
+
+
+def score_members(bundle, base, target_time, key, start, stop, predict):
+    """(stop - start, n_classes) probabilities for members start..stop-1 in one batch."""
+    n = stop - start
+    seq_raw = perturb_windows(base, list(bundle.seq_features), key, start, stop)
+    time_raw = np.repeat(time_feature_rows([target_time], bundle.time_features), n, axis=0)
+    return predict(bundle, *bundle.scale_batch(seq_raw, time_raw))
+
+
+def standard_error(samples):
+    """Largest per-class standard error of the mean over the member axis."""
+    if len(samples) < 2:
+        return float('inf')
+    return float(np.max(samples.std(axis=0, ddof=1)) / np.sqrt(len(samples)))
+
+
+def run_ensemble(bundle, base, target_time, key, members, predict, adaptive=False,
+                 round_size=8, min_members=8, tolerance=0.01):
+    """Score up to ``members`` perturbations of the raw window ``base``; returns (mean probabilities, summary dict).
+
+    ``predict(bundle, seq_input, time_input)`` runs the model on a batch.
+    """
+    if not adaptive:
+        samples = score_members(bundle, base, target_time, key, 0, members, predict)
+    else:
+        batches, drawn = [], 0
+        while drawn < members:
+            step = min(max(round_size, min_members - drawn, drawn), members - drawn)
+            batches.append(score_members(bundle, base, target_time, key, drawn, drawn + step, predict))
+            drawn += step
+            if drawn >= min_members and standard_error(np.concatenate(batches)) < tolerance:
+                break
+        samples = np.concatenate(batches)
+
+    se = standard_error(samples)
+    mean = samples.mean(axis=0)
+    bands = np.percentile(samples, PERCENTILES, axis=0)
+    summary = {
+        'members': int(len(samples)),
+        'adaptive': adaptive,
+        'std_error': None if not np.isfinite(se) else round(se * 100, 3),
+        'converged': bool(se < tolerance),
+        'percentiles': {
+            f'p{q}': {label: float(round(p * 100, 2)) for label, p in zip(bundle.classes, row)}
+            for q, row in zip(PERCENTILES, bands)
+        },
+    }
+    return mean, summary
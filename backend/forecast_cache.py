@@ -0,0 +1,82 @@
+"""In-process LRU + TTL cache of forecast probabilities keyed by canonical key.
+
+Entries remember the model version that produced them (a version mismatch is
+a miss) and whether they were filled by live traffic or by the pre-warmer, so
+the hit-rate uplift from pre-warming can be reported separately.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+SOURCE_LIVE = 'live'
+SOURCE_PREWARM = 'prewarm'
+
+
+class ForecastCache:
+    def __init__(self, capacity=4096, ttl=6 * 3600.0):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (probs, model_version, expires_at, source)
+        self.hits = 0
+        self.misses = 0
+        self.prewarm_hits = 0
+        self.prewarmed = 0
+        self.evictions = 0
+
+    def get(self, key, model_version):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] != model_version or entry[2] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            if entry[3] == SOURCE_PREWARM:
+                self.prewarm_hits += 1
+            return entry[0]
+
+    def put(self, key, probs, model_version, source=SOURCE_LIVE):
+        probs = np.array(probs, dtype=np.float32)
+        with self._lock:
+            self._entries[key] = (probs, model_version, time.monotonic() + self.ttl, source)
+            self._entries.move_to_end(key)
+            if source == SOURCE_PREWARM:
+                self.prewarmed += 1
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def contains(self, key, model_version):
+        """Membership test that does not touch LRU order or hit/miss counters."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[1] == model_version and entry[2] > time.monotonic()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'backend': 'memory',
+            'size': len(self._entries),
+            'capacity': self.capacity,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'prewarmed': self.prewarmed,
+            'prewarm_hits': self.prewarm_hits,
+            # Share of lookups that hit only because the pre-warmer filled the entry.
+            'prewarm_uplift': self.prewarm_hits / lookups if lookups else 0.0,
+        }
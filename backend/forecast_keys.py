@@ -0,0 +1,48 @@
+"""City normalization and the canonical cache/log key for a forecast request."""
+import hashlib
+import re
+from datetime import datetime, timezone
+
+CITY_ALIASES = {
+    'nyc': 'nyc',
+    'new york': 'nyc',
+    'new york city': 'nyc',
+}
+_SLUG = re.compile(r'[a-z0-9][a-z0-9_-]{0,63}')
+
+
+def normalize_city(name):
+    """Return the canonical city slug for a user-supplied name, or None if it cannot be one.
+
+    Known aliases map to their slug; anything else becomes lower_snake_case, which is
+    also the prefix of the city's model artifacts (see model_registry.py).
+    """
+    name = name.strip().lower()
+    if name in CITY_ALIASES:
+        return CITY_ALIASES[name]
+    slug = '_'.join(name.split())
+    return slug if _SLUG.fullmatch(slug) else None
+
+
+def hour_bucket(target_time):
+    """Truncate to the hour; tz-aware times are converted to naive UTC first."""
+    if target_time.tzinfo is not None:
+        target_time = target_time.astimezone(timezone.utc).replace(tzinfo=None)
+    return target_time.replace(minute=0, second=0, microsecond=0)
+
+
+def canonical_key(city, target_time):
+    """Key shared by the request log and forecast caches: ``<city>|YYYY-MM-DDTHH``."""
+    return f"{city}|{hour_bucket(target_time):%Y-%m-%dT%H}"
+
+
+
+def parse_canonical_key(key):
+    """Inverse of canonical_key: returns (city, naive datetime at the top of the hour)."""
+    city, _, stamp = key.partition('|')
+    return city, datetime.strptime(stamp, '%Y-%m-%dT%H')
+
+
+def key_seed(key):
+    """Stable 64-bit RNG seed for a canonical key, making synthetic windows deterministic per key."""
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
@@ -0,0 +1,228 @@
+"""Per-city hourly weather history in per-year float32 arrays.
+
+Layout under ``<root>/<city>/``:
+
+    <year>.npy          (hours_in_year, n_channels) float32, NaN where nothing was ingested
+    <year>.quality.npy  (hours_in_year, len(WEATHER_CHANNELS)) uint8 codes from resample.QUALITY
+    index.json          channel order and, per year, the file, row count and filled rows
+
+Row ``i`` of ``<year>.npy`` is the hour ``Jan 1 00:00 + i h`` (naive UTC).
+Year arrays are preallocated and written in place through a memory map, so
+appending recent data, backfilling gaps or re-ingesting a range never
+rewrites other years. Channels are the model's ``seq_features`` in order:
+the weather channels come from ingestion, the cyclic calendar channels are
+derived from the timestamp when a year is created, so any row range can be
+fed to the model as is. The quality codes tell observed hours from
+interpolated or climatology-filled ones, so training and backtests can weight
+or skip them; stores written before they existed read as observed/missing.
+"""
+import json
+import os
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+
+from resample import MISSING, OBSERVED
+
+WEATHER_CHANNELS = ('temp_c', 'pressure_hpa', 'rain_mmhr', 'humidity', 'wind_ms')
+CALENDAR_CHANNELS = ('hour_sin', 'hour_cos', 'doy_sin', 'doy_cos')
+CHANNELS = WEATHER_CHANNELS + CALENDAR_CHANNELS
+HOUR = np.timedelta64(1, 'h')
+
+
+def to_hours(times):
+    """datetime64[h] array from datetimes, strings or datetime64 values."""
+    return np.asarray(times, dtype='datetime64[h]')
+
+
+def year_start(year):
+    return np.datetime64(f'{year:04d}-01-01T00', 'h')
+
+
+def hours_in_year(year):
+    return int((year_start(year + 1) - year_start(year)) // HOUR)
+
+
+def year_of(hours):
+    return hours.astype('datetime64[Y]').astype(np.int64) + 1970
+
+
+def calendar_columns(hours):
+    """Cyclic hour/day-of-year channels for datetime64[h] values (same formulas as synthetic.py)."""
+    hour_of_day = (hours - hours.astype('datetime64[D]')) // HOUR
+    day_of_year = (hours.astype('datetime64[D]') - hours.astype('datetime64[Y]')) // np.timedelta64(1, 'D') + 1
+    return {
+        'hour_sin': np.sin(2 * np.pi * hour_of_day / 24),
+        'hour_cos': np.cos(2 * np.pi * hour_of_day / 24),
+        'doy_sin': np.sin(2 * np.pi * day_of_year / 365),
+        'doy_cos': np.cos(2 * np.pi * day_of_year / 365),
+    }
+
+
+class HistoryStore:
+    def __init__(self, root, city, channels=CHANNELS):
+        self.root = root
+        self.city = city
+        self.directory = os.path.join(root, city)
+        self.index_path = os.path.join(self.directory, 'index.json')
+        self._lock = threading.Lock()
+        self._arrays = {}  # year -> read-only memmap
+        self.index = self._load_index(channels)
+        self.channels = list(self.index['channels'])
+
+    # -- index ---------------------------------------------------------------
+
+    def _load_index(self, channels):
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                return json.load(f)
+        return {'city': self.city, 'channels': list(channels), 'years': {}}
+
+    def _save_index(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.index['updated_at'] = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        tmp = self.index_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.index, f, indent=1)
+        os.replace(tmp, self.index_path)
+
+    def years(self):
+        return sorted(int(y) for y in self.index['years'])
+
+    def coverage(self):
+        """{year: fraction of hours with every weather channel present}."""
+        return {int(y): meta['filled'] / meta['rows'] for y, meta in sorted(self.index['years'].items())}
+
+    # -- arrays --------------------------------------------------------------
+
+    def _path(self, year):
+        return os.path.join(self.directory, f'{year}.npy')
+
+    def _quality_path(self, year):
+        return os.path.join(self.directory, f'{year}.quality.npy')
+
+    def _open_quality(self, year, values):
+        """Writable quality memmap of a year, created from the NaN pattern of its values if missing."""
+        path = self._quality_path(year)
+        if os.path.exists(path):
+            return np.load(path, mmap_mode='r+')
+        out = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8, shape=(len(values), len(WEATHER_CHANNELS)))
+        for i, name in enumerate(WEATHER_CHANNELS):
+            if name in self.channels:
+                out[:, i] = np.where(np.isnan(values[:, self.channels.index(name)]), MISSING, OBSERVED)
+        return out
+
+    def _create_year(self, year):
+        rows = hours_in_year(year)
+        os.makedirs(self.directory, exist_ok=True)
+        out = np.lib.format.open_memmap(self._path(year), mode='w+', dtype=np.float32,
+                                        shape=(rows, len(self.channels)))
+        out[:] = np.nan
+        hours = year_start(year) + np.arange(rows) * HOUR
+        for name, values in calendar_columns(hours).items():
+            if name in self.channels:
+                out[:, self.channels.index(name)] = values
+        out.flush()
+        self.index['years'][str(year)] = {'file': f'{year}.npy', 'rows': rows, 'filled': 0}
+        return out
+
+    def year_array(self, year):
+        """Read-only memmap of one year, or None if nothing was ingested for it."""
+        arr = self._arrays.get(year)
+        if arr is None and str(year) in self.index['years']:
+            arr = self._arrays[year] = np.load(self._path(year), mmap_mode='r')
+        return arr
+
+    # -- writing -------------------------------------------------------------
+
+    def write(self, times, columns, skip_nan=False, quality=None):
+        """Write hourly values; ``columns`` maps channel name -> array aligned with ``times``.
+
+        Only the given channels are touched, so variables from separate exports can be
+        ingested one after another. NaN values overwrite, so gaps stay gaps, unless
+        ``skip_nan`` is set: then they keep whatever the store already has. ``quality``
+        maps channel name -> codes aligned with ``times``; by default written values are
+        OBSERVED and NaN ones MISSING.
+        """
+        hours = to_hours(times)
+        if len(hours) == 0:
+            return 0
+        unknown = set(columns) - set(self.channels)
+        if unknown:
+            raise ValueError(f'unknown channels: {", ".join(sorted(unknown))}')
+        years = year_of(hours)
+        weather = [self.channels.index(c) for c in WEATHER_CHANNELS if c in self.channels]
+        with self._lock:
+            for year in np.unique(years):
+                year = int(year)
+                sel = years == year
+                rows = ((hours[sel] - year_start(year)) // HOUR).astype(np.int64)
+                if str(year) in self.index['years']:
+                    out = np.load(self._path(year), mmap_mode='r+')
+                else:
+                    out = self._create_year(year)
+                codes = self._open_quality(year, out)
+                for name, values in columns.items():
+                    col = self.channels.index(name)
+                    values = np.asarray(values, dtype=np.float32)[sel]
+                    written = np.full(len(values), True) if not skip_nan else ~np.isnan(values)
+                    out[rows[written], col] = values[written]
+                    if name in WEATHER_CHANNELS:
+                        if quality is not None and name in quality:
+                            code = np.asarray(quality[name], dtype=np.uint8)[sel]
+                        else:
+                            code = np.where(np.isnan(values), MISSING, OBSERVED).astype(np.uint8)
+                        codes[rows[written], WEATHER_CHANNELS.index(name)] = code[written]
+                out.flush()
+                codes.flush()
+                del codes
+                filled = int(np.count_nonzero(~np.isnan(out[:, weather]).any(axis=1)))
+                self.index['years'][str(year)]['filled'] = filled
+                del out
+                self._arrays.pop(year, None)
+            self._save_index()
+        return len(hours)
+
+    # -- reading -------------------------------------------------------------
+
+    def read_quality(self, start, hours):
+        """(hours, len(WEATHER_CHANNELS)) uint8 quality codes starting at ``start``."""
+        start = to_hours(start)
+        result = np.full((hours, len(WEATHER_CHANNELS)), MISSING, dtype=np.uint8)
+        pos = 0
+        while pos < hours:
+            t = start + pos * HOUR
+            year = int(year_of(t))
+            row = int((t - year_start(year)) // HOUR)
+            take = min(hours - pos, hours_in_year(year) - row)
+            arr = self.year_array(year)
+            if arr is not None:
+                path = self._quality_path(year)
+                if os.path.exists(path):
+                    result[pos:pos + take] = np.load(path, mmap_mode='r')[row:row + take]
+                else:
+                    for i, name in enumerate(WEATHER_CHANNELS):
+                        if name in self.channels:
+                            present = ~np.isnan(arr[row:row + take, self.channels.index(name)])
+                            result[pos:pos + take, i] = np.where(present, OBSERVED, MISSING)
+            pos += take
+        return result
+
+    def read(self, start, hours, channels=None):
+        """(hours, n_channels) float32 copy starting at ``start``; NaN rows where there is no data."""
+        start = to_hours(start)
+        cols = [self.channels.index(c) for c in channels] if channels is not None else slice(None)
+        n_cols = len(channels) if channels is not None else len(self.channels)
+        result = np.full((hours, n_cols), np.nan, dtype=np.float32)
+        pos = 0
+        while pos < hours:
+            t = start + pos * HOUR
+            year = int(year_of(t))
+            row = int((t - year_start(year)) // HOUR)
+            take = min(hours - pos, hours_in_year(year) - row)
+            arr = self.year_array(year)
+            if arr is not None:
+                result[pos:pos + take] = arr[row:row + take][:, cols]
+            pos += take
+        return result
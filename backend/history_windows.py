@@ -0,0 +1,158 @@
+"""Model input windows read from the hourly history store.
+
+The window for a target time is the ``bundle.window`` hours ending at (and
+including) the target hour, the same alignment as the synthetic windows.
+Its rows are found by index arithmetic on the year arrays:
+
+    end_row = (hour_bucket(target_time) - Jan 1 00:00) / 1h
+    window  = year_array[end_row - steps + 1 : end_row + 1]
+
+When the window lies inside one year and the store's channels are the
+bundle's ``seq_features``, that slice is a view of the memory map: no copy
+and no parse. A pre-scaled copy of each year (``<year>.scaled-<model
+version>.npy``, rebuilt whenever the year file changes) gives the same
+zero-copy view directly in model units, skipping the scaler. Copies of model
+versions the process doesn't map are deleted when a copy is built, and a
+hot reload drops the replaced version's (see ``drop_scaled``). Windows that
+cross a year boundary are copied. Per-year prefix counts of complete rows
+make the gap check O(1); callers fill the gap rows of incomplete windows
+from the synthetic generator.
+"""
+import glob
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+from forecast_keys import hour_bucket
+from history_store import HOUR, HistoryStore, WEATHER_CHANNELS, to_hours, year_of, year_start
+from metrics import metrics
+
+
+class HistoryWindows:
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.Lock()
+        self._stores = {}  # city -> (index mtime, HistoryStore)
+        self._complete = {}  # (city, year) -> (file mtime, prefix count of complete rows)
+        self._scaled = {}  # (city, year, version) -> (file mtime, scaled memmap)
+
+    def store(self, city):
+        """HistoryStore for city, reloaded when ingestion rewrites its index; None if there is none."""
+        index_path = os.path.join(self.root, city, 'index.json')
+        try:
+            mtime = os.stat(index_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        cached = self._stores.get(city)
+        if cached is None or cached[0] != mtime:
+            with self._lock:
+                cached = self._stores[city] = (mtime, HistoryStore(self.root, city))
+        return cached[1]
+
+    def _complete_rows(self, store, year):
+        """Prefix count of complete rows of the year, recomputed when its file changes."""
+        mtime = os.stat(os.path.join(store.directory, f'{year}.npy')).st_mtime_ns
+        cached = self._complete.get((store.city, year))
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        arr = store.year_array(year)
+        weather = [store.channels.index(c) for c in WEATHER_CHANNELS if c in store.channels]
+        complete = ~np.isnan(arr[:, weather]).any(axis=1)
+        prefix = np.concatenate([[0], np.cumsum(complete)])
+        self._complete[(store.city, year)] = (mtime, prefix)
+        return prefix
+
+    def _scaled_year(self, store, year, bundle):
+        """Memmap of the year in model units for bundle's scaler, built on first use."""
+        scaler = bundle.scaler
+        if not hasattr(scaler, 'mean_') or not hasattr(scaler, 'scale_'):
+            return None
+        src = os.path.join(store.directory, f'{year}.npy')
+        mtime = os.stat(src).st_mtime_ns
+        cached = self._scaled.get((store.city, year, bundle.version))
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        path = os.path.join(store.directory, f'{year}.scaled-{bundle.version}.npy')
+        if not os.path.exists(path) or os.stat(path).st_mtime_ns < mtime:
+            raw = store.year_array(year)
+            # Each builder writes its own temporary file: workers sharing one name would
+            # truncate a memmap another is still writing.
+            fd, tmp = tempfile.mkstemp(dir=store.directory, prefix=f'{year}.scaled-', suffix='.tmp')
+            os.close(fd)
+            try:
+                out = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.float32, shape=raw.shape)
+                out[:] = (raw - scaler.mean_) / scaler.scale_
+                out.flush()
+                del out
+                os.replace(tmp, path)
+            except BaseException:
+                os.remove(tmp)
+                raise
+            metrics.incr('history_scaled_builds')
+            self._prune_scaled(store, year, bundle.version)
+        scaled = np.load(path, mmap_mode='r')
+        self._scaled[(store.city, year, bundle.version)] = (mtime, scaled)
+        return scaled
+
+    def _prune_scaled(self, store, year, current):
+        """Delete the year's scaled copies of versions other than current that this process doesn't map.
+
+        Open memmaps of a deleted file stay valid; another worker still serving an old
+        version simply rebuilds its copy.
+        """
+        keep = {version for city, y, version in self._scaled if city == store.city and y == year} | {current}
+        for path in glob.glob(os.path.join(store.directory, f'{year}.scaled-*.npy')):
+            version = os.path.basename(path)[len(f'{year}.scaled-'):-len('.npy')]
+            if version not in keep:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def drop_scaled(self, city, version):
+        """Forget and delete the city's scaled copies of every version but ``version`` (after a model swap)."""
+        store = self.store(city)
+        if store is None:
+            return
+        for key in [k for k in self._scaled if k[0] == city and k[2] != version]:
+            self._scaled.pop(key, None)
+        for year in store.years():
+            self._prune_scaled(store, year, version)
+
+    def lookup(self, bundle, target_time):
+        """History window for bundle ending at target_time.
+
+        Returns None when the store has no complete row in the window, else
+        ``(raw, scaled, gaps)``: raw (steps, F) values in seq_features order (a read-only
+        view when possible), scaled the same window in model units or None, and gaps a
+        boolean row mask of incomplete rows, or None when the window is complete.
+        """
+        store = self.store(bundle.city)
+        if store is None:
+            return None
+        steps = bundle.window
+        end = to_hours(hour_bucket(target_time))
+        start = end - (steps - 1) * HOUR
+        year = int(year_of(end))
+        first = int((start - year_start(year)) // HOUR)
+        last = int((end - year_start(year)) // HOUR) + 1
+        same_order = store.channels == list(bundle.seq_features)
+
+        if first >= 0 and store.year_array(year) is not None:
+            prefix = self._complete_rows(store, year)
+            complete = int(prefix[last] - prefix[first])
+            if complete == 0:
+                return None
+            arr = store.year_array(year)
+            raw = arr[first:last] if same_order else arr[first:last][:, [store.channels.index(c) for c in bundle.seq_features]]
+            if complete == steps:
+                scaled = self._scaled_year(store, year, bundle) if same_order else None
+                return raw, None if scaled is None else scaled[first:last], None
+        else:
+            raw = store.read(start, steps, list(bundle.seq_features))
+        gaps = np.isnan(raw).any(axis=1)
+        if gaps.all():
+            return None
+        return raw, None, gaps if gaps.any() else None
@@ -0,0 +1,173 @@
+"""Zero-downtime reload of model artifacts.
+
+A reload loads the bundle currently on disk in a background thread, warms it
+up, validates it against a golden input set and only then swaps it into the
+registry (see ModelRegistry.reload). Requests already holding the old bundle
+finish on it; the old bundle is freed once they are done.
+
+The golden set for a city is ``<golden_dir>/<city>_golden.npz`` with raw
+``seq_raw`` (N, window, 9) and ``time_raw`` (N, 6) arrays and optionally
+``labels`` (N,) class names. Without a file, a fixed set of seeded synthetic
+windows is used, which still catches broken artifacts (wrong shapes, NaNs,
+non-probability outputs). Golden windows longer than a model's window are cut
+to their last ``window`` hours, so a short-window student (see distill.py)
+validates against its teacher's golden set. Agreement with the model being
+replaced is recorded for information.
+
+Reloads are started from the admin endpoint or by the watcher, which polls
+the artifact files and reloads a loaded city once its files have changed and
+stayed unchanged for one more poll (so half-copied files are not picked up).
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from forecast_keys import canonical_key, key_seed
+from metrics import metrics
+from model_registry import artifact_paths
+from synthetic import synthesize_windows, time_feature_rows
+
+GOLDEN_SUFFIX = '_golden.npz'
+
+
+class ValidationError(Exception):
+    pass
+
+
+def synthetic_golden(bundle, n=24, steps=None):
+    """Deterministic golden inputs: seeded synthetic windows (``steps`` hours, default the model's) over a year."""
+    start = datetime(2024, 1, 1, 0)
+    times = [start + timedelta(hours=i * (8784 // n) + i % 24) for i in range(n)]
+    seeds = [key_seed(canonical_key(bundle.city, t)) for t in times]
+    seq_raw = synthesize_windows(times, bundle.seq_features, steps or bundle.window, seeds=seeds)
+    return seq_raw, time_feature_rows(times, bundle.time_features), None
+
+
+def load_golden(golden_dir, bundle, steps=None):
+    path = os.path.join(golden_dir, bundle.city + GOLDEN_SUFFIX) if golden_dir else None
+    if path is None or not os.path.exists(path):
+        return synthetic_golden(bundle, steps=steps)
+    with np.load(path, allow_pickle=False) as data:
+        labels = data['labels'] if 'labels' in data.files else None
+        return data['seq_raw'], data['time_raw'], labels
+
+
+def validate_bundle(bundle, old=None, golden_dir=None, min_accuracy=0.0):
+    """Score the golden set with ``bundle``; raises ValidationError, returns a report dict."""
+    seq_raw, time_raw, labels = load_golden(golden_dir, bundle, max(bundle.window, old.window if old else 0))
+    steps = seq_raw.shape[1]
+    if steps < bundle.window or seq_raw.shape[2:] != (len(bundle.seq_features),):
+        raise ValidationError(f'golden windows {seq_raw.shape[1:]} do not match model input '
+                              f'{(bundle.window, len(bundle.seq_features))}')
+    probs = bundle.predict(*bundle.scale_batch(seq_raw[:, steps - bundle.window:], time_raw))
+    if probs.shape != (len(seq_raw), len(bundle.classes)):
+        raise ValidationError(f'unexpected output shape {probs.shape}')
+    if not np.all(np.isfinite(probs)):
+        raise ValidationError('non-finite probabilities')
+    if not np.allclose(probs.sum(axis=1), 1.0, atol=1e-3):
+        raise ValidationError('outputs are not probability distributions')
+
+    report = {'golden_size': int(len(seq_raw))}
+    pred = np.asarray(bundle.classes)[probs.argmax(axis=1)]
+    if labels is not None:
+        accuracy = float(np.mean(pred == labels.astype(str)))
+        report['golden_accuracy'] = accuracy
+        if accuracy < min_accuracy:
+            raise ValidationError(f'golden accuracy {accuracy:.3f} below {min_accuracy:.3f}')
+    if old is not None and old.window <= steps:
+        old_probs = old.predict(*old.scale_batch(seq_raw[:, steps - old.window:], time_raw))
+        old_pred = np.asarray(old.classes)[old_probs.argmax(axis=1)]
+        report['agreement_with_previous'] = float(np.mean(pred == old_pred))
+    return report
+
+
+class ReloadManager:
+    def __init__(self, registry, golden_dir=None, min_accuracy=0.0, watch_interval=0.0):
+        self.registry = registry
+        self.golden_dir = golden_dir
+        self.min_accuracy = min_accuracy
+        self.watch_interval = watch_interval
+        self._lock = threading.Lock()
+        self._jobs = {}  # city -> status dict of the latest reload
+        self._pending = {}  # city -> changed signature seen on the previous poll
+        self._attempted = {}  # city -> signature of the last reload attempt
+        self._stop = threading.Event()
+        self._thread = None
+
+    def request(self, city):
+        """Start a background reload of city unless one is already running; returns its status."""
+        if not self.registry.available(city):
+            raise KeyError(city)
+        with self._lock:
+            job = self._jobs.get(city)
+            if job is not None and job['state'] == 'running':
+                return dict(job)
+            job = self._jobs[city] = {
+                'city': city,
+                'state': 'running',
+                'started_at': datetime.now().isoformat(timespec='seconds'),
+                'previous_version': self.registry.version(city),
+            }
+        threading.Thread(target=self._reload, args=(city, job), name=f'model-reload-{city}', daemon=True).start()
+        return dict(job)
+
+    def status(self):
+        with self._lock:
+            return {city: dict(job) for city, job in self._jobs.items()}
+
+    def _reload(self, city, job):
+        started = time.perf_counter()
+        report = {}
+
+        def validate(bundle, old):
+            report.update(validate_bundle(bundle, old, self.golden_dir, self.min_accuracy))
+
+        try:
+            bundle = self.registry.reload(city, validate=validate)
+            result = {'state': 'active', 'version': bundle.version}
+        except Exception as e:
+            metrics.incr('model_reload_failures')
+            result = {'state': 'failed', 'error': f'{type(e).__name__}: {e}'}
+        duration = (time.perf_counter() - started) * 1000
+        metrics.observe('model_reload_ms', duration)
+        with self._lock:
+            job.update(result, duration_ms=round(duration, 1), **report)
+
+    # -- watcher -------------------------------------------------------------
+
+    def start(self):
+        if self.watch_interval > 0 and self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._watch, name='model-watcher', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(5.0)
+            self._thread = None
+
+    def _watch(self):
+        while not self._stop.wait(self.watch_interval):
+            for city in self.registry.loaded():
+                try:
+                    self.poll(city)
+                except OSError:
+                    continue  # files mid-replace; look again next poll
+
+    def poll(self, city):
+        """Reload city if its artifacts changed and have been stable for one poll interval."""
+        current = artifact_paths(self.registry.models_dir, city).signature()
+        if current == self.registry.loaded_signature(city) or current == self._attempted.get(city):
+            self._pending.pop(city, None)
+            return False
+        if self._pending.get(city) != current:
+            self._pending[city] = current
+            return False
+        self._pending.pop(city, None)
+        self._attempted[city] = current
+        self.request(city)
+        return True
@@ -0,0 +1,346 @@
+"""Ingest NASA Giovanni time-series exports into the hourly history store.
+
+    python ingest_giovanni.py --city nyc exports/*.csv exports/*.nc
+
+Each Giovanni export holds one area-averaged variable. The variable name is
+mapped onto a ``seq_features`` channel (see VARIABLES, or pass
+``--map NAME=CHANNEL``), converted to the channel's unit (``--units NAME=UNIT``
+overrides the default unit, netCDF ``units`` attributes are used when
+present), resampled to hourly values and written to the per-city store (see
+history_store.py). Files are read in chunks of ``--chunk-rows`` rows, so
+multi-year half-hourly exports never have to fit in memory.
+
+Resampling (see resample.py) deduplicates repeated timestamps and averages
+each hour time-weighted: a reading holds until the next one, for at most
+``--max-hold`` seconds, so irregular or shifted stamps are weighted by the
+time they cover (``--method mean`` uses plain per-hour means). With
+``--fill linear`` gaps of up to ``--max-gap`` hours are then interpolated,
+and ``--fill climatology`` also fills longer ones from the store's own
+day-of-year/hour climatology. Filled hours are marked in the store's quality
+mask.
+
+Two channels can be derived from other variables, so their inputs are
+ingested first:
+
+* humidity from specific humidity (QV2M) plus the temperature and pressure
+  already in the store;
+* wind speed from U/V component exports (U2M + V2M or U10M + V10M).
+
+netCDF input needs the optional ``netCDF4`` package.
+"""
+import argparse
+import csv
+import os
+import re
+import sys
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from history_store import HOUR, HistoryStore, WEATHER_CHANNELS, year_start
+from resample import OBSERVED, QUALITY, HourlyResampler, climatology, fill_gaps
+
+DEFAULT_STORE = os.path.join(os.path.dirname(BACKEND_DIR), 'data', 'history')
+
+# (pattern on the lower-cased variable name, channel, default unit). First match wins.
+VARIABLES = [
+    (r'precipitationcal|precipitation|precip', 'rain_mmhr', 'mm/hr'),
+    (r'prectot', 'rain_mmhr', 'kg m-2 s-1'),
+    (r't2m|air_temp|temperature', 'temp_c', 'K'),
+    (r'slp|(^|_)ps($|_)|pressure', 'pressure_hpa', 'Pa'),
+    (r'rh2m|relhum|relative_humidity', 'humidity', '%'),
+    (r'qv2m|specific_humidity', 'specific_humidity', 'kg kg-1'),
+    (r'(^|_)(u2m|u10m)($|_)', 'wind_u', 'm s-1'),
+    (r'(^|_)(v2m|v10m)($|_)', 'wind_v', 'm s-1'),
+    (r'speed|ws2m|ws10m|wind', 'wind_ms', 'm s-1'),
+]
+# Derived channels are ingested after the channels they are computed from.
+DERIVED = ('specific_humidity', 'wind_u', 'wind_v')
+
+UNIT_CONVERSIONS = {
+    'K': lambda v: v - 273.15,
+    'C': lambda v: v,
+    'degC': lambda v: v,
+    'Pa': lambda v: v / 100.0,
+    'hPa': lambda v: v,
+    'mb': lambda v: v,
+    'kg m-2 s-1': lambda v: v * 3600.0,
+    'mm/hr': lambda v: v,
+    'mm hr-1': lambda v: v,
+    'mm/day': lambda v: v / 24.0,
+    'mm day-1': lambda v: v / 24.0,
+    '%': lambda v: v,
+    '1': lambda v: v * 100.0,  # fraction -> percent
+    'm s-1': lambda v: v,
+    'm/s': lambda v: v,
+    'kg kg-1': lambda v: v,
+}
+
+
+def classify(variable, channel_map=None, unit_map=None, units=None):
+    """(channel, unit) for a Giovanni variable name; raises ValueError if it is not recognised."""
+    channel = (channel_map or {}).get(variable)
+    default_unit = None
+    if channel is None:
+        name = variable.lower()
+        for pattern, ch, unit in VARIABLES:
+            if re.search(pattern, name):
+                channel, default_unit = ch, unit
+                break
+    if channel is None:
+        raise ValueError(f'no channel for variable {variable!r}; pass --map {variable}=CHANNEL')
+    unit = (unit_map or {}).get(variable) or units or default_unit
+    if unit not in UNIT_CONVERSIONS:
+        raise ValueError(f'unknown unit {unit!r} for {variable}; pass --units {variable}=UNIT')
+    return channel, unit
+
+
+# -- readers -------------------------------------------------------------------
+
+
+def read_csv_header(f):
+    """Consume the Giovanni metadata block; returns (variable name, fill values)."""
+    fills = set()
+    for line in f:
+        if line.startswith('time,'):
+            return line.strip().split(',')[1], fills
+        match = re.match(r'Fill Value[^:]*:,\s*(\S+)', line)
+        if match:
+            fills.add(float(match.group(1)))
+    raise ValueError('no "time,<variable>" header line found')
+
+
+def parse_times(strings):
+    cleaned = [s.strip().rstrip('Z').replace(' ', 'T') for s in strings]
+    return np.array(cleaned, dtype='datetime64[s]')
+
+
+def iter_csv(path, chunk_rows):
+    """Yield (variable, units, times datetime64[s], values float64) chunks of a Giovanni CSV; fills -> NaN."""
+    with open(path, newline='') as f:
+        variable, fills = read_csv_header(f)
+        reader = csv.reader(f)
+        while True:
+            times, values = [], []
+            for row in reader:
+                if len(row) < 2 or not row[0].strip():
+                    continue
+                times.append(row[0])
+                values.append(row[1])
+                if len(times) >= chunk_rows:
+                    break
+            if not times:
+                return
+            vals = np.array([float(v) if v.strip() else np.nan for v in values])
+            for fill in fills:
+                vals[vals == fill] = np.nan
+            yield variable, None, parse_times(times), vals
+
+
+def iter_netcdf(path, chunk_rows):
+    """Yield chunks of every time-dependent variable in a Giovanni netCDF export, area-averaged."""
+    try:
+        import netCDF4
+    except ImportError:
+        raise SystemExit('netCDF input needs the netCDF4 package (pip install netCDF4)')
+    with netCDF4.Dataset(path) as ds:
+        time_var = ds.variables['time']
+        for name, var in ds.variables.items():
+            if name == 'time' or 'time' not in var.dimensions or var.ndim < 1:
+                continue
+            axis = var.dimensions.index('time')
+            units = getattr(var, 'units', None)
+            for start in range(0, len(time_var), chunk_rows):
+                stop = min(start + chunk_rows, len(time_var))
+                stamps = netCDF4.num2date(time_var[start:stop], time_var.units,
+                                          only_use_cftime_datetimes=False, only_use_python_datetimes=True)
+                index = [slice(None)] * var.ndim
+                index[axis] = slice(start, stop)
+                data = np.ma.filled(np.ma.asarray(var[tuple(index)], dtype=np.float64), np.nan)
+                data = np.moveaxis(data, axis, 0).reshape(stop - start, -1)
+                with np.errstate(invalid='ignore'):
+                    values = np.nanmean(data, axis=1) if data.shape[1] > 1 else data[:, 0]
+                yield name, units, np.array(stamps, dtype='datetime64[s]'), values
+
+
+def iter_file(path, chunk_rows):
+    if path.endswith(('.nc', '.nc4')):
+        return iter_netcdf(path, chunk_rows)
+    return iter_csv(path, chunk_rows)
+
+
+# -- hourly binning ------------------------------------------------------------
+
+
+def hourly_series(path, chunk_rows, channel_map, unit_map, max_hold=3600.0, method='time'):
+    """Yield (variable, channel, hours, hourly values in channel units) per chunk of one file.
+
+    Only hours with readings are yielded; gaps are left to fill_store.
+    """
+    resampler = HourlyResampler(max_hold, method)
+    channel = unit = None
+    variable = None
+
+    def observed(result):
+        hours, values, quality = result
+        keep = quality[:, 0] == OBSERVED
+        return hours[keep], values[keep, 0].astype(np.float64)
+
+    for variable, units, times, values in iter_file(path, chunk_rows):
+        channel, unit = classify(variable, channel_map, unit_map, units)
+        hours, hourly = observed(resampler.feed(times, UNIT_CONVERSIONS[unit](values)))
+        if len(hours):
+            yield variable, channel, hours, hourly
+    if variable is not None:
+        hours, hourly = observed(resampler.flush())
+        if len(hours):
+            yield variable, channel, hours, hourly
+
+
+# -- derived channels ----------------------------------------------------------
+
+
+def relative_humidity(q, temp_c, pressure_hpa):
+    """Relative humidity (%) from specific humidity (kg/kg), temperature (C) and pressure (hPa)."""
+    vapour = q * pressure_hpa / (0.622 + 0.378 * q)
+    saturation = 6.112 * np.exp(17.67 * temp_c / (temp_c + 243.5))
+    return np.clip(100.0 * vapour / saturation, 0.0, 100.0)
+
+
+def write_derived(store, channel, hours, values):
+    if channel == 'specific_humidity':
+        temp = pressure = np.full(len(hours), np.nan)
+        if len(hours):
+            span = store.read(hours.min(), int((hours.max() - hours.min()) // HOUR) + 1,
+                              ['temp_c', 'pressure_hpa'])
+            rows = ((hours - hours.min()) // HOUR).astype(np.int64)
+            temp, pressure = span[rows, 0], span[rows, 1]
+        return store.write(hours, {'humidity': relative_humidity(values, temp, pressure)})
+    raise ValueError(channel)
+
+
+def combine_wind(components):
+    """Wind speed from accumulated {'wind_u': [(hours, values), ...], 'wind_v': [...]} chunks."""
+    hu, u = (np.concatenate(parts) for parts in zip(*components['wind_u']))
+    hv, v = (np.concatenate(parts) for parts in zip(*components['wind_v']))
+    hours, iu, iv = np.intersect1d(hu, hv, return_indices=True)
+    return hours, np.hypot(u[iu], v[iv])
+
+
+# -- gap filling ---------------------------------------------------------------
+
+
+def fill_store(store, method='linear', max_gap=6, log=print):
+    """Fill gaps of every weather channel across the store's years; returns {quality name: cells}.
+
+    Only cells without an observation are written, with INTERPOLATED or CLIMATOLOGY quality,
+    so running it again (or after more data arrives) redoes earlier fills without touching
+    observations.
+    """
+    years = store.years()
+    if not years:
+        return {}
+    start = year_start(years[0])
+    hours = int((year_start(years[-1] + 1) - start) // HOUR)
+    channels = [c for c in WEATHER_CHANNELS if c in store.channels]
+    values = store.read(start, hours, channels)
+    quality = store.read_quality(start, hours)[:, [WEATHER_CHANNELS.index(c) for c in channels]]
+    # Earlier fills are redone from the observations alone.
+    values[quality != OBSERVED] = np.nan
+    times = start + np.arange(hours) * HOUR
+    table = climatology(times, values) if method == 'climatology' else None
+    filled, codes = fill_gaps(values, None, max_gap, table, times)
+    counts = {}
+    for i, name in enumerate(channels):
+        new = codes[:, i] > OBSERVED
+        if new.any():
+            store.write(times[new], {name: filled[new, i]}, quality={name: codes[new, i]})
+        for code in np.unique(codes[new, i]):
+            counts[QUALITY[code]] = counts.get(QUALITY[code], 0) + int((codes[new, i] == code).sum())
+    log(f'filled {sum(counts.values())} cells ({", ".join(f"{k}: {v}" for k, v in sorted(counts.items())) or "none"})')
+    return counts
+
+
+# -- CLI -----------------------------------------------------------------------
+
+
+def ingest(paths, store, chunk_rows=100000, channel_map=None, unit_map=None, log=print,
+           max_hold=3600.0, method='time'):
+    """Ingest files into store; returns {path: hours written}."""
+    def order(path):
+        # Files whose variable feeds a derived channel go last.
+        try:
+            variable = next(iter_file(path, 1))[0]
+            return classify(variable, channel_map, unit_map)[0] in DERIVED
+        except (ValueError, StopIteration):
+            return False
+
+    written = {}
+    components = {}
+    for path in sorted(paths, key=order):
+        total = 0
+        for variable, channel, hours, values in hourly_series(path, chunk_rows, channel_map, unit_map,
+                                                              max_hold, method):
+            if channel in ('wind_u', 'wind_v'):
+                components.setdefault(channel, []).append((hours, values))
+                total += len(hours)
+            elif channel in DERIVED:
+                total += write_derived(store, channel, hours, values)
+            else:
+                total += store.write(hours, {channel: values})
+        written[path] = total
+        log(f'{path}: {total} hourly values')
+    if 'wind_u' in components and 'wind_v' in components:
+        hours, speed = combine_wind(components)
+        store.write(hours, {'wind_ms': speed})
+        log(f'wind_ms from U/V components: {len(hours)} hourly values')
+    return written
+
+
+def parse_pairs(items, what):
+    pairs = {}
+    for item in items:
+        name, sep, value = item.partition('=')
+        if not sep:
+            raise SystemExit(f'--{what} expects NAME=VALUE, got {item!r}')
+        pairs[name] = value
+    return pairs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python ingest_giovanni.py', description=__doc__.split('\n')[0])
+    parser.add_argument('files', nargs='+', help='Giovanni CSV or netCDF exports')
+    parser.add_argument('--city', required=True)
+    parser.add_argument('--store', default=os.environ.get('HISTORY_DIR', DEFAULT_STORE), help='history store root')
+    parser.add_argument('--chunk-rows', type=int, default=100000, help='rows read per chunk')
+    parser.add_argument('--map', action='append', default=[], metavar='VARIABLE=CHANNEL',
+                        help=f'channel for a variable ({", ".join(WEATHER_CHANNELS)})')
+    parser.add_argument('--units', action='append', default=[], metavar='VARIABLE=UNIT',
+                        help=f'unit of a variable ({", ".join(UNIT_CONVERSIONS)})')
+    parser.add_argument('--method', choices=('time', 'mean'), default='time',
+                        help='time-weighted hourly averages (default) or plain per-hour means')
+    parser.add_argument('--max-hold', type=float, default=3600.0,
+                        help='seconds a reading may stand for when time-weighting')
+    parser.add_argument('--fill', choices=('none', 'linear', 'climatology'), default='none',
+                        help='fill gaps after ingesting (see --max-gap)')
+    parser.add_argument('--max-gap', type=int, default=6, help='longest gap (hours) filled by interpolation')
+    args = parser.parse_args(argv)
+
+    store = HistoryStore(args.store, args.city)
+    try:
+        ingest(args.files, store, args.chunk_rows, parse_pairs(args.map, 'map'), parse_pairs(args.units, 'units'),
+               max_hold=args.max_hold, method=args.method)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    if args.fill != 'none':
+        fill_store(store, args.fill, args.max_gap)
+    for year, fraction in store.coverage().items():
+        print(f'{args.city} {year}: {fraction:.1%} of hours complete')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,45 @@
+"""Weather classes for observed hours, as used to train and score the models.
+
+The shipped models predict one of CLASSES; the notebook that trained them was
+not kept, so these rules restate the classes from the hourly channels. The
+first matching rule wins:
+
+    Snow        precipitation >= LIGHT_RAIN_MMHR at or below SNOW_MAX_TEMP_C
+    Heavy Rain  precipitation >= HEAVY_RAIN_MMHR
+    Light Rain  precipitation >= LIGHT_RAIN_MMHR
+    Heatwave    temperature >= HEATWAVE_TEMP_C
+    Cloudy      relative humidity >= CLOUDY_HUMIDITY
+    Clear       otherwise
+"""
+import numpy as np
+
+from history_store import WEATHER_CHANNELS
+
+# LabelEncoder order (sorted), so encoders fitted on CLASSES match the shipped one.
+CLASSES = ['Clear', 'Cloudy', 'Heatwave', 'Heavy Rain', 'Light Rain', 'Snow']
+
+LIGHT_RAIN_MMHR = 0.1
+HEAVY_RAIN_MMHR = 4.0
+SNOW_MAX_TEMP_C = 0.5
+HEATWAVE_TEMP_C = 32.0
+CLOUDY_HUMIDITY = 80.0
+
+
+def label_codes(weather):
+    """Class index (into CLASSES) per row of (n, len(WEATHER_CHANNELS)) values; -1 where a value is NaN."""
+    weather = np.asarray(weather, dtype=np.float64)
+    temp, rain, humidity = (weather[:, WEATHER_CHANNELS.index(c)] for c in ('temp_c', 'rain_mmhr', 'humidity'))
+    codes = np.select(
+        [(rain >= LIGHT_RAIN_MMHR) & (temp <= SNOW_MAX_TEMP_C),
+         rain >= HEAVY_RAIN_MMHR,
+         rain >= LIGHT_RAIN_MMHR,
+         temp >= HEATWAVE_TEMP_C,
+         humidity >= CLOUDY_HUMIDITY],
+        [CLASSES.index(c) for c in ('Snow', 'Heavy Rain', 'Light Rain', 'Heatwave', 'Cloudy')],
+        default=CLASSES.index('Clear'),
+    )
+    return np.where(np.isnan(weather).any(axis=1), -1, codes)
+
+
+def label_names(codes):
+    return np.asarray(CLASSES)[np.asarray(codes)]
@@ -1,18 +1,147 @@
+import hashlib
 import os
-import joblib
+import re
+import sys
+import threading
+import time
+from contextlib import asynccontextmanager
+from functools import partial
 import numpy as np
-import pandas as pd
-from fastapi import FastAPI, HTTPException
+from typing import List, Optional
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from tensorflow.keras.models import load_model
-from datetime import datetime
+from starlette.concurrency import run_in_threadpool
+from datetime import datetime, timedelta, timezone
 
-MODEL_PATH = 'models/nyc_lstm_model.h5'
-SCALER_PATH = 'models/nyc_scaler.gz'
-ENCODER_PATH = 'models/nyc_label_encoder.gz'
+# Sibling modules must import both as `uvicorn main:app` (from backend/) and `uvicorn backend.main:app`.
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
 
-app = FastAPI(title='Will It Rain On My Parade - NYC')
+from drift import DriftMonitor
+from ensemble import run_ensemble
+from explain import aggregate, integrated_gradients
+from forecast_cache import ForecastCache
+from forecast_keys import canonical_key, key_seed, normalize_city
+from history_store import WEATHER_CHANNELS
+from history_windows import HistoryWindows
+from hot_reload import ReloadManager
+from labels import LIGHT_RAIN_MMHR
+from metrics import metrics
+from model_registry import ModelRegistry
+from observation_log import ObservationLog
+from observation_store import ObservationStore
+from observations import parse_body, validate
+from odds import OddsIndexes, leap_day_index
+from precompute import ForecastTable, PrecomputeJob, hourly_slots
+from prewarm import Prewarmer
+from request_log import forecast_record, sink_from_env
+from resample import fill_gaps
+from scenario import apply_scenarios
+from shadow import ShadowEvaluator
+from shared_cache import SharedForecastCache
+from synthetic import synthesize_windows, time_feature_rows
+from timeparse import parse_datetime
+
+ENGINE = 'lstm'
+project_root = os.path.dirname(BACKEND_DIR)
+MODELS_DIR = os.environ.get('MODELS_DIR', os.path.join(project_root, 'models'))
+MODEL_CACHE_MAX_MB = float(os.environ.get('MODEL_CACHE_MAX_MB', 512))
+# City loaded at startup and served by the precompute table and pre-warmer.
+DEFAULT_CITY = os.environ.get('DEFAULT_CITY', 'nyc')
+# Don't load the default model (and TensorFlow) at import: it loads in the background once the
+# server is up, so new workers accept connections immediately. Early requests wait for the load.
+FAST_START = os.environ.get('FAST_START', '0') == '1'
+# Poll artifact files and hot-reload changed models; 0 disables the watcher (the admin endpoint still works).
+MODEL_WATCH_INTERVAL_SECONDS = float(os.environ.get('MODEL_WATCH_INTERVAL_SECONDS', 30))
+GOLDEN_DIR = os.environ.get('GOLDEN_DIR', os.path.join(MODELS_DIR, 'golden'))
+RELOAD_MIN_GOLDEN_ACCURACY = float(os.environ.get('RELOAD_MIN_GOLDEN_ACCURACY', 0.0))
+# When set, /api/v1/admin/* requires a matching X-Admin-Token header.
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+# Hourly observations written by ingest_giovanni.py; windows fall back to synthetic history where it has none.
+HISTORY_DIR = os.environ.get('HISTORY_DIR', os.path.join(project_root, 'data', 'history'))
+# Gaps of up to this many hours in a history/observation window are interpolated per channel;
+# longer ones take the synthetic generator's values.
+WINDOW_INTERPOLATE_HOURS = int(os.environ.get('WINDOW_INTERPOLATE_HOURS', 3))
+# Live readings posted to /api/v1/observations: a segmented, fsync'd append-only log per city and
+# worker process, compacted into HISTORY_DIR every OBSERVATION_COMPACT_INTERVAL_SECONDS.
+OBSERVATIONS_DIR = os.environ.get('OBSERVATIONS_DIR', os.path.join(project_root, 'data', 'observations'))
+OBSERVATION_SEGMENT_MB = float(os.environ.get('OBSERVATION_SEGMENT_MB', 64))
+OBSERVATION_COMPACT_INTERVAL_SECONDS = float(os.environ.get('OBSERVATION_COMPACT_INTERVAL_SECONDS', 600))
+OBSERVATION_MAX_ROWS = int(os.environ.get('OBSERVATION_MAX_ROWS', 10000))
+# Input drift against the training histogram stored with the scalers (N(0, 1) for older artifacts), over a
+# sliding window of model-scored requests (see drift.py); weather features with PSI above DRIFT_PSI_ALERT are
+# reported as drifting.
+DRIFT_WINDOW_SECONDS = float(os.environ.get('DRIFT_WINDOW_SECONDS', 3600))
+DRIFT_BUCKETS = int(os.environ.get('DRIFT_BUCKETS', 12))
+DRIFT_PSI_ALERT = float(os.environ.get('DRIFT_PSI_ALERT', 0.25))
+DRIFT_MIN_SAMPLES = int(os.environ.get('DRIFT_MIN_SAMPLES', 50))
+request_log = sink_from_env(os.path.join(project_root, 'logs', 'requests'))
+
+PRECOMPUTE_ENABLED = os.environ.get('PRECOMPUTE_ENABLED', '1') == '1'
+PRECOMPUTE_DIR = os.environ.get('PRECOMPUTE_DIR', os.path.join(project_root, 'cache', 'precompute'))
+PRECOMPUTE_HOURS = int(os.environ.get('PRECOMPUTE_HOURS', 720))
+PRECOMPUTE_INTERVAL_SECONDS = float(os.environ.get('PRECOMPUTE_INTERVAL_SECONDS', 3600))
+PREDICT_BATCH_SIZE = int(os.environ.get('PREDICT_BATCH_SIZE', 128))
+# Forecasts only change with the model version; let clients/CDNs reuse them for one refresh cycle.
+FORECAST_MAX_AGE_SECONDS = int(os.environ.get('FORECAST_MAX_AGE_SECONDS', PRECOMPUTE_INTERVAL_SECONDS))
+FORECAST_CACHE_SIZE = int(os.environ.get('FORECAST_CACHE_SIZE', 4096))
+FORECAST_CACHE_TTL_SECONDS = float(os.environ.get('FORECAST_CACHE_TTL_SECONDS', 6 * 3600))
+# 'shared' = one SQLite (WAL) cache for every worker on the host, 'memory' = per-process
+FORECAST_CACHE_BACKEND = os.environ.get('FORECAST_CACHE_BACKEND', 'shared')
+FORECAST_CACHE_PATH = os.environ.get('FORECAST_CACHE_PATH', os.path.join(project_root, 'cache', 'forecast_cache.sqlite3'))
+# Candidate artifacts (same layout as MODELS_DIR) scored in the background on a sample of requests.
+SHADOW_MODELS_DIR = os.environ.get('SHADOW_MODELS_DIR')
+SHADOW_SAMPLE_RATE = float(os.environ.get('SHADOW_SAMPLE_RATE', 0.1))
+# ensemble=K requests: upper bound on K, adaptive round size and the standard error (as a
+# probability) below which adaptive ensembles stop drawing members.
+ENSEMBLE_MAX_MEMBERS = int(os.environ.get('ENSEMBLE_MAX_MEMBERS', 256))
+ENSEMBLE_ROUND_SIZE = int(os.environ.get('ENSEMBLE_ROUND_SIZE', 8))
+ENSEMBLE_TOLERANCE = float(os.environ.get('ENSEMBLE_TOLERANCE', 0.01))
+# Integrated-gradients explanations: refinement stops at EXPLAIN_MAX_STEPS or when the next
+# batched pass would exceed the latency budget.
+EXPLAIN_BUDGET_MS = float(os.environ.get('EXPLAIN_BUDGET_MS', 1500))
+EXPLAIN_MAX_STEPS = int(os.environ.get('EXPLAIN_MAX_STEPS', 128))
+EXPLAIN_BATCH_SIZE = int(os.environ.get('EXPLAIN_BATCH_SIZE', 64))
+SCENARIO_MAX = int(os.environ.get('SCENARIO_MAX', 64))
+PREWARM_ENABLED = os.environ.get('PREWARM_ENABLED', '1') == '1'
+PREWARM_INTERVAL_SECONDS = float(os.environ.get('PREWARM_INTERVAL_SECONDS', 600))
+PREWARM_CALENDAR_DAYS = int(os.environ.get('PREWARM_CALENDAR_DAYS', 90))
+# Comma-separated YYYY-MM-DD dates of known events (parades, marathons, ...)
+PREWARM_EVENT_DATES = [d for d in os.environ.get('PREWARM_EVENT_DATES', '').split(',') if d]
+
+
+@asynccontextmanager
+async def lifespan(app):
+    if request_log is not None:
+        request_log.start()
+    if FAST_START:
+        threading.Thread(target=load_default_model, name='model-load', daemon=True).start()
+    threading.Thread(target=restore_rings, name='observations-restore', daemon=True).start()
+    observations.start()
+    if precompute_job is not None:
+        precompute_job.start()
+    if prewarmer is not None:
+        prewarmer.start()
+    reload_manager.start()
+    if shadow is not None:
+        shadow.start()
+    yield
+    if shadow is not None:
+        shadow.stop()
+    reload_manager.stop()
+    observations.stop()
+    if prewarmer is not None:
+        prewarmer.stop()
+    if precompute_job is not None:
+        precompute_job.stop()
+    if request_log is not None:
+        request_log.stop()
+
+
+app = FastAPI(title='Will It Rain On My Parade - NYC', lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -22,124 +151,672 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Load model + artifacts at startup
-try:
-    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    model_path = os.path.join(project_root, "models", "nyc_lstm_model.h5")
-    scaler_path = os.path.join(project_root, "models", "nyc_scaler.gz")
-    encoder_path = os.path.join(project_root, "models", "nyc_label_encoder.gz")
-
-    # Load trained LSTM and preprocessing artifacts
-    model = load_model(model_path)
-    artifacts = joblib.load(scaler_path)
-    le = joblib.load(encoder_path)
-    scaler, time_scaler = artifacts['scaler'], artifacts['time_scaler']
-    seq_features, time_features = artifacts['seq_features'], artifacts['time_features']
-    print("✅ LSTM model and artifacts loaded")
-except Exception as e:
-    print(f"Error loading model: {e}")
-    model = None
+registry = ModelRegistry(MODELS_DIR, max_bytes=int(MODEL_CACHE_MAX_MB * 1024 * 1024))
+
+reload_manager = ReloadManager(registry, GOLDEN_DIR, RELOAD_MIN_GOLDEN_ACCURACY, MODEL_WATCH_INTERVAL_SECONDS)
+
+
+def load_default_model():
+    try:
+        registry.get(DEFAULT_CITY)
+        print("✅ LSTM model and artifacts loaded")
+    except Exception as e:
+        print(f"Error loading model: {e}")
+
+
+# Load the default city's model + artifacts at startup (see FAST_START); other cities load on first use
+if not FAST_START:
+    load_default_model()
 
 class ForecastRequest(BaseModel):
     city: str
     datetime: str
+    ensemble: Optional[int] = None
+    adaptive: bool = False
 
 @app.get('/api/v1/health')
 def health():
     return {'status': 'ok'}
 
-@app.post('/api/v1/forecast')
-def forecast(req: ForecastRequest):
-    if req.city.lower() not in ['new york', 'nyc', 'new york city']:
-        raise HTTPException(status_code=400, detail='Forecasting available for NYC only (Team T-Minus Rain).')
+@app.get('/api/v1/metrics')
+def get_metrics():
+    return metrics.snapshot()
+
+if request_log is not None:
+    metrics.register_collector('request_log', request_log.stats)
+metrics.register_collector('models', registry.stats)
+
+
+def parse_target_time(value):
+    """Naive UTC datetime for a request's datetime string ('now' or ISO 8601, with or without an offset).
+
+    Offsets are resolved here, once, so the cache key, seed, time features and history slice
+    all see the same hour: 15:00-04:00 and 19:00Z are the same forecast.
+    """
+    if value.strip().lower() == 'now':
+        return datetime.now(timezone.utc).replace(tzinfo=None)
     try:
-        target_time = pd.to_datetime(req.datetime)
-    except Exception:
+        target_time = parse_datetime(value)
+    except ValueError:
         raise HTTPException(status_code=400, detail='Invalid datetime format.')
+    if target_time.tzinfo is not None:
+        target_time = target_time.astimezone(timezone.utc).replace(tzinfo=None)
+    return target_time
+
 
-    if model is None:
+def get_bundle(city):
+    try:
+        return registry.get(city)
+    except KeyError:
+        raise HTTPException(status_code=400, detail=f'No forecast model for {city}.')
+    except Exception as e:
+        print(f"Error loading model for {city}: {e}")
         raise HTTPException(status_code=500, detail='Model not loaded')
 
-    # Build inputs to match training pipeline
-    month = target_time.month
-    day_of_year = target_time.timetuple().tm_yday
-    hour = target_time.hour
-    day_of_week = target_time.weekday()
-
-    # Generate a synthetic recent 720-timestep window around the target time
-    # Create raw sequence features in the exact order of seq_features
-    total_steps = 720
-    seq_raw = []  # list of length 720, each is list of 9 features
-    for i in range(total_steps):
-        # simulate a short history leading to the target (older -> newer)
-        offset_hours = (i - (total_steps - 1))  # negative values up to 0
-        hour_i = (hour + offset_hours) % 24
-        day_i = ((day_of_year - (1 if hour + offset_hours < 0 else 0)) - ((total_steps - 1) - i))
-        if day_i <= 0:
-            day_i = (day_i % 365) or 365
-
-        hour_sin = np.sin(2 * np.pi * hour_i / 24)
-        hour_cos = np.cos(2 * np.pi * hour_i / 24)
-        doy_sin = np.sin(2 * np.pi * day_i / 365)
-        doy_cos = np.cos(2 * np.pi * day_i / 365)
-
-        # seasonal/realistic signals for weather variables
-        temp_c = 10 + 20 * np.sin(2 * np.pi * (day_i - 80) / 365) + np.random.normal(0, 0.8)
-        pressure_hpa = 1013 + 10 * np.sin(2 * np.pi * (day_i - 200) / 365) + np.random.normal(0, 2)
-        rain_mmhr = np.random.exponential(0.3) if (month in [3,4,5,9,10,11] and np.random.rand() < 0.15) else 0.0
-        humidity = np.clip(50 + 30 * np.sin(2 * np.pi * (day_i - 120) / 365) + np.random.normal(0, 5), 20, 95)
-        wind_ms = max(0.0, 3 + np.random.normal(0, 1))
-
-        # order must match seq_features from artifacts
-        feature_map = {
-            'temp_c': temp_c,
-            'pressure_hpa': pressure_hpa,
-            'rain_mmhr': rain_mmhr,
-            'humidity': humidity,
-            'wind_ms': wind_ms,
-            'hour_sin': hour_sin,
-            'hour_cos': hour_cos,
-            'doy_sin': doy_sin,
-            'doy_cos': doy_cos,
-        }
-        seq_raw.append([feature_map[name] for name in seq_features])
-
-    seq_raw = np.array(seq_raw)  # (720, 9)
-
-    # Scale sequence features per timestep using the 9-feature scaler
-    seq_scaled = scaler.transform(seq_raw)  # (720, 9)
-
-    # Time/context features for the target time in the exact order of time_features
-    hour_sin_t = np.sin(2 * np.pi * hour / 24)
-    hour_cos_t = np.cos(2 * np.pi * hour / 24)
-    doy_sin_t = np.sin(2 * np.pi * day_of_year / 365)
-    doy_cos_t = np.cos(2 * np.pi * day_of_year / 365)
-
-    time_feature_map = {
-        'hour_sin': hour_sin_t,
-        'hour_cos': hour_cos_t,
-        'doy_sin': doy_sin_t,
-        'doy_cos': doy_cos_t,
-        'month': month,
-        'dayofweek': day_of_week,
+
+def synthesize_window(bundle, target_time, seed=None):
+    """Generate a synthetic recent window (bundle.window steps) ending at target_time.
+
+    Returns the raw sequence features (720, 9) in the exact order of seq_features.
+    A seed (see forecast_keys.key_seed) makes the window reproducible.
+    """
+    seeds = None if seed is None else [seed]
+    return synthesize_windows([target_time], bundle.seq_features, bundle.window, seeds=seeds)[0]
+
+
+def build_time_features(bundle, target_time):
+    """Time/context features for the target time in the exact order of time_features."""
+    return time_feature_rows([target_time], bundle.time_features)[0]  # (6,)
+
+
+def scale_inputs(bundle, seq_raw, time_raw):
+    """Scale raw features and shape them as the model inputs [(1,720,9), (1,6)]."""
+    return bundle.scale_batch(seq_raw[None], time_raw.reshape(1, -1))
+
+
+def predict_batch(bundle, seq_input, time_input):
+    """Run the LSTM on a batch of windows; returns (batch, n_classes) probabilities."""
+    return bundle.predict(seq_input, time_input, batch_size=PREDICT_BATCH_SIZE)
+
+
+history = HistoryWindows(HISTORY_DIR)
+observations = ObservationStore(
+    ObservationLog(OBSERVATIONS_DIR, segment_bytes=int(OBSERVATION_SEGMENT_MB * 1024 * 1024)),
+    history,
+    interval=OBSERVATION_COMPACT_INTERVAL_SECONDS,
+)
+metrics.register_collector('observations', observations.stats)
+odds_indexes = OddsIndexes(history)
+metrics.register_collector('odds', odds_indexes.stats)
+drift = DriftMonitor(DRIFT_WINDOW_SECONDS, DRIFT_BUCKETS, DRIFT_PSI_ALERT, DRIFT_MIN_SAMPLES)
+metrics.register_collector('drift', drift.stats)
+
+
+def restore_rings():
+    """Rebuild the rings of cities with logged observations, so 'now' forecasts use them after a restart."""
+    for city in observations.log.cities():
+        if registry.available(city):
+            try:
+                observations.open(registry.get(city))
+            except Exception as e:
+                print(f"Error restoring observations for {city}: {e}")
+
+
+def live_ring(bundle):
+    """The city's ring, caught up with every worker's posted readings, when it fits this bundle; else None."""
+    ring = observations.live(bundle)
+    if ring is None or ring.steps != bundle.window or ring.seq_features != list(bundle.seq_features):
+        return None
+    return ring
+
+
+def fill_window(bundle, raw, synthetic):
+    """Complete a window with gaps: interpolate short per-channel gaps, then use synthetic values."""
+    weather = [i for i, name in enumerate(bundle.seq_features) if name in WEATHER_CHANNELS]
+    raw = np.array(raw, dtype=np.float32)
+    raw[:, weather], _ = fill_gaps(raw[:, weather], max_gap=WINDOW_INTERPOLATE_HOURS)
+    return np.where(np.isnan(raw), synthetic, raw)
+
+
+def window_inputs(bundle, target_times, record=True):
+    """Raw windows, scaled sequence inputs and window sources for a batch of target times.
+
+    The latest hour is read from the observation ring ('observations'); other windows come
+    from the history store where it has data ('history'), with gaps ('history_partial') or
+    whole windows ('synthetic') filled from the key-seeded synthetic generator. Short gaps
+    are interpolated per channel first. A single complete, pre-scaled window is passed on
+    as is. Pass record=False for work that is not a served request (shadow scoring) so
+    the window_* source counters only count what clients were given.
+    """
+    found, sources = [], []
+    ring = live_ring(bundle)
+    for t in target_times:
+        f = ring.lookup(t) if ring is not None else None
+        if f is not None:
+            sources.append('observations')
+        else:
+            f = history.lookup(bundle, t)
+            sources.append('synthetic' if f is None else 'history_partial' if f[2] is not None else 'history')
+        found.append(f)
+    fill = [i for i, f in enumerate(found) if f is None or f[2] is not None]
+    synthetic = {}
+    if fill:
+        seeds = [key_seed(canonical_key(bundle.city, target_times[i])) for i in fill]
+        windows = synthesize_windows([target_times[i] for i in fill], bundle.seq_features, bundle.window, seeds=seeds)
+        synthetic = dict(zip(fill, windows))
+
+    raws, scaled = [], []
+    for i, f in enumerate(found):
+        if f is None:
+            raws.append(synthetic[i])
+            scaled.append(None)
+        elif f[2] is not None:
+            raws.append(fill_window(bundle, f[0], synthetic[i]))
+            scaled.append(None)
+        else:
+            raws.append(f[0])
+            scaled.append(f[1])
+    if record:
+        for source in sources:
+            metrics.incr(f'window_{source}')
+
+    if len(raws) == 1:
+        seq_raw = raws[0][None]
+        seq_input = scaled[0][None] if scaled[0] is not None else None
+    else:
+        seq_raw = np.stack(raws)
+        seq_input = np.stack(scaled) if all(x is not None for x in scaled) else None
+    if seq_input is None:
+        seq_input = bundle.scale_sequences(seq_raw)
+    return seq_raw, seq_input, sources
+
+
+def forecast_hours(bundle, target_times):
+    """Batched model path: score many target times in one pass; returns (len, n_classes).
+
+    Windows are built exactly as for a live request, so each row matches what it would get.
+    """
+    _, seq_input, _ = window_inputs(bundle, target_times)
+    time_input = bundle.scale_time(time_feature_rows(target_times, bundle.time_features))
+    return predict_batch(bundle, seq_input, time_input)
+
+
+def decode_probabilities(bundle, yhat):
+    """Map one row of class probabilities to (prediction, {label: percent})."""
+    return bundle.decode(yhat)
+
+
+def precompute_default_city(start_hour, hours):
+    bundle = registry.get(DEFAULT_CITY)
+    return forecast_hours(bundle, hourly_slots(start_hour, hours)), bundle.version, bundle.classes
+
+
+def default_city_version():
+    return registry.version(DEFAULT_CITY)
+
+
+forecast_table = precompute_job = None
+if PRECOMPUTE_ENABLED and registry.available(DEFAULT_CITY):
+    forecast_table = ForecastTable(PRECOMPUTE_DIR, DEFAULT_CITY)
+    precompute_job = PrecomputeJob(
+        forecast_table,
+        precompute_default_city,
+        default_city_version,
+        hours=PRECOMPUTE_HOURS,
+        interval=PRECOMPUTE_INTERVAL_SECONDS,
+    )
+    metrics.register_collector('forecast_table', forecast_table.stats)
+
+if FORECAST_CACHE_BACKEND == 'shared':
+    forecast_cache = SharedForecastCache(FORECAST_CACHE_PATH, FORECAST_CACHE_SIZE, FORECAST_CACHE_TTL_SECONDS)
+else:
+    forecast_cache = ForecastCache(FORECAST_CACHE_SIZE, FORECAST_CACHE_TTL_SECONDS)
+metrics.register_collector('forecast_cache', forecast_cache.stats)
+
+prewarmer = None
+if PREWARM_ENABLED and registry.available(DEFAULT_CITY):
+    prewarmer = Prewarmer(
+        forecast_cache,
+        lambda times: forecast_hours(registry.get(DEFAULT_CITY), times),
+        default_city_version,
+        DEFAULT_CITY,
+        log_dir=request_log.directory if request_log is not None else None,
+        calendar_days=PREWARM_CALENDAR_DAYS,
+        event_dates=[datetime.strptime(d, '%Y-%m-%d').date() for d in PREWARM_EVENT_DATES],
+        interval=PREWARM_INTERVAL_SECONDS,
+        skip=(lambda key, when: forecast_table.lookup(when, default_city_version()) is not None)
+        if forecast_table is not None else None,
+        # Workers share the SQLite cache: one of them warming it is enough.
+        lock_path=FORECAST_CACHE_PATH + '.prewarm.lock' if FORECAST_CACHE_BACKEND == 'shared' else None,
+    )
+    metrics.register_collector('prewarm', prewarmer.stats)
+
+
+shadow = None
+if SHADOW_MODELS_DIR and SHADOW_SAMPLE_RATE > 0:
+    shadow = ShadowEvaluator(
+        ModelRegistry(SHADOW_MODELS_DIR, max_bytes=int(MODEL_CACHE_MAX_MB * 1024 * 1024)),
+        partial(window_inputs, record=False),
+        sample_rate=SHADOW_SAMPLE_RATE,
+        log=request_log,
+    )
+    metrics.register_collector('shadow', shadow.stats)
+
+
+def on_model_swap(city, bundle):
+    print(f"🔄 {city} model swapped to version {bundle.version}")
+    if precompute_job is not None and city == DEFAULT_CITY:
+        precompute_job.run_soon()
+    history.drop_scaled(city, bundle.version)
+    ring = observations.ring(city)
+    if ring is not None:
+        if ring.steps == bundle.window and ring.seq_features == list(bundle.seq_features):
+            ring.set_scaler(bundle.scaler)
+        else:
+            observations.open(bundle, rebuild=True)
+
+
+registry.add_listener(on_model_swap)
+metrics.register_collector('model_reloads', reload_manager.status)
+
+
+def forecast_etag(key, model_version):
+    """Strong validator for a deterministic forecast: canonical key + model version."""
+    digest = hashlib.sha1(f"{key}|{model_version}".encode('utf-8')).hexdigest()[:20]
+    return f'"{digest}"'
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    # Weak comparison, as RFC 9110 requires for If-None-Match.
+    return '*' in candidates or any(tag.removeprefix('W/') == etag for tag in candidates)
+
+
+def cache_headers(etag, max_age=FORECAST_MAX_AGE_SECONDS):
+    return {'ETag': etag, 'Cache-Control': f'public, max-age={max_age}'}
+
+
+def resolve_request(city_name, datetime_str):
+    """Validate a forecast request; returns (city, target_time, canonical key)."""
+    city = normalize_city(city_name)
+    if city is None or not registry.available(city):
+        cities = ', '.join(sorted(registry.discover())) or 'none'
+        raise HTTPException(status_code=400, detail=f'Forecasting not available for {city_name} (available: {cities}).')
+    target_time = parse_target_time(datetime_str)
+    return city, target_time, canonical_key(city, target_time)
+
+
+def check_ensemble(members):
+    if members is not None and not 1 <= members <= ENSEMBLE_MAX_MEMBERS:
+        raise HTTPException(status_code=400, detail=f'ensemble must be between 1 and {ENSEMBLE_MAX_MEMBERS}.')
+
+
+def variant_key(key, members, adaptive, observed=None):
+    """Cache-validator key: ensembles are deterministic too, but differ per (K, adaptive).
+
+    Forecasts of the ring's hour, single or ensemble, change with every ingest, so they
+    also carry the ring's reading count.
+    """
+    if members:
+        key = f"{key}|ensemble={members}{'a' if adaptive else ''}"
+    if observed is not None:
+        key = f'{key}|observed={observed}'
+    return key
+
+
+def observed_generation(city, target_time):
+    """Reading count of the ring serving target_time, or None when the forecast doesn't use one."""
+    ring = live_ring(get_bundle(city)) if observations.logged(city) else None
+    return ring.readings if ring is not None and ring.covers(target_time) else None
+
+
+def run_forecast(city_name, datetime_str, city, target_time, key, started, members=None, adaptive=False):
+    if prewarmer is not None:
+        prewarmer.note_request()
+    bundle = get_bundle(city)
+    summary = None
+    if members:
+        engine = 'lstm-ensemble'
+        base = window_inputs(bundle, [target_time])[0][0]
+        yhat, summary = run_ensemble(bundle, base, target_time, key, members, predict_batch, adaptive,
+                                     round_size=ENSEMBLE_ROUND_SIZE, tolerance=ENSEMBLE_TOLERANCE)
+        metrics.observe('ensemble_members', summary['members'])
+    else:
+        engine, yhat = single_forecast(bundle, city, target_time, key)
+    pred, probs = decode_probabilities(bundle, yhat)
+
+    response = {
+        'time': str(target_time),
+        'prediction': pred,
+        'probabilities': probs,
+        'model_version': bundle.version,
     }
-    time_raw = np.array([[time_feature_map[name] for name in time_features]])  # (1,6)
-    time_scaled = time_scaler.transform(time_raw)[0]  # (6,)
+    if summary is not None:
+        response['ensemble'] = summary
+    latency_ms = (time.perf_counter() - started) * 1000
+    metrics.incr('forecasts_served')
+    metrics.observe('forecast_latency_ms', latency_ms)
+    if request_log is not None:
+        request_log.log(forecast_record(city_name, datetime_str, key, engine, latency_ms, response))
+    return response
+
+
+def single_forecast(bundle, city, target_time, key):
+    """One key-seeded draw, from the precomputed table, the cache or the model; returns (engine, yhat)."""
+    engine = ENGINE
+    yhat = seq_raw = time_raw = primary_ms = None
+    # The ring's hour changes with every ingest: neither the table nor the cache can hold it.
+    ring = live_ring(bundle)
+    live = ring is not None and ring.covers(target_time)
+    if not live and forecast_table is not None and city == forecast_table.city:
+        yhat = forecast_table.lookup(target_time, bundle.version)
+    if yhat is not None:
+        engine = 'lstm-table'
+        metrics.incr('precompute_hits')
+    elif not live:
+        yhat = forecast_cache.get(key, bundle.version)
+        if yhat is not None:
+            engine = 'lstm-cache'
+    if yhat is None:
+        # Recent history window (stored observations, synthetic where there are none)
+        seq_raw, seq_input, sources = window_inputs(bundle, [target_time])
+        seq_raw = seq_raw[0]
+        if sources[0] == 'observations':
+            engine = f'{ENGINE}-observations'
+        elif sources[0] != 'synthetic':
+            engine = f'{ENGINE}-history'
+        time_raw = build_time_features(bundle, target_time)
+
+        # Prepare inputs the model expects: [sequence_input, time_input]
+        time_input = bundle.scale_time(time_raw[None])
+
+        inference_started = time.perf_counter()
+        yhat = predict_batch(bundle, seq_input, time_input)[0]
+        primary_ms = (time.perf_counter() - inference_started) * 1000
+        # Generated windows can't drift; only inputs built from stored or live readings are tracked.
+        if sources[0] != 'synthetic':
+            drift.update(bundle, seq_raw[-1], time_raw)
+        if sources[0] != 'observations':
+            forecast_cache.put(key, yhat, bundle.version)
+    if shadow is not None and shadow.sampled(city):
+        shadow.submit(bundle, key, target_time, yhat, seq_raw, time_raw, primary_ms)
+    return engine, yhat
+
+
+@app.post('/api/v1/forecast')
+def forecast(req: ForecastRequest, response: Response):
+    started = time.perf_counter()
+    check_ensemble(req.ensemble)
+    city, target_time, key = resolve_request(req.city, req.datetime)
+    observed = observed_generation(city, target_time)
+    body = run_forecast(req.city, req.datetime, city, target_time, key, started, req.ensemble, req.adaptive)
+    etag_key = variant_key(key, req.ensemble, req.adaptive, observed)
+    response.headers['ETag'] = forecast_etag(etag_key, body['model_version'])
+    return body
 
-    # Prepare inputs the model expects: [sequence_input, time_input]
-    seq_input = seq_scaled.reshape(1, seq_scaled.shape[0], seq_scaled.shape[1]).astype(np.float32)  # (1,720,9)
-    time_input = time_scaled.reshape(1, -1).astype(np.float32)  # (1,6)
 
-    yhat = model.predict([seq_input, time_input])[0]
-    probs = {le.inverse_transform([i])[0]: float(round(p * 100, 2)) for i, p in enumerate(yhat)}
-    pred = le.inverse_transform([np.argmax(yhat)])[0]
+@app.get('/api/v1/forecast')
+def forecast_get(request: Request, city: str, when: str = Query(alias='datetime'),
+                 ensemble: Optional[int] = None, adaptive: bool = False):
+    """Cacheable form of the forecast endpoint: ETag, Cache-Control and If-None-Match -> 304."""
+    started = time.perf_counter()
+    check_ensemble(ensemble)
+    city_slug, target_time, key = resolve_request(city, when)
+    observed = observed_generation(city_slug, target_time)
+    etag_key = variant_key(key, ensemble, adaptive, observed)
+    etag = forecast_etag(etag_key, registry.version(city_slug))
+    # Observed hours change with the next ingest: clients must revalidate every time.
+    max_age = 0 if observed is not None and not ensemble else FORECAST_MAX_AGE_SECONDS
+    headers = cache_headers(etag, max_age)
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        metrics.incr('forecast_not_modified')
+        return Response(status_code=304, headers=headers)
+    body = run_forecast(city, when, city_slug, target_time, key, started, ensemble, adaptive)
+    served_etag = forecast_etag(etag_key, body['model_version'])
+    if served_etag != etag:
+        # The model was swapped mid-request; describe what was actually served.
+        headers = cache_headers(served_etag, max_age)
+    return JSONResponse(content=body, headers=headers)
+
+
+def parse_odds_date(value):
+    """(leap-year day index, hour or None) from 'MM-DD' or a date/datetime (its year is ignored)."""
+    match = re.fullmatch(r'\s*(\d{1,2})-(\d{1,2})\s*', value)
+    try:
+        if match:
+            when = datetime(2000, int(match.group(1)), int(match.group(2)))  # a leap year, so 02-29 is valid
+            return (when - datetime(2000, 1, 1)).days, None
+        when = parse_datetime(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail='Invalid date; use MM-DD or YYYY-MM-DD[THH:MM].')
+    day = int(leap_day_index(np.array([when.strftime('%Y-%m-%dT%H')], dtype='datetime64[h]'))[0])
+    return day, when.hour if re.search(r'[T ]\d', value.strip()) else None
+
+
+def parse_hour_range(value):
+    """'H' or 'H-H' (inclusive, may wrap past midnight) -> (first, last)."""
+    match = re.fullmatch(r'\s*(\d{1,2})\s*(?:-\s*(\d{1,2})\s*)?', value)
+    if not match or not all(int(h) < 24 for h in match.groups() if h is not None):
+        raise HTTPException(status_code=400, detail='Invalid hours; use H or H-H with hours 0-23.')
+    first = int(match.group(1))
+    return first, int(match.group(2)) if match.group(2) is not None else first
+
+
+@app.get('/api/v1/odds')
+def odds(city: str, date: str, days: int = 0, hours: Optional[str] = None, rain: Optional[float] = None,
+         temp: Optional[float] = None, wind: Optional[float] = None):
+    """Share of past years (and hours) reaching rain/temperature/wind levels around a date and hour range.
+
+    Without any threshold the odds of measurable rain (labels.LIGHT_RAIN_MMHR) are returned.
+    """
+    started = time.perf_counter()
+    slug = normalize_city(city)
+    if not 0 <= days <= 183:
+        raise HTTPException(status_code=400, detail='days must be between 0 and 183.')
+    day, hour = parse_odds_date(date)
+    hour_range = parse_hour_range(hours) if hours is not None else (hour, hour) if hour is not None else (0, 23)
+    index = odds_indexes.get(slug) if slug is not None else None
+    if index is None:
+        raise HTTPException(status_code=404, detail=f'No stored history for {city}.')
+    thresholds = {name: value for name, value in (('rain_mmhr', rain), ('temp_c', temp), ('wind_ms', wind))
+                  if value is not None}
+    if not thresholds:
+        thresholds = {'rain_mmhr': LIGHT_RAIN_MMHR}
+    result = index.query(day, days, hour_range, thresholds)
+    when = datetime(2000, 1, 1) + timedelta(days=day)
+    metrics.incr('odds_requests')
+    metrics.observe('odds_latency_ms', (time.perf_counter() - started) * 1000)
+    return {'city': slug, 'date': when.strftime('%m-%d'), 'days': days, 'hours': list(hour_range), **result}
+
+
+class Perturbation(BaseModel):
+    feature: str
+    op: str
+    value: float
+    hours: Optional[int] = None
+    end_hours_ago: int = 0
+
+
+class Scenario(BaseModel):
+    name: Optional[str] = None
+    perturbations: List[Perturbation]
+
+
+class ScenarioRequest(BaseModel):
+    city: str
+    datetime: str
+    scenarios: List[Scenario]
+
 
+@app.post('/api/v1/scenario')
+def scenario(req: ScenarioRequest):
+    """Score what-if perturbations of the recent history; scenarios share one base window and one batch."""
+    started = time.perf_counter()
+    if not 1 <= len(req.scenarios) <= SCENARIO_MAX:
+        raise HTTPException(status_code=400, detail=f'Between 1 and {SCENARIO_MAX} scenarios are allowed.')
+    city, target_time, key = resolve_request(req.city, req.datetime)
+    bundle = get_bundle(city)
+    base = window_inputs(bundle, [target_time])[0][0]
+    try:
+        windows = apply_scenarios(base, [[p.model_dump() for p in sc.perturbations] for sc in req.scenarios],
+                                  bundle.seq_features)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f'Invalid scenario: {e}')
+
+    # Row 0 is the unperturbed baseline.
+    seq_raw = np.concatenate([base[None], windows])
+    time_raw = np.repeat(build_time_features(bundle, target_time)[None], len(seq_raw), axis=0)
+    yhat = predict_batch(bundle, *bundle.scale_batch(seq_raw, time_raw))
+
+    pred, base_probs = decode_probabilities(bundle, yhat[0])
+    results = []
+    for i, (sc, row) in enumerate(zip(req.scenarios, yhat[1:])):
+        sc_pred, probs = decode_probabilities(bundle, row)
+        results.append({
+            'name': sc.name or f'scenario_{i + 1}',
+            'prediction': sc_pred,
+            'probabilities': probs,
+            'delta': {label: round(probs[label] - base_probs[label], 2) for label in probs},
+        })
+    metrics.incr('scenario_requests')
+    metrics.observe('scenario_batch', len(results))
+    metrics.observe('scenario_latency_ms', (time.perf_counter() - started) * 1000)
     return {
         'time': str(target_time),
+        'model_version': bundle.version,
+        'baseline': {'prediction': pred, 'probabilities': base_probs},
+        'scenarios': results,
+    }
+
+
+class ExplainRequest(BaseModel):
+    city: str
+    datetime: str
+    target: Optional[str] = None  # class to explain; defaults to the predicted one
+    method: str = 'ig'
+    resolution_hours: int = 24
+    budget_ms: Optional[float] = None
+
+
+@app.post('/api/v1/explain')
+def explain(req: ExplainRequest):
+    """Which hours and channels of the history window drove the forecast (integrated gradients)."""
+    started = time.perf_counter()
+    city, target_time, key = resolve_request(req.city, req.datetime)
+    bundle = get_bundle(city)
+    if req.target is not None and req.target not in bundle.classes:
+        raise HTTPException(status_code=400, detail=f"Unknown class {req.target} (expected one of {', '.join(bundle.classes)}).")
+    if not 1 <= req.resolution_hours <= bundle.window:
+        raise HTTPException(status_code=400, detail=f'resolution_hours must be between 1 and {bundle.window}.')
+    budget_ms = min(req.budget_ms or EXPLAIN_BUDGET_MS, EXPLAIN_BUDGET_MS)
+
+    _, seq_input, _ = window_inputs(bundle, [target_time])
+    time_input = bundle.scale_time(build_time_features(bundle, target_time)[None])
+    yhat = predict_batch(bundle, seq_input, time_input)[0]
+    pred, probs = decode_probabilities(bundle, yhat)
+    target = req.target or pred
+    try:
+        seq_attr, time_attr, info = integrated_gradients(
+            bundle.model, seq_input, time_input, bundle.classes.index(target),
+            max_steps=EXPLAIN_MAX_STEPS, budget_ms=budget_ms, batch_size=EXPLAIN_BATCH_SIZE, method=req.method)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Report in probability percentage points, like the probabilities themselves.
+    def pct(values):
+        return {name: round(float(v) * 100, 4) for name, v in zip(bundle.seq_features, values)}
+
+    metrics.observe('explain_steps', info['steps'])
+    metrics.observe('explain_latency_ms', (time.perf_counter() - started) * 1000)
+    return {
+        'time': str(target_time),
+        'model_version': bundle.version,
         'prediction': pred,
-        'probabilities': probs
+        'probabilities': probs,
+        'target': target,
+        'method': info.pop('method'),
+        'details': info,
+        'features': pct(seq_attr.sum(axis=0)),
+        'time_features': {name: round(float(v) * 100, 4) for name, v in zip(bundle.time_features, time_attr)},
+        'resolution_hours': req.resolution_hours,
+        'blocks': [
+            {'start_hours_ago': start, 'end_hours_ago': end, 'features': pct(values)}
+            for start, end, values in aggregate(seq_attr, req.resolution_hours)
+        ],
+    }
+
+
+def ingest_observations(city, text, content_type):
+    rows = parse_body(text, content_type)
+    if len(rows) > OBSERVATION_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f'At most {OBSERVATION_MAX_ROWS} observations per request.')
+    records, errors = validate(rows)
+    if len(records) == 0:
+        raise HTTPException(status_code=400, detail={'message': 'No valid observations.', 'errors': errors[:20]})
+    ring = observations.open(get_bundle(city))
+    # Durable before acknowledged: a restart replays the log into the ring.
+    in_window = observations.ingest(city, records)
+    metrics.incr('observations_accepted', len(records))
+    metrics.incr('observations_rejected', len(errors))
+    return {
+        'city': city,
+        'accepted': len(records),
+        'rejected': len(errors),
+        'errors': errors[:20],
+        'in_window': in_window,
+        'last_hour': ring.stats()['last_hour'],
     }
 
+
+@app.post('/api/v1/observations')
+async def post_observations(request: Request, city: str, x_admin_token: Optional[str] = Header(None)):
+    """Bulk-ingest station readings (NDJSON, or CSV with a 'time,...' header) for one city.
+
+    Readings are durable when this returns, and every worker's next forecast for the city uses
+    them: workers read each other's logs on lookup (see ObservationStore.live).
+    """
+    check_admin(x_admin_token)
+    slug = normalize_city(city)
+    if slug is None or not registry.available(slug):
+        raise HTTPException(status_code=404, detail=f'No forecast model for {city}.')
+    body = await request.body()
+    try:
+        text = body.decode('utf-8')
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail='Body must be UTF-8 text.')
+    return await run_in_threadpool(ingest_observations, slug, text, request.headers.get('content-type', ''))
+
+
+class ReloadRequest(BaseModel):
+    city: str = DEFAULT_CITY
+
+
+def check_admin(token):
+    if ADMIN_TOKEN and token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail='Admin token required.')
+
+
+@app.post('/api/v1/admin/reload', status_code=202)
+def admin_reload(req: ReloadRequest, x_admin_token: Optional[str] = Header(None)):
+    """Load, warm up and validate the city's artifacts in the background, then swap them in."""
+    check_admin(x_admin_token)
+    city = normalize_city(req.city)
+    try:
+        if city is None:
+            raise KeyError(req.city)
+        return reload_manager.request(city)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f'No model artifacts for {req.city}.')
+
+
+@app.get('/api/v1/admin/reload')
+def admin_reload_status(x_admin_token: Optional[str] = Header(None)):
+    check_admin(x_admin_token)
+    return reload_manager.status()
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,71 @@
+"""Process-local counters, gauges and latency summaries for /api/v1/metrics."""
+import threading
+from collections import deque
+
+
+class Metrics:
+    def __init__(self, window=2048):
+        self._lock = threading.Lock()
+        self._window = window
+        self._counters = {}
+        self._gauges = {}
+        self._timings = {}
+        self._collectors = {}
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name, value):
+        """Record one sample (e.g. a latency in ms); keeps totals plus a recent window for percentiles."""
+        with self._lock:
+            t = self._timings.get(name)
+            if t is None:
+                t = self._timings[name] = {'count': 0, 'sum': 0.0, 'min': value, 'max': value,
+                                           'recent': deque(maxlen=self._window)}
+            t['count'] += 1
+            t['sum'] += value
+            t['min'] = min(t['min'], value)
+            t['max'] = max(t['max'], value)
+            t['recent'].append(value)
+
+    def register_collector(self, name, fn):
+        """Add a callable whose dict result is included under ``name`` in every snapshot."""
+        with self._lock:
+            self._collectors[name] = fn
+
+    def counter(self, name):
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            timings = {name: _summarize(t) for name, t in self._timings.items()}
+            collectors = dict(self._collectors)
+        out = {'counters': counters, 'gauges': gauges, 'timings': timings}
+        for name, fn in collectors.items():
+            out[name] = fn()
+        return out
+
+
+def _summarize(t):
+    recent = sorted(t['recent'])
+    n = len(recent)
+    return {
+        'count': t['count'],
+        'mean': t['sum'] / t['count'] if t['count'] else 0.0,
+        'min': t['min'],
+        'max': t['max'],
+        'p50': recent[n // 2] if n else 0.0,
+        'p95': recent[min(n - 1, int(n * 0.95))] if n else 0.0,
+        'p99': recent[min(n - 1, int(n * 0.99))] if n else 0.0,
+    }
+
+
+metrics = Metrics()
@@ -0,0 +1,319 @@
+"""Per-city model bundles, discovered by naming convention and loaded lazily.
+
+A city ``<city>`` is servable when ``models/`` contains
+
+    <city>_lstm_model.h5    trained Keras model
+    <city>_scaler.gz        {'scaler', 'time_scaler', 'seq_features', 'time_features'[, 'drift_reference']}
+    <city>_label_encoder.gz fitted LabelEncoder
+
+Bundles are loaded on first use, warmed up, and kept in an LRU bounded by an
+estimate of their in-memory size; load and eviction latencies go to metrics.
+``reload(city)`` swaps in a freshly loaded bundle atomically: requests that
+already fetched the old bundle finish on it, new requests get the new one.
+"""
+import gc
+import glob
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from metrics import metrics
+
+MODEL_SUFFIX = '_lstm_model.h5'
+SCALER_SUFFIX = '_scaler.gz'
+ENCODER_SUFFIX = '_label_encoder.gz'
+
+
+@dataclass(frozen=True)
+class ArtifactPaths:
+    city: str
+    model: str
+    scaler: str
+    encoder: str
+
+    def all(self):
+        return (self.model, self.scaler, self.encoder)
+
+    def signature(self):
+        """Cheap change detector: (mtime_ns, size) of every artifact file."""
+        sig = []
+        for path in self.all():
+            st = os.stat(path)
+            sig.append((st.st_mtime_ns, st.st_size))
+        return tuple(sig)
+
+
+def artifact_paths(models_dir, city):
+    return ArtifactPaths(
+        city=city,
+        model=os.path.join(models_dir, city + MODEL_SUFFIX),
+        scaler=os.path.join(models_dir, city + SCALER_SUFFIX),
+        encoder=os.path.join(models_dir, city + ENCODER_SUFFIX),
+    )
+
+
+def artifact_version(paths):
+    """Short content hash of the artifact files, used as the model version."""
+    digest = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+@dataclass
+class ModelBundle:
+    city: str
+    model: object
+    scaler: object
+    time_scaler: object
+    seq_features: list
+    time_features: list
+    label_encoder: object
+    version: str
+    paths: ArtifactPaths
+    drift_reference: object = None  # training histogram of the scaled seq_features, see drift.py
+    classes: list = field(init=False)
+    window: int = field(init=False)
+    nbytes: int = field(init=False)
+
+    def __post_init__(self):
+        self.classes = [str(c) for c in self.label_encoder.classes_]
+        self.window = int(self.model.inputs[0].shape[1])
+        self.nbytes = estimate_nbytes(self)
+
+    def scale_batch(self, seq_raw, time_raw):
+        """Scale raw (B,steps,9) / (B,6) features into float32 model inputs."""
+        return self.scale_sequences(seq_raw), self.scale_time(time_raw)
+
+    def scale_sequences(self, seq_raw):
+        batch, steps, n_features = seq_raw.shape
+        seq_scaled = self.scaler.transform(seq_raw.reshape(-1, n_features)).reshape(batch, steps, n_features)
+        return seq_scaled.astype(np.float32)
+
+    def scale_time(self, time_raw):
+        return self.time_scaler.transform(time_raw).astype(np.float32)
+
+    def predict(self, seq_input, time_input, batch_size=128):
+        """(batch, n_classes) class probabilities."""
+        return self.model.predict([seq_input, time_input], batch_size=batch_size, verbose=0)
+
+    def warm_up(self):
+        """Run one dummy batch so graph tracing happens before the bundle serves traffic."""
+        seq = np.zeros((1, self.window, len(self.seq_features)), dtype=np.float32)
+        tim = np.zeros((1, len(self.time_features)), dtype=np.float32)
+        started = time.perf_counter()
+        self.predict(seq, tim)
+        return (time.perf_counter() - started) * 1000
+
+    def decode(self, yhat):
+        """Map one row of class probabilities to (prediction, {label: percent})."""
+        probs = {label: float(round(p * 100, 2)) for label, p in zip(self.classes, yhat)}
+        return self.classes[int(np.argmax(yhat))], probs
+
+
+def estimate_nbytes(bundle):
+    """Weights as float32 plus the scaler arrays; TensorFlow's own overhead is not counted."""
+    total = bundle.model.count_params() * 4
+    for sc in (bundle.scaler, bundle.time_scaler):
+        for attr in ('mean_', 'scale_', 'var_'):
+            arr = getattr(sc, attr, None)
+            if arr is not None:
+                total += arr.nbytes
+    return total
+
+
+def load_bundle(paths, version=None):
+    import joblib
+    from tensorflow.keras.models import load_model
+
+    model = load_model(paths.model)
+    artifacts = joblib.load(paths.scaler)
+    le = joblib.load(paths.encoder)
+    return ModelBundle(
+        city=paths.city,
+        model=model,
+        scaler=artifacts['scaler'],
+        time_scaler=artifacts['time_scaler'],
+        seq_features=list(artifacts['seq_features']),
+        time_features=list(artifacts['time_features']),
+        label_encoder=le,
+        version=version or artifact_version(paths.all()),
+        paths=paths,
+        drift_reference=artifacts.get('drift_reference'),
+    )
+
+
+class ModelRegistry:
+    def __init__(self, models_dir, max_bytes=512 * 1024 * 1024, loader=load_bundle):
+        self.models_dir = models_dir
+        self.max_bytes = max_bytes
+        self.loader = loader
+        self._lock = threading.Lock()
+        self._loaded = OrderedDict()  # city -> ModelBundle, least recently used first
+        self._load_locks = {}
+        self._versions = {}  # city -> (signature, version) of the files on disk
+        self._signatures = {}  # city -> signature of the files the loaded bundle came from
+        self._listeners = []
+        self.loads = 0
+        self.evictions = 0
+        self.reloads = 0
+
+    def discover(self):
+        """{city: ArtifactPaths} for every complete artifact set in models_dir."""
+        found = {}
+        for model_path in glob.glob(os.path.join(self.models_dir, '*' + MODEL_SUFFIX)):
+            city = os.path.basename(model_path)[:-len(MODEL_SUFFIX)]
+            paths = artifact_paths(self.models_dir, city)
+            if all(os.path.exists(p) for p in paths.all()):
+                found[city] = paths
+        return found
+
+    def available(self, city):
+        return all(os.path.exists(p) for p in artifact_paths(self.models_dir, city).all())
+
+    def add_listener(self, fn):
+        """Call ``fn(city, bundle)`` after a bundle is swapped in by reload()."""
+        self._listeners.append(fn)
+
+    def version(self, city):
+        """Version that a request for city will be served with, without loading the model.
+
+        That is the loaded bundle's version, or else the content hash of the artifacts on
+        disk (cached by mtime/size).
+        """
+        bundle = self._loaded.get(city)
+        if bundle is not None:
+            return bundle.version
+        return self.disk_version(city)
+
+    def disk_version(self, city):
+        paths = artifact_paths(self.models_dir, city)
+        sig = paths.signature()
+        cached = self._versions.get(city)
+        if cached is not None and cached[0] == sig:
+            return cached[1]
+        version = artifact_version(paths.all())
+        self._versions[city] = (sig, version)
+        return version
+
+    def get(self, city):
+        """Loaded bundle for city, loading it on first use. Raises KeyError if there are no artifacts."""
+        with self._lock:
+            bundle = self._loaded.get(city)
+            if bundle is not None:
+                self._loaded.move_to_end(city)
+                return bundle
+            load_lock = self._load_locks.setdefault(city, threading.Lock())
+        with load_lock:
+            # Another thread may have finished loading while we waited.
+            with self._lock:
+                bundle = self._loaded.get(city)
+                if bundle is not None:
+                    self._loaded.move_to_end(city)
+                    return bundle
+            if not self.available(city):
+                raise KeyError(city)
+            bundle, signature = self._load(city)
+            with self._lock:
+                self._loaded[city] = bundle
+                self._signatures[city] = signature
+                self.loads += 1
+                evicted = self._evict_over_budget(keep=city)
+            self._collect(evicted)
+            return bundle
+
+    def _load(self, city):
+        paths = artifact_paths(self.models_dir, city)
+        signature = paths.signature()
+        started = time.perf_counter()
+        bundle = self.loader(paths, self.disk_version(city))
+        warm_ms = bundle.warm_up()
+        metrics.observe('model_load_ms', (time.perf_counter() - started) * 1000)
+        metrics.observe('model_warmup_ms', warm_ms)
+        metrics.incr('model_loads')
+        return bundle, signature
+
+    def reload(self, city, validate=None):
+        """Load, warm up and validate the artifacts on disk, then swap them in atomically.
+
+        ``validate(new_bundle, old_bundle)`` may raise to reject the candidate; the
+        currently served bundle is left untouched in that case.
+        """
+        if not self.available(city):
+            raise KeyError(city)
+        with self._lock:
+            load_lock = self._load_locks.setdefault(city, threading.Lock())
+        with load_lock:
+            bundle, signature = self._load(city)
+            old = self._loaded.get(city)
+            if validate is not None:
+                validate(bundle, old)
+            with self._lock:
+                self._loaded[city] = bundle
+                self._loaded.move_to_end(city)
+                self._signatures[city] = signature
+                self.reloads += 1
+                evicted = self._evict_over_budget(keep=city)
+        self._collect(evicted)
+        metrics.incr('model_reloads')
+        for fn in self._listeners:
+            fn(city, bundle)
+        return bundle
+
+    def loaded_signature(self, city):
+        return self._signatures.get(city)
+
+    def _evict_over_budget(self, keep):
+        """Drop least recently used bundles until under budget; call with the lock held.
+
+        Returns how many were dropped; the caller collects them after releasing the lock.
+        """
+        evicted = 0
+        while self._total_bytes() > self.max_bytes and len(self._loaded) > 1:
+            city = next(iter(self._loaded))
+            if city == keep:
+                break
+            # In-flight requests still hold their reference; memory is freed when they finish.
+            del self._loaded[city]
+            self.evictions += 1
+            evicted += 1
+        return evicted
+
+    def _collect(self, evicted):
+        """Free evicted bundles' graphs outside the lock, so lookups don't wait on gc."""
+        if not evicted:
+            return
+        started = time.perf_counter()
+        gc.collect()
+        metrics.observe('model_evict_ms', (time.perf_counter() - started) * 1000)
+        metrics.incr('model_evictions', evicted)
+
+    def _total_bytes(self):
+        return sum(b.nbytes for b in self._loaded.values())
+
+    def loaded(self):
+        with self._lock:
+            return list(self._loaded)
+
+    def stats(self):
+        with self._lock:
+            loaded = {city: {'version': b.version, 'nbytes': b.nbytes, 'window': b.window}
+                      for city, b in self._loaded.items()}
+            total = self._total_bytes()
+        return {
+            'models_dir': self.models_dir,
+            'available': sorted(self.discover()),
+            'loaded': loaded,
+            'loaded_bytes': total,
+            'max_bytes': self.max_bytes,
+            'loads': self.loads,
+            'evictions': self.evictions,
+            'reloads': self.reloads,
+        }
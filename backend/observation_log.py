@@ -0,0 +1,292 @@
+"""Append-only, fixed-width binary write-ahead log of ingested observations.
+
+Layout under ``<dir>/``:
+
+    worker-<n>.lock             flock held by the process writing slot n
+    <city>/compact.lock         flock serializing compaction of the city (see observation_store.py)
+    <city>/folded.npz           compacted per-hour sums and counts, and each slot's commit mark
+    <city>/w<n>/<seq>.obs       slot n's log segments in write order; the highest-numbered one is active
+
+Each uvicorn worker keeps its own rings, so each writes its own segments: on
+first use a process claims the lowest slot whose lock no live process holds
+and keeps it until it exits. A slot has exactly one writer, and a process
+only seals or deletes its own slot's segments, so no worker can remove a
+segment another is still appending to. Rings are rebuilt from every slot's
+unfolded segments, so it doesn't matter which slot a restarted worker gets;
+slots left over when fewer workers come back are adopted by the compactor.
+
+Every record is 28 bytes:
+
+    int64   ts       reading time, seconds since the epoch (UTC)
+    float32 values   one per WEATHER_CHANNELS entry, NaN where not reported
+
+Fixed-width records let a segment be read with one ``np.fromfile`` call and
+located by byte offset, with no parsing. Appends are durable before they
+return, but concurrent appends share fsyncs (group commit): a writer waits
+for an fsync that covers its bytes, and whoever syncs first covers everyone
+who wrote before it. Segments are sealed at ``segment_bytes`` or by
+``rotate``; sealed segments are only read or deleted, never written again.
+"""
+import fcntl
+import os
+import threading
+
+import numpy as np
+
+from history_store import WEATHER_CHANNELS
+
+RECORD = np.dtype([('ts', '<i8'), ('values', '<f4', (len(WEATHER_CHANNELS),))])
+
+
+class _Active:
+    """The open segment of one city plus its group-commit counters (bytes since open)."""
+
+    def __init__(self, seq, fd, size):
+        self.seq = seq
+        self.fd = fd
+        self.size = size
+        self.written = 0
+        self.synced = 0
+
+
+class ObservationLog:
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024, max_workers=64):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_workers = max_workers
+        self._claimed = None  # (pid, slot, locked file) of this process's slot
+        self._claim_lock = threading.Lock()
+        self._lock = threading.Lock()  # writes, rotation and the active segments
+        self._sync_lock = threading.Lock()  # one fsync at a time; the others wait and usually ride along
+        self._active = {}  # city -> _Active
+        self.appended = 0
+        self.fsyncs = 0
+        self.shared_syncs = 0
+
+    # -- worker slots --------------------------------------------------------
+
+    def _slot_lock_path(self, slot):
+        return os.path.join(self.directory, f'worker-{slot}.lock')
+
+    def try_claim(self, slot):
+        """The flocked lock file of slot, or None if a live process holds it."""
+        os.makedirs(self.directory, exist_ok=True)
+        lock = open(self._slot_lock_path(slot), 'w')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            return None
+        return lock
+
+    @property
+    def worker(self):
+        """This process's slot, claimed on first use (and again in a forked child)."""
+        claimed = self._claimed
+        if claimed is None or claimed[0] != os.getpid():
+            with self._claim_lock:
+                claimed = self._claimed
+                if claimed is None or claimed[0] != os.getpid():
+                    self._active = {}  # a forked child must not append through its parent's descriptors
+                    for slot in range(self.max_workers):
+                        lock = self.try_claim(slot)
+                        if lock is not None:
+                            claimed = self._claimed = (os.getpid(), slot, lock)
+                            break
+                    else:
+                        raise RuntimeError(f'all {self.max_workers} observation log slots under '
+                                           f'{self.directory} are held by live workers')
+        return claimed[1]
+
+    def workers(self, city):
+        """Slots that have a directory for the city."""
+        try:
+            names = os.listdir(self.city_dir(city))
+        except FileNotFoundError:
+            return []
+        return sorted(int(name[1:]) for name in names if name.startswith('w') and name[1:].isdigit())
+
+    # -- paths ---------------------------------------------------------------
+
+    def city_dir(self, city):
+        return os.path.join(self.directory, city)
+
+    def worker_dir(self, city, worker=None):
+        """Directory of the city's segments written by slot worker (default: this process's)."""
+        return os.path.join(self.city_dir(city), f'w{self.worker if worker is None else worker}')
+
+    def _segment_path(self, city, seq, worker=None):
+        return os.path.join(self.worker_dir(city, worker), f'{seq:010d}.obs')
+
+    def segments(self, city, worker=None):
+        """Sequence numbers of the city's segments in a slot (default: this process's), oldest first."""
+        try:
+            names = os.listdir(self.worker_dir(city, worker))
+        except FileNotFoundError:
+            return []
+        return sorted(int(name[:-4]) for name in names if name.endswith('.obs') and name[:-4].isdigit())
+
+    def cities(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(name for name in names if os.path.isdir(self.city_dir(name)))
+
+    def _open(self, city, seq):
+        os.makedirs(self.worker_dir(city), exist_ok=True)
+        fd = os.open(self._segment_path(city, seq), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        size = os.fstat(fd).st_size
+        # Drop a partial record left by a crash mid-write so later records stay aligned.
+        if size % RECORD.itemsize:
+            size -= size % RECORD.itemsize
+            os.ftruncate(fd, size)
+        return _Active(seq, fd, size)
+
+    def _active_segment(self, city):
+        active = self._active.get(city)
+        if active is None:
+            existing = self.segments(city)
+            active = self._active[city] = self._open(city, existing[-1] if existing else 0)
+        return active
+
+    def _seal(self, city, active):
+        os.fsync(active.fd)
+        os.close(active.fd)
+        sealed = self._open(city, active.seq + 1)
+        sealed.written = sealed.synced = active.written
+        self._active[city] = sealed
+        return sealed
+
+    def append(self, city, records):
+        """Durably append a RECORD array; returns the number of records written."""
+        self.sync(city, self.write(city, records))
+        return len(records)
+
+    def write(self, city, records):
+        """Append a RECORD array without waiting for the disk; returns the mark to pass to sync."""
+        data = np.ascontiguousarray(records, dtype=RECORD).tobytes()
+        with self._lock:
+            active = self._active_segment(city)
+            if not data:
+                return active.written
+            if active.size and active.size + len(data) > self.segment_bytes:
+                active = self._seal(city, active)
+            os.write(active.fd, data)
+            active.size += len(data)
+            active.written += len(data)
+            self.appended += len(records)
+            return active.written
+
+    def sync(self, city, mark):
+        """Return once everything up to byte mark of the city's log is on disk."""
+        with self._sync_lock:
+            with self._lock:
+                active = self._active[city]
+                if active.synced >= mark:
+                    self.shared_syncs += 1
+                    return
+                # A duplicate stays valid even if the segment is sealed while we sync.
+                fd, target = os.dup(active.fd), active.written
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            with self._lock:
+                active = self._active[city]
+                active.synced = max(active.synced, target)
+                self.fsyncs += 1
+
+    def rotate(self, city, worker=None):
+        """Seal the active segment; returns the new active sequence number (all older ones are sealed).
+
+        For another slot (an orphan whose lock the caller holds, see try_claim) this starts an empty
+        segment after its last one, so whoever claims the slot next keeps numbering from there.
+        """
+        if worker is not None and worker != self.worker:
+            existing = self.segments(city, worker)
+            if existing and not os.path.getsize(self._segment_path(city, existing[-1], worker)):
+                return existing[-1]
+            seq = existing[-1] + 1 if existing else 0
+            os.makedirs(self.worker_dir(city, worker), exist_ok=True)
+            os.close(os.open(self._segment_path(city, seq, worker), os.O_WRONLY | os.O_CREAT, 0o644))
+            return seq
+        with self._lock:
+            active = self._active_segment(city)
+            if active.size:
+                active = self._seal(city, active)
+            return active.seq
+
+    def read(self, city, since_ts=None, first_segment=0, end_segment=None, worker=None):
+        """Records of segments first_segment <= seq < end_segment (optionally ts >= since_ts), in log order."""
+        parts = []
+        for seq in self.segments(city, worker):
+            if seq < first_segment or (end_segment is not None and seq >= end_segment):
+                continue
+            path = self._segment_path(city, seq, worker)
+            # A crash mid-write can leave a partial record at the end; ignore it.
+            parts.append(np.fromfile(path, dtype=RECORD, count=os.path.getsize(path) // RECORD.itemsize))
+        records = np.concatenate(parts) if parts else np.empty(0, dtype=RECORD)
+        if since_ts is not None:
+            records = records[records['ts'] >= since_ts]
+        return records
+
+    def tail(self, city, position=(0, 0), worker=None):
+        """(records, position): what a slot appended after position, a (seq, byte offset) it returned before.
+
+        Records are None when segment seq was deleted (compacted) in the meantime, so whatever it
+        held after offset can no longer be read from the log.
+        """
+        seq, offset = position
+        try:
+            existing = self.segments(city, worker)
+            if seq not in existing:
+                return (None, position) if existing and existing[-1] > seq else (np.empty(0, dtype=RECORD), position)
+            parts = []
+            for current in existing[existing.index(seq):]:
+                start = offset if current == seq else 0
+                path = self._segment_path(city, current, worker)
+                end = os.path.getsize(path) // RECORD.itemsize * RECORD.itemsize
+                parts.append(np.fromfile(path, dtype=RECORD, count=(end - start) // RECORD.itemsize, offset=start))
+                position = (current, end)
+        except FileNotFoundError:
+            return None, (seq, offset)
+        return np.concatenate(parts), position
+
+    def delete_segments(self, city, below, worker=None):
+        """Remove sealed segments with seq < below (after compaction made them redundant).
+
+        Only this process's slot, or an orphaned slot whose lock the caller holds (see try_claim).
+        """
+        removed = 0
+        own = worker is None or worker == self.worker
+        with self._lock:
+            active = self._active.get(city) if own else None
+            for seq in self.segments(city, worker):
+                if seq < below and (active is None or seq != active.seq):
+                    os.remove(self._segment_path(city, seq, worker))
+                    removed += 1
+        return removed
+
+    def close(self):
+        """Sync and close the active segments and release the worker slot (reclaimed on next use)."""
+        with self._lock:
+            for active in self._active.values():
+                os.fsync(active.fd)
+                os.close(active.fd)
+            self._active.clear()
+        with self._claim_lock:
+            if self._claimed is not None and self._claimed[0] == os.getpid():
+                self._claimed[2].close()
+            self._claimed = None
+
+    def stats(self):
+        cities = self.cities()
+        return {
+            'directory': self.directory,
+            'worker': self._claimed[1] if self._claimed is not None else None,
+            'appended': self.appended,
+            'fsyncs': self.fsyncs,
+            'shared_syncs': self.shared_syncs,
+            'segments': {city: len(self.segments(city)) for city in cities},
+        }
@@ -0,0 +1,312 @@
+"""Posted observations: per-city rings, their write-ahead log and compaction.
+
+Ingest writes a batch to the log and folds it into the city's ring under one
+per-city lock, so a ring always reflects exactly the records in the log (the
+fsync happens after the lock is released, so concurrent batches share it).
+Each worker process has its own rings and logs to its own slot (see
+observation_log.py). The city's compacted state is one file shared by all
+slots, ``<city>/folded.npz``: per-hour reading sums and counts per channel
+for the hours still inside the ring window, and per slot the first segment
+not folded yet (the commit marks). Every ``interval`` seconds the compactor,
+for each city with a ring:
+
+1. seals its active segment under that lock;
+2. reads its sealed segments from its mark on and adds their per-hour sums
+   and counts to the folded ones, so an hour reported through several
+   workers (or several compactions) gets the mean of all its readings;
+3. writes those means to the history store, channel by channel, keeping
+   stored values where a channel was not reported (hours older than the
+   window take the mean of the records being folded);
+4. writes ``folded.npz`` atomically with the new mark (the commit point),
+   dropping hours that have left the window;
+5. deletes the sealed segments.
+
+Steps 2-5 hold the city's ``compact.lock`` flock, so compactors of several
+workers never fold at the same time. Under the same lock, slots no live
+worker holds (left over after restarting with fewer workers) are adopted:
+their segments are folded the same way and deleted, leaving one empty
+segment so the slot keeps its numbering (and its mark stays valid) for
+whoever claims it next.
+
+A crash before step 4 repeats steps 2-3, which then write the same means; a
+crash after it only repeats step 5. A ring is built from the stored history,
+with the folded hours' sums and counts in place of their stored means, plus
+every slot's segments from its mark on (read under a shared ``compact.lock``,
+so no compaction commits in between). Recovery therefore reads at most one
+compaction interval of log per slot however long the service has run.
+"""
+import fcntl
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from history_store import HOUR, HistoryStore, WEATHER_CHANNELS
+from metrics import metrics
+from observations import EPOCH, ObservationRing
+
+
+class ObservationStore:
+    def __init__(self, log, history, interval=600.0):
+        self.log = log
+        self.history = history  # HistoryWindows: seeds new rings, and its root receives compacted hours
+        self.interval = interval
+        self.rings = {}  # city -> ObservationRing
+        self._tails = {}  # city -> {other slot: log position its ring has read up to}
+        self.recovery = {}  # city -> what the last open() replayed
+        self.compactions = 0
+        self.compacted_records = 0
+        self.last_compaction_ms = None
+        self._lock = threading.Lock()
+        self._city_locks = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _city_lock(self, city):
+        with self._lock:
+            return self._city_locks.setdefault(city, threading.Lock())
+
+    # -- rings ---------------------------------------------------------------
+
+    def ring(self, city):
+        return self.rings.get(city)
+
+    def logged(self, city):
+        """Whether any worker has logged readings for the city."""
+        return city in self.rings or os.path.isdir(self.log.city_dir(city))
+
+    def open(self, bundle, rebuild=False):
+        """bundle.city's ring, built from stored history, the folded hours and every slot's log tail."""
+        city = bundle.city
+        with self._city_lock(city):
+            ring = self.rings.get(city)
+            if ring is not None and not rebuild:
+                return ring
+            ring = self.rings[city] = self._build(bundle)
+            return ring
+
+    def live(self, bundle):
+        """bundle.city's ring with what other workers logged since it last looked; None if nothing was logged.
+
+        Each call lists the other slots' segments and reads their new records (a few syscalls).
+        When a slot compacted a segment this ring had not finished reading, the ring is rebuilt:
+        the folded hours have those readings.
+        """
+        city = bundle.city
+        if not self.logged(city):
+            return None
+        ring = self.open(bundle)
+        if ring.steps != bundle.window or ring.seq_features != list(bundle.seq_features):
+            return ring  # built for another model (e.g. a shadow candidate's); not ours to rebuild
+        with self._city_lock(city):
+            tails = self._tails[city]
+            for worker in self.log.workers(city):
+                if worker == self.log.worker:
+                    continue  # ingest applies this process's own records
+                records, position = self.log.tail(city, tails.get(worker, (0, 0)), worker)
+                if records is None:
+                    self.rings[city] = self._build(bundle)
+                    metrics.incr('observation_ring_rebuilds')
+                    break
+                self.rings[city].ingest(records)
+                tails[worker] = position
+            return self.rings[city]
+
+    def _build(self, bundle):
+        city = bundle.city
+        started = time.perf_counter()
+        ring = ObservationRing(bundle.window, bundle.seq_features, bundle.scaler)
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        found = self.history.lookup(bundle, now)
+        if found is not None:
+            ring.seed(np.array(found[0]), np.datetime64(now, 'h'))
+        since = int((now - timedelta(hours=ring.steps) - EPOCH).total_seconds())
+        replayed, tails = 0, {}
+        os.makedirs(self.log.city_dir(city), exist_ok=True)
+        with open(self._compact_lock_path(city), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_SH)  # no compaction commits (and deletes) while we read
+            folded = self.load_folded(city)
+            recent = folded['hours'] > np.datetime64(now, 'h') - ring.steps * HOUR
+            ring.merge_hours(folded['hours'][recent], folded['sums'][recent], folded['counts'][recent], replace=True)
+            for worker in self.log.workers(city):
+                mark = folded['marks'].get(worker, 0)
+                unfolded = [seq for seq in self.log.segments(city, worker) if seq >= mark]
+                records, position = self.log.tail(city, (unfolded[0] if unfolded else mark, 0), worker)
+                records = records[records['ts'] >= since]
+                ring.ingest(records)
+                replayed += len(records)
+                tails[worker] = position
+        self._tails[city] = tails
+        self.recovery[city] = {
+            'folded_hours': len(folded['hours']),
+            'replayed': replayed,
+            'ms': round((time.perf_counter() - started) * 1000, 2),
+        }
+        return ring
+
+    def ingest(self, city, records):
+        """Log and apply a RECORD batch to an open ring; returns how many landed in the window."""
+        with self._city_lock(city):
+            ring = self.rings[city]
+            mark = self.log.write(city, records)
+            in_window = ring.ingest(records)
+        # Durable before acknowledged; batches that wrote meanwhile share this fsync.
+        self.log.sync(city, mark)
+        return in_window
+
+    # -- folded hours --------------------------------------------------------
+
+    def _compact_lock_path(self, city):
+        return os.path.join(self.log.city_dir(city), 'compact.lock')
+
+    def _folded_path(self, city):
+        return os.path.join(self.log.city_dir(city), 'folded.npz')
+
+    def load_folded(self, city):
+        """{'hours', 'sums', 'counts', 'marks': {slot: first unfolded segment}}, empty when nothing was folded."""
+        try:
+            with np.load(self._folded_path(city)) as z:
+                return {
+                    'hours': z['hours'].astype('datetime64[h]'),
+                    'sums': z['sums'],
+                    'counts': z['counts'],
+                    'marks': dict(zip(z['mark_workers'].tolist(), z['mark_segments'].tolist())),
+                }
+        except FileNotFoundError:
+            n = len(WEATHER_CHANNELS)
+            return {'hours': np.empty(0, dtype='datetime64[h]'), 'sums': np.zeros((0, n)),
+                    'counts': np.zeros((0, n), dtype=np.int64), 'marks': {}}
+
+    def _write_folded(self, city, folded):
+        path = self._folded_path(city)
+        tmp = path + '.tmp'
+        workers = sorted(folded['marks'])
+        with open(tmp, 'wb') as f:
+            np.savez(f, hours=folded['hours'].astype(np.int64), sums=folded['sums'], counts=folded['counts'],
+                     mark_workers=np.array(workers, dtype=np.int64),
+                     mark_segments=np.array([folded['marks'][w] for w in workers], dtype=np.int64))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    # -- compaction ----------------------------------------------------------
+
+    def compact(self, city):
+        """Fold the city's sealed log into the history store and drop it; False if there was nothing to do."""
+        with self._city_lock(city):
+            ring = self.rings.get(city)
+            if ring is None:
+                return False
+            end = self.log.rotate(city)
+            steps = ring.steps
+        with open(self._compact_lock_path(city), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            folded = self.load_folded(city)
+            adopted = self._adopt_orphans(city, folded, steps)
+            return self._fold_slot(city, folded, steps, self.log.worker, end) is not None or adopted > 0
+
+    def _fold_slot(self, city, folded, steps, worker, end):
+        """Fold a slot's segments [mark, end), commit the new mark and delete them.
+
+        Returns the number of records folded, or None when the slot had no sealed segments past its mark.
+        """
+        first = folded['marks'].get(worker, 0)
+        if end <= first:
+            return None
+        records = self.log.read(city, first_segment=first, end_segment=end, worker=worker)
+        self._fold(city, records, folded, steps)
+        folded['marks'][worker] = end
+        self._write_folded(city, folded)
+        self.log.delete_segments(city, below=end, worker=worker)
+        self.compacted_records += len(records)
+        return len(records)
+
+    def _adopt_orphans(self, city, folded, steps):
+        """Fold and delete the segments of the city's slots no live worker holds; returns the records folded."""
+        adopted = 0
+        for worker in self.log.workers(city):
+            if worker == self.log.worker:
+                continue
+            lock = self.log.try_claim(worker)
+            if lock is None:
+                continue
+            with lock:
+                # The empty segment this starts keeps the slot's numbering past its mark.
+                end = self.log.rotate(city, worker)
+                adopted += self._fold_slot(city, folded, steps, worker, end) or 0
+        if adopted:
+            metrics.incr('observation_adopted_records', adopted)
+        return adopted
+
+    def _fold(self, city, records, folded, steps):
+        """Add records to folded's per-hour sums and counts and write the merged means to the history store."""
+        if len(records) == 0:
+            return
+        hours = records['ts'].astype('datetime64[s]').astype('datetime64[h]')
+        values = records['values'].astype(np.float64)
+        present = ~np.isnan(values)
+        unique = np.unique(np.concatenate([hours, folded['hours']]))
+        sums = np.zeros((len(unique), len(WEATHER_CHANNELS)))
+        counts = np.zeros((len(unique), len(WEATHER_CHANNELS)), dtype=np.int64)
+        np.add.at(sums, np.searchsorted(unique, hours), np.where(present, values, 0.0))
+        np.add.at(counts, np.searchsorted(unique, hours), present)
+        touched = np.isin(unique, hours)
+        rows = np.searchsorted(unique, folded['hours'])
+        sums[rows] += folded['sums']
+        counts[rows] += folded['counts']
+        columns = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+        store = HistoryStore(self.history.root, city)
+        store.write(unique[touched],
+                    {c: columns[touched, i] for i, c in enumerate(WEATHER_CHANNELS) if c in store.channels},
+                    skip_nan=True)
+        # Keep the hours a ring can still hold; older ones are final.
+        now = np.datetime64(datetime.now(timezone.utc).replace(tzinfo=None), 'h')
+        keep = unique > now - steps * HOUR
+        folded['hours'], folded['sums'], folded['counts'] = unique[keep], sums[keep], counts[keep]
+
+    def run_once(self):
+        started = time.perf_counter()
+        compacted = 0
+        for city in list(self.rings):
+            try:
+                compacted += self.compact(city)
+            except Exception as e:
+                metrics.incr('observation_compaction_failures')
+                print(f"Observation compaction failed for {city}: {e}")
+        if compacted:
+            self.compactions += compacted
+            self.last_compaction_ms = (time.perf_counter() - started) * 1000
+            metrics.observe('observation_compaction_ms', self.last_compaction_ms)
+        return compacted
+
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='observation-compaction', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the compactor, compact once more (so the next start replays almost nothing) and close the log."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(5.0)
+            self._thread = None
+        self.run_once()
+        self.log.close()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+    def stats(self):
+        return {
+            'log': self.log.stats(),
+            'rings': {city: ring.stats() for city, ring in list(self.rings.items())},
+            'recovery': dict(self.recovery),
+            'compactions': self.compactions,
+            'compacted_records': self.compacted_records,
+            'last_compaction_ms': self.last_compaction_ms,
+        }
@@ -0,0 +1,252 @@
+"""Live station observations: parsing, validation and the per-city ring buffer.
+
+``ObservationRing`` keeps the latest ``steps`` hours of a city in a float32
+buffer of twice that length: every hour is written to slot ``s`` and to its
+mirror ``s + steps``, so the current window is always the contiguous rows
+``[head, head + steps)`` whatever the ring position. A scaled copy with the
+same layout is updated for the touched rows only, so forecasts for the
+latest hour take both inputs straight from the ring without rebuilding or
+rescaling anything.
+
+Several readings in the same hour are averaged per channel; a reading for a
+newer hour advances the ring, leaving hours nobody reported as NaN gaps (the
+caller fills those like gaps in stored history).
+"""
+import csv
+import io
+import json
+import threading
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from forecast_keys import hour_bucket
+from history_store import HOUR, WEATHER_CHANNELS, calendar_columns, to_hours
+from observation_log import RECORD
+from timeparse import parse_datetime
+
+# Plausible ranges; readings outside them are rejected, not clipped.
+LIMITS = {
+    'temp_c': (-90.0, 60.0),
+    'pressure_hpa': (850.0, 1090.0),
+    'rain_mmhr': (0.0, 500.0),
+    'humidity': (0.0, 100.0),
+    'wind_ms': (0.0, 120.0),
+}
+EPOCH = datetime(1970, 1, 1)
+
+
+def parse_body(text, content_type=''):
+    """Rows (dicts) from an NDJSON or CSV body; CSV needs a header line starting with 'time'."""
+    if 'csv' in content_type or text.lstrip().startswith('time,'):
+        return list(csv.DictReader(io.StringIO(text)))
+    rows = []
+    for n, line in enumerate(text.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            rows.append(json.loads(line))
+        except ValueError:
+            rows.append({'_error': f'line {n}: invalid JSON'})
+    return rows
+
+
+def _utc_naive(t):
+    if t.tzinfo is not None:
+        t = t.astimezone(timezone.utc).replace(tzinfo=None)
+    return t
+
+
+def validate(rows, now=None, max_future=timedelta(hours=1)):
+    """(RECORD array of valid readings, [error messages]) for parsed rows."""
+    now = _utc_naive(now or datetime.now(timezone.utc))
+    ts, values, errors = [], [], []
+    for n, row in enumerate(rows, 1):
+        if not isinstance(row, dict):
+            errors.append(f'row {n}: not an object')
+            continue
+        if '_error' in row:
+            errors.append(row['_error'])
+            continue
+        try:
+            when = _utc_naive(parse_datetime(str(row.get('time', ''))))
+        except ValueError:
+            errors.append(f'row {n}: invalid or missing time')
+            continue
+        if when > now + max_future:
+            errors.append(f'row {n}: time {when.isoformat()} is in the future')
+            continue
+        vals, problem = [], None
+        for channel in WEATHER_CHANNELS:
+            raw = row.get(channel)
+            if raw is None or raw == '':
+                vals.append(np.nan)
+                continue
+            try:
+                v = float(raw)
+            except (TypeError, ValueError):
+                problem = f'row {n}: {channel} is not a number'
+                break
+            low, high = LIMITS[channel]
+            if not low <= v <= high:
+                problem = f'row {n}: {channel}={v} outside [{low}, {high}]'
+                break
+            vals.append(v)
+        if problem is None and all(np.isnan(vals)):
+            problem = f'row {n}: no observation channels ({", ".join(WEATHER_CHANNELS)})'
+        if problem is not None:
+            errors.append(problem)
+            continue
+        ts.append(int((when - EPOCH).total_seconds()))
+        values.append(vals)
+    records = np.empty(len(ts), dtype=RECORD)
+    if ts:
+        records['ts'] = ts
+        records['values'] = values
+    return records, errors
+
+
+class ObservationRing:
+    def __init__(self, steps, seq_features, scaler):
+        self.steps = steps
+        self.seq_features = list(seq_features)
+        width = len(self.seq_features)
+        self.raw = np.full((2 * steps, width), np.nan, dtype=np.float32)
+        self.scaled = np.full((2 * steps, width), np.nan, dtype=np.float32)
+        self.counts = np.zeros((steps, len(WEATHER_CHANNELS)), dtype=np.int32)
+        self.head = 0  # slot of the oldest hour; the window is rows [head, head + steps)
+        self.last_hour = None  # datetime64[h] of the newest hour
+        self.readings = 0
+        self.too_old = 0
+        self._weather = [self.seq_features.index(c) for c in WEATHER_CHANNELS]
+        self._calendar = {c: self.seq_features.index(c) for c in self.seq_features if c not in WEATHER_CHANNELS}
+        self._lock = threading.Lock()
+        self.set_scaler(scaler)
+
+    def set_scaler(self, scaler):
+        """Use a new scaler (e.g. after a model reload): one vectorized pass over the buffer."""
+        with self._lock:
+            self._mean = np.asarray(scaler.mean_, dtype=np.float32)
+            self._scale = np.asarray(scaler.scale_, dtype=np.float32)
+            self.scaled[:] = (self.raw - self._mean) / self._scale
+
+    def _write_rows(self, slots, rows):
+        for base in (0, self.steps):
+            self.raw[slots + base] = rows
+            self.scaled[slots + base] = (rows - self._mean) / self._scale
+
+    def _start_hours(self, slots, hours):
+        """Blank the given slots for new hours: NaN weather, calendar channels for the hour."""
+        rows = np.full((len(slots), len(self.seq_features)), np.nan, dtype=np.float32)
+        for name, values in calendar_columns(hours).items():
+            if name in self._calendar:
+                rows[:, self._calendar[name]] = values
+        self.counts[slots] = 0
+        self._write_rows(slots, rows)
+
+    def _advance(self, newest):
+        if self.last_hour is None or newest - self.last_hour >= self.steps * HOUR:
+            self.head = 0
+            self.last_hour = newest
+            self._start_hours(np.arange(self.steps), newest - np.arange(self.steps - 1, -1, -1) * HOUR)
+            return
+        k = int((newest - self.last_hour) // HOUR)
+        if k <= 0:
+            return
+        slots = (self.head + np.arange(k)) % self.steps  # oldest slots become the new hours
+        self.head = (self.head + k) % self.steps
+        self.last_hour = newest
+        self._start_hours(slots, newest - np.arange(k - 1, -1, -1) * HOUR)
+
+    def ingest(self, records):
+        """Fold RECORD readings into the ring; returns how many landed inside the window."""
+        if len(records) == 0:
+            return 0
+        hours = records['ts'].astype('datetime64[s]').astype('datetime64[h]')
+        values = records['values'].astype(np.float64)
+        present = ~np.isnan(values)
+        return self._merge(hours, np.where(present, values, 0.0), present.astype(np.int32), np.ones(len(hours)))
+
+    def merge_hours(self, hours, sums, counts, replace=False):
+        """Fold per-hour reading sums and counts (e.g. compacted ones) into the ring, like ingest.
+
+        With replace, a channel these counts cover drops what the ring held for the hour first
+        (a seeded history value that is itself the mean of these readings).
+        """
+        counts = np.asarray(counts, dtype=np.int32)
+        if len(counts) == 0:
+            return 0
+        return self._merge(to_hours(hours), np.asarray(sums, dtype=np.float64), counts, counts.max(axis=1), replace)
+
+    def _merge(self, hours, sums, counts, readings, replace=False):
+        """Add per-row channel sums and counts to the hours' running means; returns the rows in the window."""
+        with self._lock:
+            self._advance(hours.max())
+            offset = ((self.last_hour - hours) // HOUR).astype(np.int64)
+            keep = offset < self.steps
+            self.too_old += int((~keep).sum())
+            slots = (self.head + self.steps - 1 - offset[keep]) % self.steps
+            slot_sums = np.zeros((self.steps, len(WEATHER_CHANNELS)))
+            slot_counts = np.zeros((self.steps, len(WEATHER_CHANNELS)), dtype=np.int32)
+            np.add.at(slot_sums, slots, sums[keep])
+            np.add.at(slot_counts, slots, counts[keep])
+
+            touched = np.unique(slots)
+            rows = self.raw[touched].copy()
+            old = rows[:, self._weather].astype(np.float64)
+            old_n = self.counts[touched]
+            if replace:
+                old_n = np.where(slot_counts[touched] > 0, 0, old_n)
+            new_n = old_n + slot_counts[touched]
+            merged = (np.where(old_n > 0, old, 0.0) * old_n + slot_sums[touched]) / np.maximum(new_n, 1)
+            rows[:, self._weather] = np.where(new_n > 0, merged, np.nan)
+            self.counts[touched] = new_n
+            self._write_rows(touched, rows)
+            self.readings += int(readings[keep].sum())
+        return len(slots)
+
+    def seed(self, raw, last_hour, counts=None):
+        """Start from an existing (steps, F) window ending at last_hour, e.g. stored history.
+
+        ``counts`` (steps, len(WEATHER_CHANNELS)) are the readings behind each mean; by
+        default every present value counts as one.
+        """
+        with self._lock:
+            self.head = 0
+            self.last_hour = to_hours(last_hour)
+            rows = np.asarray(raw, dtype=np.float32)
+            if counts is None:
+                counts = ~np.isnan(rows[:, self._weather])
+            self.counts[:] = np.asarray(counts, dtype=np.int32)
+            self._write_rows(np.arange(self.steps), rows)
+
+    def covers(self, target_time):
+        """Whether target_time falls in the ring's newest hour, the only window it serves."""
+        return self.last_hour is not None and to_hours(hour_bucket(target_time)) == self.last_hour
+
+    def lookup(self, target_time):
+        """(raw, scaled, gaps) like HistoryWindows.lookup when target_time is the ring's newest hour."""
+        if not self.covers(target_time):
+            return None
+        with self._lock:
+            # Copied under the lock (2 x 26 KB): ingest may advance the ring while the model runs.
+            raw = self.raw[self.head:self.head + self.steps].copy()
+            scaled = self.scaled[self.head:self.head + self.steps].copy()
+        gaps = np.isnan(raw).any(axis=1)
+        if gaps.all():
+            return None
+        if gaps.any():
+            return raw, None, gaps
+        return raw, scaled, None
+
+    def stats(self):
+        with self._lock:
+            window = self.raw[self.head:self.head + self.steps]
+            complete = int((~np.isnan(window).any(axis=1)).sum())
+        return {
+            'last_hour': None if self.last_hour is None else str(self.last_hour),
+            'complete_hours': complete,
+            'steps': self.steps,
+            'readings': self.readings,
+            'too_old': self.too_old,
+        }
@@ -0,0 +1,234 @@
+"""Historical odds of weather thresholds for a date and hour range.
+
+"Will it rain on my parade?" asks how often, in past years, a window of
+days around a date and a range of hours saw rain of at least X mm/h (or
+temperatures or wind above a level). OddsIndex answers that without scanning
+the history:
+
+* Every stored hour is placed in a per-year (366, 24) calendar grid by day
+  of a leap year (Feb 29 is day 59, so a date has the same index every year)
+  and hour of day. Only OBSERVED hours count; interpolated or
+  climatology-filled hours are left out.
+* Per year, 2-D prefix sums over (day, hour) are kept of the observed-hour
+  counts, of the values (per weather channel) and of the 0/1 exceedances of
+  each threshold in LEVELS. Counts are uint16 (a year has at most 8784
+  hours), the sums float64. Any other threshold gets its own exceedance
+  prefix, built from the kept grid on first use (one cumsum) and cached for
+  the most recent EXTRA_THRESHOLDS of them.
+* A day range x hour range is then four lookups per year, done for all years
+  at once; ranges that wrap past Dec 31 or midnight split into two:
+
+      n(d0..d1, h0..h1) = P[d1+1, h1+1] - P[d0, h1+1] - P[d1+1, h0] + P[d0, h0]
+
+Day windows wrap within the same calendar year (Dec 30 +- 3 days covers Dec
+27-31 and Jan 1-2 of each year). Thresholds are always applied exactly as
+requested, never rounded to a level.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from history_store import HOUR, WEATHER_CHANNELS, year_of, year_start
+from metrics import metrics
+from resample import OBSERVED
+
+# Threshold levels (value >= level) kept per channel.
+LEVELS = {
+    'rain_mmhr': (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0),
+    'temp_c': tuple(float(t) for t in range(-20, 46, 2)),
+    'wind_ms': (2.0, 4.0, 6.0, 8.0, 10.0, 12.0, 15.0, 20.0, 25.0),
+}
+DAYS = 366
+EXTRA_THRESHOLDS = 32  # cached exceedance prefixes of thresholds outside LEVELS, per index
+
+
+def leap_day_index(hours):
+    """Day of a leap year (0..365) for datetime64[h] values, so Mar 1 is 60 in every year."""
+    days = hours.astype('datetime64[D]')
+    doy = (days - hours.astype('datetime64[Y]')) // np.timedelta64(1, 'D')
+    year = year_of(hours)
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    return np.where(~leap & (doy >= 59), doy + 1, doy).astype(np.int64)
+
+
+def _prefix2d(a, dtype):
+    """(Y, 366, 24, ...) -> (Y, 367, 25, ...) prefix sums over the day and hour axes."""
+    out = np.zeros((a.shape[0], a.shape[1] + 1, a.shape[2] + 1) + a.shape[3:], dtype=dtype)
+    out[:, 1:, 1:] = np.cumsum(np.cumsum(a, axis=1, dtype=dtype), axis=2, dtype=dtype)
+    return out
+
+
+def circular_ranges(lo, hi, n):
+    """Half-open [start, stop) ranges covering lo..hi (inclusive) on a circle of n."""
+    lo, hi = lo % n, hi % n
+    return [(lo, hi + 1)] if lo <= hi else [(lo, n), (0, hi + 1)]
+
+
+class OddsIndex:
+    def __init__(self, store):
+        self.city = store.city
+        self.years = np.array(store.years(), dtype=np.int64)
+        self.channels = [c for c in WEATHER_CHANNELS if c in store.channels]
+        cols = [store.channels.index(c) for c in self.channels]
+        quality_cols = [WEATHER_CHANNELS.index(c) for c in self.channels]
+        grid = np.full((len(self.years), DAYS, 24, len(self.channels)), np.nan, dtype=np.float32)
+        for i, year in enumerate(self.years):
+            values = store.year_array(int(year))
+            hours = year_start(int(year)) + np.arange(len(values)) * HOUR
+            observed = store.read_quality(hours[0], len(hours))[:, quality_cols] == OBSERVED
+            grid[i, leap_day_index(hours), (hours - hours.astype('datetime64[D]')) // HOUR] = \
+                np.where(observed, values[:, cols], np.nan)
+        self.grid = grid
+        present = ~np.isnan(grid)
+        self.count = _prefix2d(present, np.uint16)
+        self.sum = _prefix2d(np.where(present, grid, 0.0), np.float64)
+        self.exceed = {}
+        for name, levels in LEVELS.items():
+            if name in self.channels:
+                column = grid[..., self.channels.index(name), None]
+                self.exceed[name] = _prefix2d(column >= np.asarray(levels, dtype=np.float32), np.uint16)
+        self._lock = threading.Lock()
+        self._extra = OrderedDict()  # (channel, float32 threshold) -> prefix, least recently used first
+        self.extra_builds = 0
+
+    @property
+    def nbytes(self):
+        with self._lock:
+            extra = sum(a.nbytes for a in self._extra.values())
+        prefixes = self.count.nbytes + self.sum.nbytes + sum(a.nbytes for a in self.exceed.values())
+        return self.grid.nbytes + prefixes + extra
+
+    def exceedance(self, name, threshold):
+        """(Y, 367, 25) prefix of the channel's observed hours with value >= threshold, exactly."""
+        threshold = np.float32(threshold)
+        levels = np.asarray(LEVELS[name], dtype=np.float32)
+        match = np.flatnonzero(levels == threshold)
+        if len(match):
+            return self.exceed[name][..., int(match[0])]
+        key = (name, float(threshold))
+        with self._lock:
+            prefix = self._extra.get(key)
+            if prefix is not None:
+                self._extra.move_to_end(key)
+                return prefix
+        prefix = _prefix2d(self.grid[..., self.channels.index(name)] >= threshold, np.uint16)
+        with self._lock:
+            self._extra[key] = prefix
+            self._extra.move_to_end(key)
+            while len(self._extra) > EXTRA_THRESHOLDS:
+                self._extra.popitem(last=False)
+            self.extra_builds += 1
+        return prefix
+
+    @staticmethod
+    def _box(prefix, day_ranges, hour_ranges):
+        """Per-year totals of prefix over the union of the day x hour rectangles."""
+        total = 0
+        for d0, d1 in day_ranges:
+            for h0, h1 in hour_ranges:
+                total = total + (prefix[:, d1, h1].astype(np.float64) - prefix[:, d0, h1] - prefix[:, d1, h0]
+                                 + prefix[:, d0, h0])
+        return total
+
+    def query(self, day, days=0, hours=(0, 23), thresholds=None):
+        """Odds for leap-year day ``day`` +- ``days`` and hours[0]..hours[1] (wrapping past midnight).
+
+        ``thresholds`` maps channel -> threshold (value >= threshold). Returns a dict with
+        per-channel means and, per threshold, the fraction of years (that have observed hours
+        in the window) with at least one such hour, and the fraction of observed hours.
+        """
+        day_ranges = [(0, DAYS)] if 2 * days + 1 >= DAYS else circular_ranges(day - days, day + days, DAYS)
+        hour_ranges = circular_ranges(hours[0], hours[1], 24)
+        count = self._box(self.count, day_ranges, hour_ranges)  # (Y, C)
+        total = self._box(self.sum, day_ranges, hour_ranges)
+        with_data = count > 0
+        result = {
+            'years': {name: int(with_data[:, i].sum()) for i, name in enumerate(self.channels)},
+            'first_year': int(self.years[with_data.any(axis=1)].min()) if with_data.any() else None,
+            'last_year': int(self.years[with_data.any(axis=1)].max()) if with_data.any() else None,
+            'means': {name: (float(total[:, i].sum() / count[:, i].sum()) if count[:, i].sum() else None)
+                      for i, name in enumerate(self.channels)},
+            'thresholds': {},
+        }
+        for name, requested in (thresholds or {}).items():
+            if name not in self.exceed:
+                continue
+            i = self.channels.index(name)
+            hits = self._box(self.exceedance(name, requested), day_ranges, hour_ranges)  # (Y,)
+            years = with_data[:, i]
+            observed_hours = int(count[years, i].sum())
+            result['thresholds'][name] = {
+                'threshold': float(requested),
+                'years': int(years.sum()),
+                'years_reached': int((hits[years] > 0).sum()),
+                'years_fraction': float((hits[years] > 0).mean()) if years.any() else None,
+                'hours': observed_hours,
+                'hours_fraction': float(hits[years].sum() / observed_hours) if observed_hours else None,
+            }
+        return result
+
+
+class OddsIndexes:
+    """One OddsIndex per city, rebuilt when the city's history store changes.
+
+    Compaction republishes the store every interval, so only a city's first index is
+    built on the request path. After that a changed store is rebuilt on a background
+    thread while requests keep getting the previous index.
+    """
+
+    def __init__(self, history):
+        self.history = history
+        self._lock = threading.Lock()
+        self._indexes = {}  # city -> (HistoryStore it was built from, OddsIndex)
+        self._building = set()  # cities with a background rebuild running
+        self.builds = 0
+
+    def get(self, city):
+        """The city's index, or None when it has no stored history."""
+        store = self.history.store(city)
+        if store is None or not store.years():
+            return None
+        cached = self._indexes.get(city)
+        if cached is not None and cached[0] is store:
+            return cached[1]
+        with self._lock:
+            cached = self._indexes.get(city)
+            if cached is None:
+                return self._build(city, store)
+            if cached[0] is not store and city not in self._building:
+                self._building.add(city)
+                threading.Thread(target=self._rebuild, args=(city, store), name=f'odds-index-{city}',
+                                 daemon=True).start()
+        return cached[1]
+
+    def _build(self, city, store):
+        started = time.perf_counter()
+        index = OddsIndex(store)
+        metrics.observe('odds_index_build_ms', (time.perf_counter() - started) * 1000)
+        self._indexes[city] = (store, index)
+        self.builds += 1
+        return index
+
+    def _rebuild(self, city, store):
+        try:
+            started = time.perf_counter()
+            index = OddsIndex(store)
+            metrics.observe('odds_index_build_ms', (time.perf_counter() - started) * 1000)
+        except Exception:
+            metrics.incr('odds_index_build_failures')  # keep serving the previous index
+            index = None
+        with self._lock:
+            if index is not None:
+                self._indexes[city] = (store, index)
+                self.builds += 1
+            self._building.discard(city)
+
+    def stats(self):
+        indexes = dict(self._indexes)
+        return {
+            'builds': self.builds,
+            'cities': {city: {'years': len(index.years), 'bytes': index.nbytes, 'extra_thresholds': index.extra_builds}
+                       for city, (_, index) in indexes.items()},
+        }
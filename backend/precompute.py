@@ -0,0 +1,201 @@
+"""Precomputed forecast table for the next N hourly slots of a city.
+
+A background job scores every upcoming hour with the batched model path and
+writes the (hours, n_classes) float32 probabilities to a generation-numbered
+.npy file, then atomically replaces a small JSON pointer describing it. Every
+worker memory-maps the current generation, so the table is shared through the
+page cache and a lookup is one index computation:
+
+    row = (hour_bucket(target_time) - start_hour) / 1h
+
+Only one worker per host computes a generation (guarded by an flock); the
+others just pick up the new pointer.
+"""
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from forecast_keys import hour_bucket
+from metrics import metrics
+
+KEEP_GENERATIONS = 2
+
+
+class ForecastTable:
+    def __init__(self, directory, city):
+        self.directory = directory
+        self.city = city
+        self.pointer_path = os.path.join(directory, f"{city}_table.json")
+        self._lock = threading.Lock()
+        self._pointer_mtime = None
+        self._meta = None
+        self._probs = None
+
+    # -- reader side -------------------------------------------------------
+
+    def lookup(self, target_time, model_version):
+        """Probabilities row for target_time, or None if it is not covered by the current table."""
+        self._refresh()
+        meta, probs = self._meta, self._probs
+        if meta is None or meta['model_version'] != model_version:
+            return None
+        delta = hour_bucket(target_time) - meta['start']
+        offset = int(delta.total_seconds() // 3600)
+        if offset < 0 or offset >= probs.shape[0]:
+            return None
+        return probs[offset]
+
+    def _refresh(self):
+        try:
+            mtime = os.stat(self.pointer_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._pointer_mtime:
+            return
+        with self._lock:
+            if mtime == self._pointer_mtime:
+                return
+            with open(self.pointer_path) as f:
+                meta = json.load(f)
+            meta['start'] = datetime.fromisoformat(meta['start_hour'])
+            probs = np.load(os.path.join(self.directory, meta['file']), mmap_mode='r')
+            self._meta, self._probs, self._pointer_mtime = meta, probs, mtime
+
+    def stats(self):
+        self._refresh()
+        meta = self._meta
+        if meta is None:
+            return {'loaded': False}
+        return {
+            'loaded': True,
+            'start_hour': meta['start_hour'],
+            'hours': meta['hours'],
+            'generation': meta['generation'],
+            'model_version': meta['model_version'],
+            'computed_at': meta['computed_at'],
+        }
+
+    # -- writer side -------------------------------------------------------
+
+    def write(self, start_hour, probs, model_version, classes):
+        """Publish a new generation; readers switch to it on their next lookup."""
+        os.makedirs(self.directory, exist_ok=True)
+        generation = int(time.time() * 1000)
+        name = f"{self.city}_table.{generation}.npy"
+        path = os.path.join(self.directory, name)
+        tmp = path + '.tmp'
+        out = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.float32, shape=probs.shape)
+        out[:] = probs
+        out.flush()
+        del out
+        os.replace(tmp, path)
+
+        meta = {
+            'file': name,
+            'generation': generation,
+            'start_hour': start_hour.isoformat(),
+            'hours': int(probs.shape[0]),
+            'classes': list(classes),
+            'model_version': model_version,
+            'computed_at': datetime.now(timezone.utc).replace(tzinfo=None).isoformat(timespec='seconds'),
+        }
+        tmp_pointer = self.pointer_path + '.tmp'
+        with open(tmp_pointer, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_pointer, self.pointer_path)
+        self._prune(keep=name)
+
+    def _prune(self, keep):
+        files = sorted(glob.glob(os.path.join(self.directory, f"{self.city}_table.*.npy")))
+        # Readers may still have the previous generation mapped; unlinking is safe on POSIX
+        # but keep a couple around so a reader racing the pointer swap never misses a file.
+        for path in files[:-KEEP_GENERATIONS]:
+            if os.path.basename(path) != keep:
+                os.remove(path)
+
+
+class PrecomputeJob:
+    """Periodically recompute a ForecastTable in a background thread.
+
+    ``compute(start_hour, hours)`` returns ``(probs, model_version, classes)`` with
+    probs a (hours, n_classes) array; ``model_version()`` is the version currently
+    being served, used to decide whether the published table is still fresh.
+    """
+
+    def __init__(self, table, compute, model_version, hours=720, interval=3600.0):
+        self.table = table
+        self.compute = compute
+        self.model_version = model_version
+        self.hours = hours
+        self.interval = interval
+        self.last_run_ms = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='forecast-precompute', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(5.0)
+            self._thread = None
+
+    def run_soon(self):
+        """Recompute now instead of at the next interval (e.g. after a model swap)."""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                metrics.incr('precompute_failures')
+                print(f"Forecast precompute failed: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def run_once(self):
+        """Compute and publish one generation unless another worker holds the lock or it is fresh."""
+        os.makedirs(self.table.directory, exist_ok=True)
+        lock_path = os.path.join(self.table.directory, f"{self.table.city}_table.lock")
+        with open(lock_path, 'w') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            start_hour = hour_bucket(datetime.now(timezone.utc))
+            if self._is_fresh(start_hour):
+                return False
+            started = time.perf_counter()
+            probs, version, classes = self.compute(start_hour, self.hours)
+            self.table.write(start_hour, np.asarray(probs, dtype=np.float32), version, classes)
+            self.last_run_ms = (time.perf_counter() - started) * 1000
+            metrics.incr('precompute_runs')
+            metrics.observe('precompute_run_ms', self.last_run_ms)
+            return True
+
+    def _is_fresh(self, start_hour):
+        """True if another worker already published a table for this model less than interval ago."""
+        stats = self.table.stats()
+        if not stats['loaded'] or stats['model_version'] != self.model_version():
+            return False
+        computed = datetime.fromisoformat(stats['computed_at'])
+        table_start = datetime.fromisoformat(stats['start_hour'])
+        return (table_start == start_hour
+                and datetime.now(timezone.utc).replace(tzinfo=None) - computed < timedelta(seconds=self.interval))
+
+
+def hourly_slots(start_hour, hours):
+    return [start_hour + timedelta(hours=i) for i in range(hours)]
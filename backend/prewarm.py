@@ -0,0 +1,259 @@
+"""Popularity- and calendar-driven pre-warming of the forecast cache.
+
+Candidate keys come from two places:
+
+* the recent request log (see request_log.py): the most frequently requested
+  canonical keys whose hour has not passed yet;
+* upcoming calendar hot spots: weekends, US federal holidays and configured
+  event dates, at the hours people plan events for.
+
+A low-priority background thread fills the cache with those keys in small
+batches, and only while the server has been idle for a moment, so it never
+competes with live requests for the model. When the cache is shared by the
+workers of a host, only one of them runs a pass at a time (guarded by an
+flock on ``lock_path``); the others skip it.
+"""
+import fcntl
+import glob
+import gzip
+import json
+import os
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+
+from forecast_cache import SOURCE_PREWARM
+from forecast_keys import canonical_key, hour_bucket, parse_canonical_key
+from metrics import metrics
+
+DEFAULT_EVENT_HOURS = tuple(range(9, 22))
+
+
+def read_log_records(directory, since):
+    """Yield request-log records written at or after ``since`` (aware UTC datetime)."""
+    cutoff = since.timestamp()
+    for path in sorted(glob.glob(os.path.join(directory, '*.jsonl*'))):
+        if os.path.getmtime(path) < cutoff:
+            continue
+        opener = gzip.open if path.endswith('.gz') else open
+        try:
+            with opener(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # partially written tail of an open file
+                    if datetime.fromisoformat(record['ts']) >= since:
+                        yield record
+        except (OSError, EOFError):
+            continue
+
+
+def popular_keys(records, now, top_n=500):
+    """Most requested canonical keys whose hour is still in the future, most popular first."""
+    # Shadow-evaluation records (shadow.py) repeat keys that were already logged once.
+    counts = Counter(r['key'] for r in records if 'key' in r and r.get('engine') != 'shadow')
+    current = hour_bucket(now)
+    ranked = []
+    for key, count in counts.most_common():
+        try:
+            _, when = parse_canonical_key(key)
+        except ValueError:
+            continue
+        if when >= current:
+            ranked.append(key)
+            if len(ranked) >= top_n:
+                break
+    return ranked
+
+
+def _nth_weekday(year, month, weekday, n):
+    first = date(year, month, 1)
+    return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+
+
+def _last_weekday(year, month, weekday):
+    nxt = date(year + (month == 12), month % 12 + 1, 1)
+    last = nxt - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def us_holidays(year):
+    return {
+        date(year, 1, 1),
+        _nth_weekday(year, 1, 0, 3),  # Martin Luther King Jr. Day
+        _nth_weekday(year, 2, 0, 3),  # Presidents' Day
+        _last_weekday(year, 5, 0),  # Memorial Day
+        date(year, 6, 19),
+        date(year, 7, 4),
+        _nth_weekday(year, 9, 0, 1),  # Labor Day
+        _nth_weekday(year, 10, 0, 2),  # Columbus Day
+        date(year, 11, 11),
+        _nth_weekday(year, 11, 3, 4),  # Thanksgiving
+        date(year, 12, 25),
+        date(year, 12, 31),  # New Year's Eve
+    }
+
+
+def calendar_hot_days(start, days, event_dates=()):
+    """Upcoming event dates first, then holidays, then weekends, within ``days`` of start."""
+    end = start + timedelta(days=days)
+    holidays = set()
+    for year in range(start.year, end.year + 1):
+        holidays |= us_holidays(year)
+    events, hols, weekends = [], [], []
+    d = start
+    while d < end:
+        if d in event_dates:
+            events.append(d)
+        elif d in holidays:
+            hols.append(d)
+        elif d.weekday() >= 5:
+            weekends.append(d)
+        d += timedelta(days=1)
+    return events + hols + weekends
+
+
+def calendar_keys(city, now, days=90, hours=DEFAULT_EVENT_HOURS, event_dates=()):
+    current = hour_bucket(now)
+    keys = []
+    for d in calendar_hot_days(current.date(), days, set(event_dates)):
+        for h in hours:
+            when = datetime(d.year, d.month, d.day, h)
+            if when >= current:
+                keys.append(canonical_key(city, when))
+    return keys
+
+
+class Prewarmer:
+    """Fill ``cache`` with candidate keys using ``compute(times) -> (len, n_classes)``.
+
+    ``model_version()`` returns the version the computed rows belong to.
+
+    ``skip(key, when)`` lets the caller exclude keys already served elsewhere
+    (e.g. covered by the precomputed table).
+    """
+
+    def __init__(self, cache, compute, model_version, city, log_dir=None, lookback_hours=72,
+                 top_n=500, calendar_days=90, event_dates=(), batch_size=32, idle_seconds=2.0,
+                 interval=600.0, skip=None, lock_path=None):
+        self.cache = cache
+        self.compute = compute
+        self.model_version = model_version
+        self.city = city
+        self.log_dir = log_dir
+        self.lookback_hours = lookback_hours
+        self.top_n = top_n
+        self.calendar_days = calendar_days
+        self.event_dates = tuple(event_dates)
+        self.batch_size = batch_size
+        self.idle_seconds = idle_seconds
+        self.interval = interval
+        self.skip = skip
+        self.lock_path = lock_path
+        self.skipped_passes = 0
+        self.last_plan = {'popular': 0, 'calendar': 0, 'pending': 0}
+        self._last_request = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def note_request(self):
+        """Called by the forecast handler; pre-warming pauses while requests keep arriving."""
+        self._last_request = time.monotonic()
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='forecast-prewarm', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(5.0)
+            self._thread = None
+
+    def plan(self, now=None):
+        """Ordered, de-duplicated keys that should be warm and are not yet."""
+        now = now or datetime.now(timezone.utc).replace(tzinfo=None)  # naive UTC, like request keys
+        popular = []
+        if self.log_dir and os.path.isdir(self.log_dir):
+            since = datetime.now(timezone.utc) - timedelta(hours=self.lookback_hours)
+            popular = popular_keys(read_log_records(self.log_dir, since), now, self.top_n)
+        hot = calendar_keys(self.city, now, self.calendar_days, event_dates=self.event_dates)
+
+        version = self.model_version()
+        pending, seen = [], set()
+        for key in popular + hot:
+            if key in seen:
+                continue
+            seen.add(key)
+            city, when = parse_canonical_key(key)
+            if city != self.city or self.cache.contains(key, version):
+                continue
+            if self.skip is not None and self.skip(key, when):
+                continue
+            pending.append((key, when))
+        self.last_plan = {'popular': len(popular), 'calendar': len(hot), 'pending': len(pending)}
+        return pending
+
+    def warm(self, pending):
+        """Fill pending keys in batches, yielding to live traffic between batches."""
+        filled = 0
+        for i in range(0, len(pending), self.batch_size):
+            if self._stop.is_set() or not self._wait_idle():
+                break
+            batch = pending[i:i + self.batch_size]
+            started = time.perf_counter()
+            version = self.model_version()
+            rows = self.compute([when for _, when in batch])
+            for (key, _), row in zip(batch, rows):
+                self.cache.put(key, row, version, source=SOURCE_PREWARM)
+            filled += len(batch)
+            metrics.incr('prewarm_filled', len(batch))
+            metrics.observe('prewarm_batch_ms', (time.perf_counter() - started) * 1000)
+        return filled
+
+    def _wait_idle(self):
+        while not self._stop.is_set():
+            idle_for = time.monotonic() - self._last_request
+            if idle_for >= self.idle_seconds:
+                return True
+            self._stop.wait(self.idle_seconds - idle_for)
+        return False
+
+    def run_once(self):
+        """Plan and warm one pass; returns the keys filled, or None if another worker holds the lock."""
+        if self.lock_path is None:
+            return self.warm(self.plan())
+        os.makedirs(os.path.dirname(os.path.abspath(self.lock_path)), exist_ok=True)
+        with open(self.lock_path, 'w') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self.skipped_passes += 1
+                return None
+            return self.warm(self.plan())
+
+    def _run(self):
+        lower_thread_priority()
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                metrics.incr('prewarm_failures')
+                print(f"Cache pre-warm failed: {e}")
+            self._stop.wait(self.interval)
+
+    def stats(self):
+        return dict(self.last_plan, skipped_passes=self.skipped_passes,
+                    **{k: v for k, v in self.cache.stats().items() if k.startswith('prewarm')})
+
+
+def lower_thread_priority(niceness=10):
+    # On Linux setpriority with a thread id renices just this thread.
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), niceness)
+    except (AttributeError, OSError):
+        pass
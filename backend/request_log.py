@@ -0,0 +1,187 @@
+"""Asynchronous, batched audit log of every forecast.
+
+Handlers call ``RequestLogSink.log(record)``, which only enqueues the record.
+A background thread drains the queue in batches and appends them as JSON
+lines (the same one-object-per-line layout as requests.jsonl) to files that
+rotate by size or age and can be gzip-compressed. When the writer falls
+behind and the queue is full, records are dropped and counted rather than
+blocking the request.
+"""
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+from metrics import metrics
+
+
+class RequestLogSink:
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024, rotate_seconds=3600, compress=False,
+                 queue_size=10000, batch_size=256, flush_interval=1.0, prefix='requests'):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.compress = compress
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.prefix = prefix
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._thread = None
+        self._raw = None
+        self._fh = None
+        self._opened_at = 0.0
+        self._path = None
+
+    # -- producer side -----------------------------------------------------
+
+    def log(self, record):
+        """Enqueue a record without blocking; returns False if it was dropped."""
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            metrics.incr('request_log_dropped')
+            return False
+
+    # -- lifecycle ---------------------------------------------------------
+
+    def start(self):
+        if self._thread is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='request-log-writer', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Flush everything still queued; the writer closes the current file when it exits.
+
+        Returns False if the writer is still draining after ``timeout``; it keeps the file
+        to itself until it finishes.
+        """
+        if self._thread is None:
+            return True
+        self._stop.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            print(f"Request log writer still draining {self._queue.qsize()} records after {timeout}s")
+            return False
+        self._thread = None
+        return True
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'written': self.written,
+            'dropped': self.dropped,
+            'current_file': self._path,
+        }
+
+    # -- writer side -------------------------------------------------------
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except OSError as e:
+                    # Never let a disk problem kill the writer; the records are lost but counted.
+                    print(f"Request log write failed: {e}")
+                    self.dropped += len(batch)
+                    metrics.incr('request_log_dropped', len(batch))
+                    self._close()
+            elif self._fh is not None and self._should_rotate():
+                self._close()
+        # Only the writer touches the file, so it closes it too (stop() may give up waiting).
+        self._close()
+
+    def _next_batch(self):
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_batch(self, batch):
+        if self._fh is None or self._should_rotate():
+            self._close()
+            self._open()
+        data = ''.join(json.dumps(r, separators=(',', ':'), default=str) + '\n' for r in batch)
+        self._fh.write(data.encode('utf-8'))
+        self._fh.flush()
+        self.written += len(batch)
+        metrics.incr('request_log_written', len(batch))
+
+    def _should_rotate(self):
+        if time.monotonic() - self._opened_at >= self.rotate_seconds:
+            return True
+        return self._raw.tell() >= self.max_bytes
+
+    def _open(self):
+        # Workers share the directory: the pid keeps their names apart, and O_EXCL makes sure
+        # two writers never append (gzip members or not) to the same file.
+        stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')
+        suffix = '.jsonl.gz' if self.compress else '.jsonl'
+        base = f"{self.prefix}-{stamp}-{os.getpid()}"
+        n = 0
+        while True:
+            path = os.path.join(self.directory, f"{base}-{n}{suffix}" if n else f"{base}{suffix}")
+            try:
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND, 0o644)
+                break
+            except FileExistsError:
+                n += 1
+        self._raw = os.fdopen(fd, 'ab')
+        self._fh = gzip.GzipFile(fileobj=self._raw, mode='ab') if self.compress else self._raw
+        self._opened_at = time.monotonic()
+        self._path = path
+
+    def _close(self):
+        if self._fh is None:
+            return
+        self._fh.close()
+        if self._fh is not self._raw:
+            self._raw.close()
+        self._fh = self._raw = self._path = None
+
+
+def forecast_record(city, datetime_str, key, engine, latency_ms, response):
+    """Build the audit record for one served forecast."""
+    return {
+        'ts': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+        'request': {'city': city, 'datetime': datetime_str},
+        'key': key,
+        'engine': engine,
+        'latency_ms': round(latency_ms, 3),
+        'prediction': response['prediction'],
+        'probabilities': response['probabilities'],
+        'model_version': response.get('model_version'),
+    }
+
+
+def sink_from_env(default_dir):
+    """Build a sink from REQUEST_LOG_* environment variables; REQUEST_LOG_DIR='' disables logging."""
+    directory = os.environ.get('REQUEST_LOG_DIR', default_dir)
+    if not directory:
+        return None
+    return RequestLogSink(
+        directory,
+        max_bytes=int(os.environ.get('REQUEST_LOG_MAX_BYTES', 64 * 1024 * 1024)),
+        rotate_seconds=float(os.environ.get('REQUEST_LOG_ROTATE_SECONDS', 3600)),
+        compress=os.environ.get('REQUEST_LOG_COMPRESS', '0') == '1',
+        queue_size=int(os.environ.get('REQUEST_LOG_QUEUE_SIZE', 10000)),
+        batch_size=int(os.environ.get('REQUEST_LOG_BATCH_SIZE', 256)),
+    )
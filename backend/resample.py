@@ -0,0 +1,226 @@
+"""Hourly resampling and gap filling for irregular raw readings.
+
+Every step is an array operation over the whole input; Python loops run over
+channels only, never over readings or hours:
+
+* ``dedupe`` sorts readings by time and averages those sharing a timestamp.
+* ``resample_hourly`` computes time-weighted hourly means. Each reading holds
+  until the next one, for at most ``max_hold`` seconds, so a reading at :50
+  counts for 10 minutes of its hour and carries into the next. With F the
+  cumulative integral of that step function and G its cumulative coverage,
+  both evaluated at the hour boundaries with one ``searchsorted``, an hour's
+  mean is dF / dG. ``method='mean'`` gives plain per-hour means instead.
+* ``fill_gaps`` interpolates linearly across gaps of at most ``max_gap`` hours
+  and, given a ``climatology`` table, fills longer gaps from it.
+
+Results are float32 ``(hours, channels)`` arrays aligned to whole UTC hours
+with a uint8 quality mask of the same shape (see QUALITY).
+"""
+import numpy as np
+
+MISSING, OBSERVED, INTERPOLATED, CLIMATOLOGY = 0, 1, 2, 3
+QUALITY = ('missing', 'observed', 'interpolated', 'climatology')
+HOUR = np.timedelta64(1, 'h')
+SECOND = np.timedelta64(1, 's')
+
+
+def _as_2d(values):
+    values = np.asarray(values, dtype=np.float64)
+    return values[:, None] if values.ndim == 1 else values
+
+
+def dedupe(times, values):
+    """(sorted unique datetime64[s] times, (n, C) float64 values) with same-time readings averaged.
+
+    NaN values don't count towards a mean; a channel that is NaN in every reading at a
+    time stays NaN.
+    """
+    times = np.asarray(times, dtype='datetime64[s]')
+    values = _as_2d(values)
+    unique, inverse = np.unique(times, return_inverse=True)
+    if len(unique) == len(times):
+        order = np.argsort(times, kind='stable')
+        return times[order], values[order]
+    present = ~np.isnan(values)
+    means = np.full((len(unique), values.shape[1]), np.nan)
+    for c in range(values.shape[1]):
+        counts = np.bincount(inverse, weights=present[:, c], minlength=len(unique))
+        sums = np.bincount(inverse, weights=np.where(present[:, c], values[:, c], 0.0), minlength=len(unique))
+        np.divide(sums, counts, out=means[:, c], where=counts > 0)
+    return unique, means
+
+
+def _held_integrals(t, v, max_hold, bounds):
+    """Cumulative integral and coverage of the held step function at each bound (seconds)."""
+    length = np.minimum(np.diff(t, append=np.inf), max_hold)
+    area = np.concatenate([[0.0], np.cumsum(v * length)])
+    covered = np.concatenate([[0.0], np.cumsum(length)])
+    j = np.searchsorted(t, bounds, side='right') - 1  # last reading at or before the bound
+    jc = np.maximum(j, 0)
+    partial = np.clip(bounds - t[jc], 0.0, length[jc])
+    started = j >= 0
+    return (np.where(started, area[jc] + v[jc] * partial, 0.0),
+            np.where(started, covered[jc] + partial, 0.0))
+
+
+def resample_hourly(times, values, start=None, hours=None, max_hold=3600.0, method='time', min_coverage=0.0):
+    """Hourly (hour starts, float32 (hours, C) means, uint8 quality) from irregular readings.
+
+    ``start`` (an hour) and ``hours`` default to the span from the first to the last
+    reading's hour. Readings before ``start`` still count through their hold. Hours whose
+    covered fraction is below ``min_coverage`` are left missing (time-weighted only).
+    """
+    if method not in ('time', 'mean'):
+        raise ValueError(f'unknown resampling method {method!r}')
+    times, values = dedupe(times, values)
+    if start is None:
+        if len(times) == 0:
+            return np.array([], dtype='datetime64[h]'), np.empty((0, values.shape[1]), np.float32), \
+                np.empty((0, values.shape[1]), np.uint8)
+        start = times[0].astype('datetime64[h]')
+    start = np.datetime64(start, 'h')
+    if hours is None:
+        hours = int((times[-1].astype('datetime64[h]') - start) // HOUR) + 1 if len(times) else 0
+    hours = max(int(hours), 0)
+    out = np.full((hours, values.shape[1]), np.nan, dtype=np.float32)
+    t = (times - start.astype('datetime64[s]')) / SECOND
+    bounds = np.arange(hours + 1) * 3600.0
+
+    for c in range(values.shape[1]):
+        ok = ~np.isnan(values[:, c])
+        tc, vc = t[ok], values[ok, c]
+        if len(tc) == 0:
+            continue
+        if method == 'time':
+            area, covered = _held_integrals(tc, vc, max_hold, bounds)
+            weight = np.diff(covered)
+            sums = np.diff(area)
+            good = (weight > 0) & (weight >= min_coverage * 3600.0)
+        else:
+            index = np.floor(tc / 3600.0).astype(np.int64)
+            inside = (index >= 0) & (index < hours)
+            weight = np.bincount(index[inside], minlength=hours).astype(np.float64)
+            sums = np.bincount(index[inside], weights=vc[inside], minlength=hours)
+            good = weight > 0
+        out[good, c] = sums[good] / weight[good]
+
+    quality = np.where(np.isnan(out), MISSING, OBSERVED).astype(np.uint8)
+    return start + np.arange(hours) * HOUR, out, quality
+
+
+def calendar_index(hours):
+    """(day-of-year 0..365, hour-of-day 0..23) integer arrays for datetime64[h] values."""
+    hours = np.asarray(hours, dtype='datetime64[h]')
+    days = hours.astype('datetime64[D]')
+    doy = (days - hours.astype('datetime64[Y]')) // np.timedelta64(1, 'D')
+    return doy.astype(np.int64), ((hours - days) // HOUR).astype(np.int64)
+
+
+def _circular_window_sum(a, k):
+    """Sum over a[i - k : i + k + 1] along axis 0, wrapping around the ends."""
+    padded = np.concatenate([a[-k:], a, a[:k]])
+    cumulative = np.concatenate([np.zeros((1,) + a.shape[1:]), np.cumsum(padded, axis=0)])
+    return cumulative[2 * k + 1:] - cumulative[:-2 * k - 1]
+
+
+def climatology(hours, values, smooth_days=7):
+    """(366, 24, C) float32 mean per (day of year, hour of day) from hourly values; NaN where unseen.
+
+    Day-of-year cells are averaged over +-smooth_days (circularly), so a few years of
+    history give a usable table.
+    """
+    values = _as_2d(values)
+    doy, hod = calendar_index(hours)
+    cell = doy * 24 + hod
+    present = ~np.isnan(values)
+    sums = np.zeros((366 * 24, values.shape[1]))
+    counts = np.zeros((366 * 24, values.shape[1]))
+    for c in range(values.shape[1]):
+        sums[:, c] = np.bincount(cell, weights=np.where(present[:, c], values[:, c], 0.0), minlength=366 * 24)
+        counts[:, c] = np.bincount(cell, weights=present[:, c], minlength=366 * 24)
+    sums, counts = sums.reshape(366, 24, -1), counts.reshape(366, 24, -1)
+    if smooth_days:
+        sums, counts = _circular_window_sum(sums, smooth_days), _circular_window_sum(counts, smooth_days)
+    table = np.full(sums.shape, np.nan, dtype=np.float32)
+    np.divide(sums, counts, out=table, where=counts > 0, casting='unsafe')
+    return table
+
+
+def fill_gaps(values, quality=None, max_gap=6, climatology_table=None, hours=None):
+    """Fill NaN runs of (hours, C) values; returns filled float32 copies of (values, quality).
+
+    Runs of at most ``max_gap`` hours with data on both sides are interpolated
+    linearly. Given ``climatology_table`` (see climatology) and the ``hours`` the rows
+    belong to, every remaining gap takes the table's value.
+    """
+    out = np.array(_as_2d(values), dtype=np.float32)
+    if quality is None:
+        quality = np.where(np.isnan(out), MISSING, OBSERVED)
+    quality = np.array(quality, dtype=np.uint8).reshape(out.shape)
+    n = len(out)
+    index = np.arange(n)
+    for c in range(out.shape[1]):
+        ok = ~np.isnan(out[:, c])
+        if ok.all() or not ok.any():
+            continue
+        previous = np.maximum.accumulate(np.where(ok, index, -1))
+        following = np.minimum.accumulate(np.where(ok, index, n)[::-1])[::-1]
+        fill = ~ok & (previous >= 0) & (following < n) & (following - previous - 1 <= max_gap)
+        out[fill, c] = np.interp(index[fill], index[ok], out[ok, c])
+        quality[fill, c] = INTERPOLATED
+    if climatology_table is not None:
+        doy, hod = calendar_index(hours)
+        normal = climatology_table[doy, hod]
+        fill = np.isnan(out) & ~np.isnan(normal)
+        out[fill] = normal[fill]
+        quality[fill] = CLIMATOLOGY
+    return out, quality
+
+
+class HourlyResampler:
+    """resample_hourly over time-sorted chunks of one series: each feed returns the hours it completed.
+
+    An hour is complete once a reading in a later hour arrives; the readings that can
+    still reach it (within ``max_hold`` of it) are carried into the next feed. Readings
+    older than the hours already returned are dropped and counted in ``late``.
+    """
+
+    def __init__(self, max_hold=3600.0, method='time'):
+        self.max_hold = max_hold
+        self.method = method
+        self.late = 0
+        self._times = None
+        self._values = None
+        self._next = None  # first hour not returned yet
+
+    def feed(self, times, values):
+        times = np.asarray(times, dtype='datetime64[s]')
+        values = _as_2d(values)
+        if self._next is not None:
+            late = times < self._next.astype('datetime64[s]')
+            self.late += int(late.sum())
+            times, values = times[~late], values[~late]
+            times = np.concatenate([self._times, times])
+            values = np.concatenate([self._values, values])
+        return self._emit(*dedupe(times, values), final=False)
+
+    def flush(self):
+        if self._times is None:
+            return self._emit(np.array([], dtype='datetime64[s]'), np.empty((0, 1)), final=True)
+        return self._emit(self._times, self._values, final=True)
+
+    def _emit(self, times, values, final):
+        ok = ~np.isnan(values).all(axis=1)
+        times, values = times[ok], values[ok]
+        if len(times) == 0:
+            return resample_hourly(times, values, hours=0)
+        last = times[-1].astype('datetime64[h]')
+        start = self._next if self._next is not None else times[0].astype('datetime64[h]')
+        count = int((last - start) // HOUR) + (1 if final else 0)
+        result = resample_hourly(times, values, start, count, self.max_hold, self.method)
+        if final:
+            self._times = self._values = self._next = None
+        else:
+            keep = times >= (last.astype('datetime64[s]') - np.timedelta64(int(np.ceil(self.max_hold)), 's'))
+            self._times, self._values, self._next = times[keep], values[keep], last
+        return result
@@ -0,0 +1,77 @@
+"""What-if scenarios over the recent history window.
+
+A scenario is a list of perturbations of ``seq_features`` channels:
+
+    {'feature': 'temp_c', 'op': 'offset', 'value': 5, 'hours': 48}
+    {'feature': 'rain_mmhr', 'op': 'scale', 'value': 2}
+    {'feature': 'humidity', 'op': 'set', 'value': 90, 'hours': 6, 'end_hours_ago': 12}
+
+``hours`` is the length of the affected range (default: the whole window)
+and ``end_hours_ago`` where it ends, counted back from the target hour
+(0 = up to and including the target hour). Within a scenario, ``set`` wins
+over ``scale``, which is applied before ``offset``.
+
+All scenarios are applied to one shared base window as (scenarios, steps,
+features) scale/offset/override arrays, so the window is built once and every
+scenario is scored in the same batch.
+"""
+import numpy as np
+
+OPS = ('offset', 'scale', 'set')
+# Cyclic calendar channels are derived from the timestamp and cannot be perturbed.
+CALENDAR_FEATURES = ('hour_sin', 'hour_cos', 'doy_sin', 'doy_cos')
+BOUNDS = {
+    'rain_mmhr': (0.0, None),
+    'wind_ms': (0.0, None),
+    'humidity': (0.0, 100.0),
+}
+
+
+def step_range(steps, hours=None, end_hours_ago=0):
+    """Row slice of a window (oldest row first, target hour last) for a perturbation range."""
+    if end_hours_ago < 0 or end_hours_ago >= steps:
+        raise ValueError(f'end_hours_ago must be between 0 and {steps - 1}')
+    stop = steps - end_hours_ago
+    if hours is None:
+        return slice(0, stop)
+    if hours < 1:
+        raise ValueError('hours must be positive')
+    return slice(max(0, stop - hours), stop)
+
+
+def build_transforms(scenarios, seq_features, steps):
+    """(scale, offset, override, mask) arrays of shape (len(scenarios), steps, n_features)."""
+    shape = (len(scenarios), steps, len(seq_features))
+    scale = np.ones(shape)
+    offset = np.zeros(shape)
+    override = np.zeros(shape)
+    mask = np.zeros(shape, dtype=bool)
+    column = {name: i for i, name in enumerate(seq_features)}
+    for s, perturbations in enumerate(scenarios):
+        for p in perturbations:
+            feature, op, value = p['feature'], p['op'], float(p['value'])
+            if feature not in column or feature in CALENDAR_FEATURES:
+                raise ValueError(f'cannot perturb {feature!r}')
+            if op not in OPS:
+                raise ValueError(f'unknown op {op!r} (expected one of {", ".join(OPS)})')
+            rows = step_range(steps, p.get('hours'), p.get('end_hours_ago', 0))
+            c = column[feature]
+            if op == 'offset':
+                offset[s, rows, c] += value
+            elif op == 'scale':
+                scale[s, rows, c] *= value
+            else:
+                override[s, rows, c] = value
+                mask[s, rows, c] = True
+    return scale, offset, override, mask
+
+
+def apply_scenarios(base, scenarios, seq_features):
+    """(len(scenarios), steps, n_features) perturbed copies of one (steps, n_features) base window."""
+    scale, offset, override, mask = build_transforms(scenarios, seq_features, base.shape[0])
+    windows = np.where(mask, override, base[None] * scale + offset)
+    for feature, (low, high) in BOUNDS.items():
+        if feature in seq_features:
+            c = seq_features.index(feature)
+            np.clip(windows[:, :, c], low, high, out=windows[:, :, c])
+    return windows
@@ -0,0 +1,149 @@
+"""Shadow evaluation of a candidate model on live traffic.
+
+A sampled fraction of forecast requests is handed to a single low-priority
+background thread that scores the same inputs with the candidate bundle
+(from its own ModelRegistry, e.g. ``SHADOW_MODELS_DIR``) and records how
+often the two models disagree and how their inference latencies compare.
+Handlers only do a random draw and a non-blocking enqueue; when the worker
+falls behind, tasks are dropped and counted, so responses never wait on the
+shadow.
+
+The candidate scores the primary's inputs: the last ``candidate.window``
+hours of the raw window the primary built. When the primary has no window
+(table and cache hits), a shorter one or different features, the worker
+builds the candidate's window with the same ``window_inputs`` the server uses
+(observations, stored history, then the key-seeded synthetic generator).
+"""
+import queue
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+import numpy as np
+
+from metrics import metrics
+from prewarm import lower_thread_priority
+from synthetic import time_feature_rows
+
+ENGINE = 'shadow'
+
+
+class ShadowEvaluator:
+    def __init__(self, registry, window_inputs, sample_rate=0.1, queue_size=256, log=None):
+        self.registry = registry
+        self.window_inputs = window_inputs  # (bundle, target_times) -> (seq_raw, seq_input, sources), see main.py
+        self.sample_rate = sample_rate
+        self.log = log
+        self.cities = set(registry.discover())
+        self.scored = 0
+        self.disagreements = 0
+        self.dropped = 0
+        self.failures = 0
+        self.pairs = Counter()  # (primary prediction, shadow prediction) -> count
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._thread = None
+
+    # -- request side --------------------------------------------------------
+
+    def sampled(self, city):
+        return city in self.cities and random.random() < self.sample_rate
+
+    def submit(self, bundle, key, target_time, yhat, seq_raw=None, time_raw=None, primary_ms=None):
+        """Queue one request for shadow scoring; never blocks. Returns False if it was dropped."""
+        task = (bundle, key, target_time, np.asarray(yhat, dtype=np.float32), seq_raw, time_raw, primary_ms)
+        try:
+            self._queue.put_nowait(task)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            metrics.incr('shadow_dropped')
+            return False
+
+    # -- lifecycle -----------------------------------------------------------
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='shadow-eval', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(5.0)
+            self._thread = None
+
+    def _run(self):
+        lower_thread_priority()
+        while not self._stop.is_set():
+            try:
+                task = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self.score(*task)
+            except Exception as e:
+                self.failures += 1
+                metrics.incr('shadow_failures')
+                print(f"Shadow scoring failed: {e}")
+
+    # -- scoring -------------------------------------------------------------
+
+    def score(self, primary, key, target_time, yhat, seq_raw=None, time_raw=None, primary_ms=None):
+        candidate = self.registry.get(primary.city)
+        if seq_raw is not None and seq_raw.shape[0] >= candidate.window \
+                and candidate.seq_features == primary.seq_features:
+            seq_raw = seq_raw[-candidate.window:]
+        else:
+            seq_raw = self.window_inputs(candidate, [target_time])[0][0]
+        if time_raw is None or candidate.time_features != primary.time_features:
+            time_raw = time_feature_rows([target_time], candidate.time_features)[0]
+
+        started = time.perf_counter()
+        shadow_yhat = candidate.predict(*candidate.scale_batch(seq_raw[None], time_raw[None]), batch_size=1)[0]
+        shadow_ms = (time.perf_counter() - started) * 1000
+
+        primary_pred = primary.classes[int(np.argmax(yhat))]
+        shadow_pred, shadow_probs = candidate.decode(shadow_yhat)
+        agree = primary_pred == shadow_pred
+        self.scored += 1
+        self.pairs[(primary_pred, shadow_pred)] += 1
+        metrics.incr('shadow_scored')
+        if not agree:
+            self.disagreements += 1
+            metrics.incr('shadow_disagreements')
+        metrics.observe('shadow_latency_ms', shadow_ms)
+        if primary_ms is not None:
+            metrics.observe('shadow_latency_delta_ms', shadow_ms - primary_ms)
+        if candidate.classes == primary.classes:
+            metrics.observe('shadow_prob_l1', float(np.abs(shadow_yhat - yhat).sum()))
+
+        if self.log is not None:
+            self.log.log({
+                'ts': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+                'key': key,
+                'engine': ENGINE,
+                'agree': agree,
+                'primary': {'version': primary.version, 'prediction': primary_pred,
+                            'latency_ms': None if primary_ms is None else round(primary_ms, 3)},
+                'shadow': {'version': candidate.version, 'prediction': shadow_pred,
+                           'probabilities': shadow_probs, 'latency_ms': round(shadow_ms, 3)},
+            })
+        return agree
+
+    def stats(self):
+        return {
+            'sample_rate': self.sample_rate,
+            'cities': sorted(self.cities),
+            'candidates': {city: info['version'] for city, info in self.registry.stats()['loaded'].items()},
+            'queued': self._queue.qsize(),
+            'scored': self.scored,
+            'disagreements': self.disagreements,
+            'disagreement_rate': self.disagreements / self.scored if self.scored else None,
+            'dropped': self.dropped,
+            'failures': self.failures,
+            'pairs': {f'{p}->{s}': n for (p, s), n in self.pairs.most_common(20)},
+        }
@@ -0,0 +1,177 @@
+"""Host-wide forecast cache shared by every uvicorn worker.
+
+Drop-in replacement for forecast_cache.ForecastCache backed by a SQLite file
+in WAL mode, so any number of worker processes can read concurrently while
+one writes, with no external server. Each row is a fixed-size record:
+
+    key TEXT (canonical key) | model_version | expires_at | last_access | source | probs
+
+where ``probs`` is a packed float32 vector of the class probabilities. The
+eviction policy matches the in-process cache: entries expire after ``ttl``
+seconds, and once the table holds more than ``capacity`` rows the least
+recently accessed ones are removed. Wall-clock time is used instead of a
+monotonic clock because it must be comparable across processes.
+
+The cache never fails a request: when SQLite reports an operational error
+(a lock held past the busy timeout, a full disk, an unreadable file) a
+lookup is a miss and a store is skipped, and the error is counted.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from forecast_cache import SOURCE_LIVE, SOURCE_PREWARM
+from metrics import metrics
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS forecasts (
+    key TEXT PRIMARY KEY,
+    model_version TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    source INTEGER NOT NULL,
+    probs BLOB NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS forecasts_last_access ON forecasts(last_access);
+'''
+
+_SOURCES = {SOURCE_LIVE: 0, SOURCE_PREWARM: 1}
+
+
+class SharedForecastCache:
+    def __init__(self, path, capacity=4096, ttl=6 * 3600.0, touch_interval=5.0, evict_every=32):
+        self.path = path
+        self.capacity = capacity
+        self.ttl = ttl
+        # LRU bookkeeping is a write; only refresh last_access when it is older than this.
+        self.touch_interval = touch_interval
+        self.evict_every = evict_every
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.hits = 0
+        self.misses = 0
+        self.prewarm_hits = 0
+        self.prewarmed = 0
+        self.evictions = 0
+        self.errors = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _error(self, operation, e):
+        with self._lock:
+            self.errors += 1
+        metrics.incr('forecast_cache_errors')
+        print(f"Shared forecast cache {operation} failed: {e}")
+
+    def get(self, key, model_version):
+        now = time.time()
+        try:
+            conn = self._conn()
+            row = conn.execute(
+                'SELECT model_version, expires_at, last_access, source, probs FROM forecasts WHERE key = ?',
+                (key,)).fetchone()
+            if row is None or row[0] != model_version or row[1] <= now:
+                # A version mismatch may come from a worker still on another model during a
+                # rollout; leave its row alone and let the next put overwrite it.
+                if row is not None and row[1] <= now:
+                    conn.execute('DELETE FROM forecasts WHERE key = ?', (key,))
+                row = None
+            elif now - row[2] >= self.touch_interval:
+                conn.execute('UPDATE forecasts SET last_access = ? WHERE key = ?', (now, key))
+        except sqlite3.OperationalError as e:
+            self._error('get', e)
+            row = None
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+            if row[3] == _SOURCES[SOURCE_PREWARM]:
+                self.prewarm_hits += 1
+        return np.frombuffer(row[4], dtype=np.float32)
+
+    def put(self, key, probs, model_version, source=SOURCE_LIVE):
+        now = time.time()
+        blob = np.asarray(probs, dtype=np.float32).tobytes()
+        try:
+            self._conn().execute(
+                'INSERT OR REPLACE INTO forecasts (key, model_version, expires_at, last_access, source, probs) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, model_version, now + self.ttl, now, _SOURCES[source], blob))
+        except sqlite3.OperationalError as e:
+            self._error('put', e)
+            return
+        with self._lock:
+            self._puts += 1
+            if source == SOURCE_PREWARM:
+                self.prewarmed += 1
+            evict = self._puts % self.evict_every == 0
+        if evict:
+            try:
+                self.evict()
+            except sqlite3.OperationalError as e:
+                self._error('evict', e)
+
+    def evict(self):
+        """Drop expired rows, then the least recently accessed rows beyond capacity."""
+        conn = self._conn()
+        expired = conn.execute('DELETE FROM forecasts WHERE expires_at <= ?', (time.time(),)).rowcount
+        excess = conn.execute(
+            'DELETE FROM forecasts WHERE key IN '
+            '(SELECT key FROM forecasts ORDER BY last_access DESC LIMIT -1 OFFSET ?)',
+            (self.capacity,)).rowcount
+        with self._lock:
+            self.evictions += excess
+        return expired + excess
+
+    def contains(self, key, model_version):
+        try:
+            row = self._conn().execute(
+                'SELECT 1 FROM forecasts WHERE key = ? AND model_version = ? AND expires_at > ?',
+                (key, model_version, time.time())).fetchone()
+        except sqlite3.OperationalError as e:
+            self._error('contains', e)
+            return False
+        return row is not None
+
+    def clear(self):
+        self._conn().execute('DELETE FROM forecasts')
+
+    def __len__(self):
+        return self._conn().execute('SELECT COUNT(*) FROM forecasts').fetchone()[0]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        try:
+            size = len(self)
+        except sqlite3.OperationalError as e:
+            self._error('size', e)
+            size = None
+        return {
+            'backend': 'shared',
+            'path': self.path,
+            'size': size,
+            'capacity': self.capacity,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'errors': self.errors,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'prewarmed': self.prewarmed,
+            'prewarm_hits': self.prewarm_hits,
+            'prewarm_uplift': self.prewarm_hits / lookups if lookups else 0.0,
+        }
@@ -1,12 +1,36 @@
 import os
+import sys
+import time
+from contextlib import asynccontextmanager
 import numpy as np
-import pandas as pd
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from datetime import datetime
 
-app = FastAPI(title='Will It Rain On My Parade - NYC')
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from forecast_keys import canonical_key, normalize_city
+from metrics import metrics
+from request_log import forecast_record, sink_from_env
+from timeparse import parse_datetime
+
+ENGINE = 'heuristic'
+request_log = sink_from_env(os.path.join(os.path.dirname(BACKEND_DIR), 'logs', 'requests'))
+
+
+@asynccontextmanager
+async def lifespan(app):
+    if request_log is not None:
+        request_log.start()
+    yield
+    if request_log is not None:
+        request_log.stop()
+
+
+app = FastAPI(title='Will It Rain On My Parade - NYC', lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -24,16 +48,15 @@ class ForecastRequest(BaseModel):
 def health():
     return {'status': 'ok'}
 
-@app.post('/api/v1/forecast')
-def forecast(req: ForecastRequest):
-    if req.city.lower() not in ['new york', 'nyc', 'new york city']:
-        raise HTTPException(status_code=400, detail='Forecasting available for NYC only (Team T-Minus Rain).')
-    
-    try:
-        target_time = pd.to_datetime(req.datetime)
-    except Exception:
-        raise HTTPException(status_code=400, detail='Invalid datetime format.')
+@app.get('/api/v1/metrics')
+def get_metrics():
+    return metrics.snapshot()
+
+if request_log is not None:
+    metrics.register_collector('request_log', request_log.stats)
 
+def heuristic_probabilities(target_time):
+    """Seasonal heuristic forecast; returns {label: percent} for Clear/Cloudy/Rain."""
     # Create realistic weather features based on season and time
     month = target_time.month
     day_of_year = target_time.timetuple().tm_yday
@@ -124,15 +147,37 @@ def forecast(req: ForecastRequest):
         'Cloudy': round(cloudy_prob * 100, 2),
         'Rain': round(rain_prob * 100, 2)
     }
+    return probs
+
+@app.post('/api/v1/forecast')
+def forecast(req: ForecastRequest):
+    started = time.perf_counter()
+    city = normalize_city(req.city)
+    if city != 'nyc':
+        raise HTTPException(status_code=400, detail='Forecasting available for NYC only (Team T-Minus Rain).')
+    
+    try:
+        target_time = parse_datetime(req.datetime)
+    except ValueError:
+        raise HTTPException(status_code=400, detail='Invalid datetime format.')
+
+    probs = heuristic_probabilities(target_time)
     
     # Get prediction
     pred = max(probs, key=probs.get)
 
-    return {
+    response = {
         'time': str(target_time),
         'prediction': pred,
         'probabilities': probs
     }
+    latency_ms = (time.perf_counter() - started) * 1000
+    metrics.incr('forecasts_served')
+    metrics.observe('forecast_latency_ms', latency_ms)
+    if request_log is not None:
+        request_log.log(forecast_record(req.city, req.datetime, canonical_key(city, target_time),
+                                        ENGINE, latency_ms, response))
+    return response
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,295 @@
+"""Hyperparameter sweep for a city's LSTM on a local process pool.
+
+    python sweep.py --city nyc --windows 168 360 720 --units 64 128 256 --dropouts 0.2 0.3 --workers 3
+
+Preprocessing happens once, in this process: windows are selected for the
+longest window length (so every trial trains and validates on the same
+window ends and labels; a shorter trial uses the last L hours of each),
+split in time order, and the series is scaled with scalers fitted on the
+training part. The scaled series and time features are written as ``.npy``
+files under ``<out>/data/``. Every trial opens them with ``mmap_mode='r'``
+and gathers its batches from the mapping, so all workers read one copy in
+the page cache instead of each holding its own.
+
+Trials (the grid of --windows x --units x --dropouts x --learning-rates) run
+in ``--workers`` spawned processes, each capped at ``--threads`` TensorFlow
+threads (default: the CPUs divided among the workers). Losing trials stop
+early by the median rule: after ``--grace`` epochs, a trial whose best
+validation loss so far is worse than the median of the other trials' best
+losses at the same epoch stops. Trials share their per-epoch losses as small
+JSON files under ``<out>/trials/``.
+
+Each trial's model is written in the ModelRegistry artifact layout to
+``<out>/trials/<name>/``; ``<out>/golden/`` holds held-out windows of the
+longest length, which hot-reload validation cuts to any shorter window.
+Once all trials have finished, this process measures each model's
+single-request latency with nothing else running and writes
+``<out>/leaderboard.json`` sorted by validation loss.
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from distill import request_latency_ms
+from history_store import HistoryStore
+from labels import CLASSES
+from model_registry import artifact_paths
+from train import (DEFAULT_HISTORY, DEFAULT_OUT, SEQ_FEATURES, TIME_FEATURES, build_model, drift_reference, fit_scalers,
+                   load_series, select_windows, split_windows, time_feature_array, write_artifacts, write_golden)
+
+DEFAULT_SWEEP = os.path.join(DEFAULT_OUT, 'sweep')
+
+
+def trial_name(params):
+    return f"w{params['window']}-u{params['units']}-d{params['dropout']:g}-lr{params['learning_rate']:g}"
+
+
+def grid(windows, units, dropouts, learning_rates):
+    return [{'window': w, 'units': u, 'dropout': d, 'learning_rate': lr}
+            for w, u, d, lr in itertools.product(windows, units, dropouts, learning_rates)]
+
+
+# -- shared dataset --------------------------------------------------------------
+
+
+def prepare(store, out_dir, window, horizon=1, stride=1, val_fraction=0.1, max_filled_fraction=0.25, golden=256,
+            log=print):
+    """Select, split and scale the history once; writes <out>/data/ and returns the number of windows."""
+    import joblib
+
+    hours, values, quality = load_series(store)
+    ends, labels = select_windows(values, quality, window, horizon, stride, max_filled_fraction)
+    (train_ends, train_labels), (val_ends, val_labels) = split_windows(ends, labels, val_fraction, window + horizon)
+    if len(train_ends) == 0 or len(val_ends) == 0:
+        raise ValueError(f'not enough {window}-hour windows in the history of {store.city} for a train/validation split')
+    log(f'{store.city}: {len(train_ends)} training / {len(val_ends)} validation windows')
+
+    scaler, time_scaler = fit_scalers(values, hours, train_ends, window)
+    data_dir = os.path.join(out_dir, 'data')
+    os.makedirs(data_dir, exist_ok=True)
+    series = ((values - scaler.mean_) / scaler.scale_).astype(np.float32)
+    np.save(os.path.join(data_dir, 'series.npy'), series)
+    np.save(os.path.join(data_dir, 'time.npy'), time_scaler.transform(time_feature_array(hours)).astype(np.float32))
+    np.savez(os.path.join(data_dir, 'windows.npz'), train_ends=train_ends, train_labels=train_labels,
+             val_ends=val_ends, val_labels=val_labels)
+    joblib.dump({'scaler': scaler, 'time_scaler': time_scaler,
+                 'drift_reference': drift_reference(series, train_ends, window)}, os.path.join(data_dir, 'scalers.gz'))
+    write_golden(out_dir, store.city, values, hours, val_ends, val_labels, window, golden)
+    return len(train_ends), len(val_ends)
+
+
+def memmap_dataset(series, time_inputs, ends, labels, window, batch_size, n_classes, shuffle=False, seed=0):
+    """train.make_dataset over memory-mapped arrays: each batch is gathered from the mapping in numpy."""
+    import tensorflow as tf
+
+    offsets = np.arange(-window + 1, 1)
+
+    def gather(end):
+        return series[end[:, None] + offsets], time_inputs[end]
+
+    def to_batch(end, label):
+        seq, tim = tf.numpy_function(gather, [end], (tf.float32, tf.float32))
+        seq.set_shape((None, window, series.shape[1]))
+        tim.set_shape((None, time_inputs.shape[1]))
+        return (seq, tim), tf.one_hot(label, n_classes)
+
+    ds = tf.data.Dataset.from_tensor_slices((ends.astype(np.int64), labels.astype(np.int32)))
+    if shuffle:
+        ds = ds.shuffle(len(ends), seed=seed, reshuffle_each_iteration=True)
+    return ds.batch(batch_size).map(to_batch, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+
+
+# -- trials (run in the workers) ---------------------------------------------------
+
+
+def _read_curves(trials_dir, skip):
+    curves = []
+    for name in os.listdir(trials_dir):
+        if name.endswith('.json') and name[:-5] != skip:
+            try:
+                with open(os.path.join(trials_dir, name)) as f:
+                    curves.append(json.load(f)['val_loss'])
+            except (OSError, ValueError, KeyError):
+                continue  # being replaced right now
+    return curves
+
+
+def _write_curve(trials_dir, name, record):
+    path = os.path.join(trials_dir, name + '.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(record, f)
+    os.replace(path + '.tmp', path)
+
+
+def median_stop(best, epoch, curves, min_peers=2):
+    """True when best (this trial's lowest loss up to epoch) is worse than the peers' median at epoch."""
+    peers = [min(c[:epoch]) for c in curves if len(c) >= epoch]
+    return len(peers) >= min_peers and best > float(np.median(peers))
+
+
+def _init_worker(threads):
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    import tensorflow as tf
+
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def run_trial(out_dir, city, params, epochs, batch_size, patience, grace, min_peers, seed):
+    """Train one trial on the memory-mapped dataset; returns its leaderboard row."""
+    import joblib
+    import tensorflow as tf
+
+    name = trial_name(params)
+    data_dir, trials_dir = os.path.join(out_dir, 'data'), os.path.join(out_dir, 'trials')
+    series = np.load(os.path.join(data_dir, 'series.npy'), mmap_mode='r')
+    time_inputs = np.load(os.path.join(data_dir, 'time.npy'), mmap_mode='r')
+    with np.load(os.path.join(data_dir, 'windows.npz')) as w:
+        train_ends, train_labels, val_ends, val_labels = (w[k] for k in ('train_ends', 'train_labels',
+                                                                        'val_ends', 'val_labels'))
+    n_classes = len(CLASSES)
+    tf.keras.utils.set_random_seed(seed)
+    train_ds = memmap_dataset(series, time_inputs, train_ends, train_labels, params['window'], batch_size,
+                              n_classes, shuffle=True, seed=seed)
+    val_ds = memmap_dataset(series, time_inputs, val_ends, val_labels, params['window'], batch_size, n_classes)
+    model = build_model(params['window'], series.shape[1], time_inputs.shape[1], n_classes, params['learning_rate'],
+                        params['units'], params['dropout'])
+
+    record = {'params': params, 'val_loss': [], 'val_accuracy': [], 'pruned_at': None}
+
+    class Report(tf.keras.callbacks.Callback):
+        def on_epoch_end(self, epoch, logs=None):
+            record['val_loss'].append(float(logs['val_loss']))
+            record['val_accuracy'].append(float(logs['val_accuracy']))
+            _write_curve(trials_dir, name, record)
+            done = epoch + 1
+            if done >= grace and done < epochs and median_stop(min(record['val_loss']), done,
+                                                               _read_curves(trials_dir, name), min_peers):
+                record['pruned_at'] = done
+                _write_curve(trials_dir, name, record)
+                self.model.stop_training = True
+
+    callbacks = [Report()]
+    if patience:
+        callbacks.append(tf.keras.callbacks.EarlyStopping(patience=patience, restore_best_weights=True))
+    started = time.perf_counter()
+    # train_ds is shuffled by tf.data already.
+    model.fit(train_ds, validation_data=val_ds, epochs=epochs, callbacks=callbacks, verbose=0, shuffle=False)
+    best = int(np.argmin(record['val_loss']))
+    scalers = joblib.load(os.path.join(data_dir, 'scalers.gz'))
+    write_artifacts(os.path.join(trials_dir, name), city, model, scalers['scaler'], scalers['time_scaler'],
+                    SEQ_FEATURES, TIME_FEATURES, drift_reference=scalers.get('drift_reference'))
+    return {
+        'trial': name,
+        **params,
+        'params': int(model.count_params()),
+        'epochs': len(record['val_loss']),
+        'pruned_at': record['pruned_at'],
+        'val_loss': record['val_loss'][best],
+        'val_accuracy': record['val_accuracy'][best],
+        'train_seconds': round(time.perf_counter() - started, 1),
+    }
+
+
+# -- CLI -------------------------------------------------------------------------
+
+
+def sweep(store, out_dir, trials, workers=2, threads=None, epochs=10, batch_size=64, patience=3, grace=2, min_peers=2,
+          horizon=1, stride=1, val_fraction=0.1, max_filled_fraction=0.25, golden=256, seed=0, log=print):
+    """Run every trial in trials (dicts from grid()); returns the leaderboard, best first."""
+    train_n, val_n = prepare(store, out_dir, max(t['window'] for t in trials), horizon, stride, val_fraction,
+                             max_filled_fraction, golden, log)
+    trials_dir = os.path.join(out_dir, 'trials')
+    os.makedirs(trials_dir, exist_ok=True)
+    for name in os.listdir(trials_dir):
+        if name.endswith('.json'):
+            os.remove(os.path.join(trials_dir, name))  # curves of an earlier sweep would skew the median
+    workers = max(1, min(workers, len(trials)))
+    threads = threads or max(1, (os.cpu_count() or 1) // workers)
+    log(f'{len(trials)} trials on {workers} workers x {threads} threads')
+
+    rows = []
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'), initializer=_init_worker,
+                             initargs=(threads,)) as pool:
+        futures = {pool.submit(run_trial, out_dir, store.city, params, epochs, batch_size, patience, grace, min_peers,
+                               seed): trial_name(params) for params in trials}
+        for future in as_completed(futures):
+            try:
+                row = future.result()
+            except Exception as e:  # one broken trial shouldn't lose the others
+                log(f'{futures[future]}: failed: {e}')
+                continue
+            rows.append(row)
+            log(f"{row['trial']}: val_loss {row['val_loss']:.4f}, val_accuracy {row['val_accuracy']:.3f}, "
+                f"{row['epochs']} epochs" + (f", pruned at {row['pruned_at']}" if row['pruned_at'] else ''))
+
+    from tensorflow.keras.models import load_model
+
+    for row in rows:
+        row['latency_ms'] = round(request_latency_ms(load_model(artifact_paths(os.path.join(trials_dir, row['trial']),
+                                                                               store.city).model)), 2)
+    rows.sort(key=lambda r: r['val_loss'])
+    with open(os.path.join(out_dir, 'leaderboard.json'), 'w') as f:
+        json.dump({'city': store.city, 'train_windows': train_n, 'val_windows': val_n, 'trials': rows}, f, indent=1)
+    return rows
+
+
+def print_leaderboard(rows, log=print):
+    log(f"{'trial':<28}{'params':>9}{'epochs':>7}{'val_loss':>10}{'val_acc':>9}{'ms':>8}")
+    for row in rows:
+        epochs = f"{row['epochs']}" + ('*' if row['pruned_at'] else '')
+        log(f"{row['trial']:<28}{row['params']:>9}{epochs:>7}{row['val_loss']:>10.4f}{row['val_accuracy']:>9.3f}"
+            f"{row['latency_ms']:>8}")
+    if any(row['pruned_at'] for row in rows):
+        log('* stopped early by the median rule')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python sweep.py', description=__doc__.split('\n')[0])
+    parser.add_argument('--city', required=True)
+    parser.add_argument('--history', default=os.environ.get('HISTORY_DIR', DEFAULT_HISTORY), help='history store root')
+    parser.add_argument('--out', default=DEFAULT_SWEEP, help='sweep directory (data, trials, leaderboard)')
+    parser.add_argument('--windows', type=int, nargs='+', default=[168, 360, 720], help='window lengths (hours)')
+    parser.add_argument('--units', type=int, nargs='+', default=[64, 128, 256], help='LSTM units')
+    parser.add_argument('--dropouts', type=float, nargs='+', default=[0.2, 0.3])
+    parser.add_argument('--learning-rates', type=float, nargs='+', default=[1e-3])
+    parser.add_argument('--workers', type=int, default=2, help='trials trained at once')
+    parser.add_argument('--threads', type=int, help='TensorFlow threads per trial (default: CPUs / workers)')
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--patience', type=int, default=3, help='early-stopping patience (0 disables)')
+    parser.add_argument('--grace', type=int, default=2, help='epochs before the median rule can stop a trial')
+    parser.add_argument('--min-peers', type=int, default=2, help='trials to compare against before stopping one')
+    parser.add_argument('--horizon', type=int, default=1, help='hours after the window end that are labelled')
+    parser.add_argument('--stride', type=int, default=1, help='hours between consecutive window ends')
+    parser.add_argument('--val-fraction', type=float, default=0.1)
+    parser.add_argument('--max-filled-fraction', type=float, default=0.25,
+                        help='share of interpolated/climatology hours allowed in a window')
+    parser.add_argument('--golden', type=int, default=256, help='held-out windows saved for reload validation')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    trials = grid(args.windows, args.units, args.dropouts, args.learning_rates)
+    try:
+        rows = sweep(HistoryStore(args.history, args.city), args.out, trials, args.workers, args.threads, args.epochs,
+                     args.batch_size, args.patience, args.grace, args.min_peers, args.horizon, args.stride,
+                     args.val_fraction, args.max_filled_fraction, args.golden, args.seed)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    print_leaderboard(rows)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
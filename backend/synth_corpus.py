@@ -0,0 +1,101 @@
+"""Generate a synthetic hourly history corpus in the history store layout.
+
+    python synth_corpus.py --cities nyc boston --start-year 1995 --years 30 [--root data/synthetic] [--seed 0]
+
+Every hour gets the seasonal formulas the server uses for synthetic windows
+(synthetic.seasonal_channels: the annual temperature, pressure and humidity
+cycles, rain in the rainy months, noisy wind), evaluated for that hour's own
+day of year and month. The cyclic hour/day-of-year channels are filled by the
+store, so the files hold exactly the model's ``seq_features`` and can be used
+wherever stored history is: train.py, backtest.py, sweep.py, distill.py, or
+the server itself with HISTORY_DIR pointed at ``--root``.
+
+Generation is vectorized over whole chunks of ``--chunk-years`` years and
+each chunk is written straight into the store's memory-mapped float32 year
+files before the next is drawn, so memory stays flat for any span. Every
+(seed, city, year) has its own random stream: a city-year is identical
+whatever the chunk size, worker count or other cities in the run. With
+``--workers N`` cities are generated in parallel processes.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from forecast_keys import key_seed, normalize_city
+from history_store import HOUR, WEATHER_CHANNELS, HistoryStore, year_start
+from synthetic import RAINY_MONTHS, draw_noise, seasonal_channels
+
+project_root = os.path.dirname(BACKEND_DIR)
+DEFAULT_ROOT = os.path.join(project_root, 'data', 'synthetic')
+
+
+def generate(city, start_year, years, seed=0):
+    """(hours, {channel: float32 values}) for whole years start_year .. start_year + years - 1."""
+    parts = []
+    for year in range(start_year, start_year + years):
+        hours = np.arange(year_start(year), year_start(year + 1), HOUR)
+        rng = np.random.default_rng([seed, key_seed(city), year])
+        parts.append((hours, draw_noise(rng, len(hours))))
+    hours = np.concatenate([h for h, _ in parts])
+    noise = {name: np.concatenate([n[name] for _, n in parts]) for name in parts[0][1]}
+    days = hours.astype('datetime64[D]')
+    hour_of_day = (hours - days) // HOUR
+    day_of_year = (days - hours.astype('datetime64[Y]')) // np.timedelta64(1, 'D') + 1
+    rainy = np.isin(hours.astype('datetime64[M]').astype(np.int64) % 12 + 1, RAINY_MONTHS)
+    channels = seasonal_channels(day_of_year, hour_of_day, rainy, noise)
+    return hours, {name: channels[name].astype(np.float32) for name in WEATHER_CHANNELS}
+
+
+def write_city(root, city, start_year, years, seed=0, chunk_years=1):
+    """Generate and store one city chunk by chunk; returns the number of hours written."""
+    store = HistoryStore(root, city)
+    written = 0
+    for first in range(start_year, start_year + years, chunk_years):
+        hours, columns = generate(city, first, min(chunk_years, start_year + years - first), seed)
+        written += store.write(hours, columns)
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python synth_corpus.py', description=__doc__.split('\n')[0])
+    parser.add_argument('--cities', nargs='+', required=True)
+    parser.add_argument('--root', default=DEFAULT_ROOT, help='history store root to write into')
+    parser.add_argument('--start-year', type=int, default=1995)
+    parser.add_argument('--years', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-years', type=int, default=1, help='years generated and written at a time')
+    parser.add_argument('--workers', type=int, default=1, help='cities generated in parallel')
+    args = parser.parse_args(argv)
+    if args.years < 1 or args.chunk_years < 1:
+        raise SystemExit('--years and --chunk-years must be at least 1')
+
+    cities = [normalize_city(c) for c in args.cities]
+    if None in cities:
+        raise SystemExit(f'invalid city name in {args.cities}')
+    started = time.perf_counter()
+    jobs = [(args.root, city, args.start_year, args.years, args.seed, args.chunk_years) for city in cities]
+    if args.workers > 1 and len(cities) > 1:
+        with ProcessPoolExecutor(min(args.workers, len(cities)),
+                                 mp_context=multiprocessing.get_context('spawn')) as pool:
+            counts = list(pool.map(write_city, *zip(*jobs)))
+    else:
+        counts = [write_city(*job) for job in jobs]
+    elapsed = time.perf_counter() - started
+    for city, n in zip(cities, counts):
+        print(f'{city}: {n} hours ({args.start_year}-{args.start_year + args.years - 1})')
+    total = sum(counts)
+    print(f'{total} rows in {elapsed:.1f}s ({total / elapsed * 60 / 1e6:.1f}M rows/min) under {args.root}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""Vectorized synthetic history windows.
+
+Same seasonal formulas as the original per-step loop in main.forecast, but
+generated for a whole batch of target times at once: (B, steps, 9) raw
+features in seq_features order.
+"""
+import numpy as np
+
+RAINY_MONTHS = (3, 4, 5, 9, 10, 11)
+
+
+def calendar_arrays(target_times):
+    """(month, day_of_year, hour, day_of_week) int arrays for a list of datetimes."""
+    month = np.array([t.month for t in target_times], dtype=np.int64)
+    doy = np.array([t.timetuple().tm_yday for t in target_times], dtype=np.int64)
+    hour = np.array([t.hour for t in target_times], dtype=np.int64)
+    dow = np.array([t.weekday() for t in target_times], dtype=np.int64)
+    return month, doy, hour, dow
+
+
+def step_calendar(doy, hour, steps):
+    """Per-step (hour_i, day_i) for windows ending at each (doy, hour), oldest step first."""
+    i = np.arange(steps)
+    offset = i - (steps - 1)  # negative values up to 0
+    hour_abs = hour[:, None] + offset
+    hour_i = hour_abs % 24
+    day_i = (doy[:, None] - (hour_abs < 0)) - ((steps - 1) - i)
+    wrapped = day_i % 365
+    day_i = np.where(day_i <= 0, np.where(wrapped == 0, 365, wrapped), day_i)
+    return hour_i, day_i
+
+
+def draw_noise(rng, shape):
+    """All random draws needed by seasonal_channels for an array of the given shape."""
+    return {
+        'temp': rng.normal(0, 0.8, shape),
+        'pressure': rng.normal(0, 2, shape),
+        'rain_u': rng.random(shape),
+        'rain': rng.exponential(0.3, shape),
+        'humidity': rng.normal(0, 5, shape),
+        'wind': rng.normal(0, 1, shape),
+    }
+
+
+def seeded_noise(seeds, steps):
+    """Per-window noise from one generator per seed, so a window never depends on its batch."""
+    draws = [draw_noise(np.random.default_rng(seed), steps) for seed in seeds]
+    return {name: np.stack([d[name] for d in draws]) for name in draws[0]}
+
+
+def seasonal_channels(day_i, hour_i, rainy, noise):
+    """Weather + cyclic channels for arrays of day/hour indices, keyed by feature name."""
+    temp_c = 10 + 20 * np.sin(2 * np.pi * (day_i - 80) / 365) + noise['temp']
+    pressure_hpa = 1013 + 10 * np.sin(2 * np.pi * (day_i - 200) / 365) + noise['pressure']
+    raining = rainy & (noise['rain_u'] < 0.15)
+    rain_mmhr = np.where(raining, noise['rain'], 0.0)
+    humidity = np.clip(50 + 30 * np.sin(2 * np.pi * (day_i - 120) / 365) + noise['humidity'], 20, 95)
+    wind_ms = np.maximum(0.0, 3 + noise['wind'])
+    return {
+        'temp_c': temp_c,
+        'pressure_hpa': pressure_hpa,
+        'rain_mmhr': rain_mmhr,
+        'humidity': humidity,
+        'wind_ms': wind_ms,
+        'hour_sin': np.sin(2 * np.pi * hour_i / 24),
+        'hour_cos': np.cos(2 * np.pi * hour_i / 24),
+        'doy_sin': np.sin(2 * np.pi * day_i / 365),
+        'doy_cos': np.cos(2 * np.pi * day_i / 365),
+    }
+
+
+def synthesize_windows(target_times, seq_features, steps=720, rng=None, seeds=None):
+    """Raw synthetic windows ending at each target time: float64 array (B, steps, len(seq_features)).
+
+    With ``seeds`` (one per target time) each window is reproducible on its own;
+    otherwise the whole batch draws from ``rng`` (a fresh generator by default).
+    """
+    month, doy, hour, _ = calendar_arrays(target_times)
+    hour_i, day_i = step_calendar(doy, hour, steps)
+    if seeds is not None:
+        noise = seeded_noise(seeds, steps)
+    else:
+        noise = draw_noise(rng if rng is not None else np.random.default_rng(), day_i.shape)
+    # Rain season follows the target month for the whole window, as in the original loop.
+    rainy = np.isin(month, RAINY_MONTHS)[:, None]
+    channels = seasonal_channels(day_i, hour_i, rainy, noise)
+    return np.stack([channels[name] for name in seq_features], axis=-1)
+
+
+def time_feature_rows(target_times, time_features):
+    """Time/context features for each target time: (B, len(time_features))."""
+    month, doy, hour, dow = calendar_arrays(target_times)
+    feature_map = {
+        'hour_sin': np.sin(2 * np.pi * hour / 24),
+        'hour_cos': np.cos(2 * np.pi * hour / 24),
+        'doy_sin': np.sin(2 * np.pi * doy / 365),
+        'doy_cos': np.cos(2 * np.pi * doy / 365),
+        'month': month.astype(np.float64),
+        'dayofweek': dow.astype(np.float64),
+    }
+    return np.stack([feature_map[name] for name in time_features], axis=-1)
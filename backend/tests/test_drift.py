@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from drift import DriftMonitor, reference_histogram
+
+FEATURES = ['temp_c', 'rain_mmhr', 'hour_sin', 'hour_cos']
+
+
+def sample(rng, n, temp_shift=0.0):
+    """Rows shaped like real inputs: normal temperature, mostly-dry rain, uniform hours."""
+    hours = rng.integers(0, 24, n)
+    rain = np.where(rng.random(n) < 0.9, 0.0, rng.exponential(2.0, n))
+    return np.column_stack([rng.normal(12 + temp_shift, 8, n), rain,
+                            np.sin(2 * np.pi * hours / 24), np.cos(2 * np.pi * hours / 24)])
+
+
+def bundle(training, reference=True):
+    mean, scale = training.mean(axis=0), training.std(axis=0)
+    return SimpleNamespace(
+        city='nyc', version='v1', seq_features=FEATURES, time_features=['month'],
+        scaler=SimpleNamespace(mean_=mean, scale_=scale),
+        time_scaler=SimpleNamespace(mean_=np.array([6.5]), scale_=np.array([3.5])),
+        drift_reference=reference_histogram((training - mean) / scale) if reference else None,
+    )
+
+
+def feed(monitor, model, rows):
+    for row in rows:
+        monitor.update(model, row, [6.0], now=0)
+    return monitor.stats(now=0)['cities']['nyc']
+
+
+def test_in_distribution_inputs_do_not_alert():
+    rng = np.random.default_rng(0)
+    city = feed(DriftMonitor(), bundle(sample(rng, 20000)), sample(rng, 500))
+    assert city['reference'] == 'training'
+    assert city['drifting'] == []
+    assert city['max_psi'] < 0.1
+
+
+def test_shifted_weather_alerts_but_calendar_channels_never_do():
+    rng = np.random.default_rng(1)
+    rows = sample(rng, 500, temp_shift=10)
+    rows[:, 2:] = [np.sin(2 * np.pi * 15 / 24), np.cos(2 * np.pi * 15 / 24)]  # every request is for 15:00
+    city = feed(DriftMonitor(), bundle(sample(rng, 20000)), rows)
+    assert city['drifting'] == ['temp_c']
+    assert city['seq_features']['hour_sin']['psi'] > 1  # reported, not alerted
+
+
+def test_without_a_training_histogram_skewed_channels_are_not_compared():
+    rng = np.random.default_rng(2)
+    city = feed(DriftMonitor(), bundle(sample(rng, 20000), reference=False), sample(rng, 500))
+    assert city['reference'] == 'normal'
+    assert city['seq_features']['rain_mmhr']['psi'] is None
+    assert city['seq_features']['rain_mmhr']['count'] == 500
+    assert city['drifting'] == []
@@ -0,0 +1,78 @@
+import hashlib
+import importlib
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from forecast_keys import canonical_key, hour_bucket, key_seed, normalize_city, parse_canonical_key
+from synthetic import synthesize_windows, time_feature_rows
+
+
+@pytest.fixture(scope='module')
+def main(tmp_path_factory):
+    """The server module with no models, caches or background jobs."""
+    root = tmp_path_factory.mktemp('server')
+    patch = pytest.MonkeyPatch()
+    for name, value in {'MODELS_DIR': root / 'models', 'HISTORY_DIR': root / 'history',
+                        'OBSERVATIONS_DIR': root / 'observations', 'REQUEST_LOG_DIR': '',
+                        'FORECAST_CACHE_BACKEND': 'memory', 'PRECOMPUTE_ENABLED': '0',
+                        'PREWARM_ENABLED': '0'}.items():
+        patch.setenv(name, str(value))
+    (root / 'models').mkdir()
+    yield importlib.import_module('main')
+    patch.undo()
+
+
+def test_normalize_city():
+    assert normalize_city(' New York ') == 'nyc'
+    assert normalize_city('San Francisco') == 'san_francisco'
+    assert normalize_city('../etc') is None
+
+
+def test_canonical_key_buckets_to_the_hour_and_round_trips():
+    key = canonical_key('nyc', datetime(2025, 1, 4, 19, 42, 7))
+    assert key == 'nyc|2025-01-04T19'
+    assert parse_canonical_key(key) == ('nyc', datetime(2025, 1, 4, 19))
+
+
+def test_key_seed_is_stable():
+    assert key_seed('nyc|2025-01-04T19') == key_seed('nyc|2025-01-04T19')
+    assert key_seed('nyc|2025-01-04T19') != key_seed('nyc|2025-01-04T20')
+    # Seeds must not change between releases: cached and logged forecasts depend on them.
+    assert key_seed('nyc|2025-01-04T19') == int.from_bytes(
+        hashlib.blake2b(b'nyc|2025-01-04T19', digest_size=8).digest(), 'little')
+
+
+def test_etag_is_deterministic(main):
+    key = canonical_key('nyc', main.parse_target_time('2025-01-04T19:15'))
+    assert main.forecast_etag(key, 'v1') == main.forecast_etag(key, 'v1')
+    assert main.forecast_etag(key, 'v1') != main.forecast_etag(key, 'v2')
+    assert main.forecast_etag(key, 'v1') != main.forecast_etag(canonical_key('nyc', datetime(2025, 1, 4, 20)), 'v1')
+
+
+@pytest.mark.parametrize('value', ['2025-01-04T15:00:00-04:00', '2025-01-04T19:00:00Z',
+                                   '2025-01-04T20:30:00+01:00', '2025-01-04 19:00'])
+def test_offset_times_are_the_same_forecast(main, value):
+    target_time = main.parse_target_time(value)
+    assert target_time.tzinfo is None and hour_bucket(target_time) == datetime(2025, 1, 4, 19)
+    key = canonical_key('nyc', target_time)
+    assert key == 'nyc|2025-01-04T19'
+    assert main.forecast_etag(key, 'v1') == main.forecast_etag('nyc|2025-01-04T19', 'v1')
+    # Key, seed and features see the same hour, so equal ETags mean equal bodies.
+    reference = datetime(2025, 1, 4, 19)
+    assert (time_feature_rows([target_time], ['hour_sin', 'hour_cos', 'doy_sin', 'month']) ==
+            time_feature_rows([reference], ['hour_sin', 'hour_cos', 'doy_sin', 'month'])).all()
+    features = ['temp_c', 'pressure_hpa', 'rain_mmhr', 'humidity', 'wind_ms']
+    assert (synthesize_windows([target_time], features, 24, seeds=[key_seed(key)]) ==
+            synthesize_windows([reference], features, 24, seeds=[key_seed(canonical_key('nyc', reference))])).all()
+
+
+def test_invalid_datetime_is_a_400(main):
+    with pytest.raises(main.HTTPException) as raised:
+        main.parse_target_time('not a date')
+    assert raised.value.status_code == 400
+
+
+def test_hour_bucket_converts_aware_times_to_utc():
+    aware = datetime(2025, 1, 4, 15, 30, tzinfo=timezone(timedelta(hours=-4)))
+    assert hour_bucket(aware) == datetime(2025, 1, 4, 19)
@@ -0,0 +1,83 @@
+import numpy as np
+
+from history_store import CHANNELS, HOUR, WEATHER_CHANNELS, HistoryStore, calendar_columns, hours_in_year
+from ingest_giovanni import fill_store, ingest
+from resample import INTERPOLATED, MISSING, OBSERVED
+
+TEMP = WEATHER_CHANNELS.index('temp_c')
+RAIN = WEATHER_CHANNELS.index('rain_mmhr')
+
+
+def hours(start, n):
+    return np.datetime64(start, 'h') + np.arange(n) * HOUR
+
+
+def test_write_then_read_round_trips_and_derives_calendar_channels(tmp_path):
+    store = HistoryStore(str(tmp_path), 'nyc')
+    times = hours('2023-12-31T20', 8)  # crosses into 2024
+    temps = np.arange(8, dtype=np.float32)
+    assert store.write(times, {'temp_c': temps}) == 8
+    assert store.years() == [2023, 2024]
+    assert len(store.year_array(2024)) == hours_in_year(2024) == 8784
+
+    reopened = HistoryStore(str(tmp_path), 'nyc')
+    window = reopened.read(times[0], 8)
+    np.testing.assert_array_equal(window[:, CHANNELS.index('temp_c')], temps)
+    assert np.isnan(window[:, CHANNELS.index('pressure_hpa')]).all()
+    for name, values in calendar_columns(times).items():
+        np.testing.assert_allclose(window[:, CHANNELS.index(name)], values, atol=1e-6)
+    # Hours nobody wrote read as NaN, even in years without a file.
+    assert np.isnan(reopened.read('2022-06-01T00', 3)).all()
+
+
+def test_quality_codes_default_to_observed_and_missing(tmp_path):
+    store = HistoryStore(str(tmp_path), 'nyc')
+    times = hours('2024-05-01T00', 4)
+    store.write(times, {'temp_c': [1.0, np.nan, 3.0, 4.0]})
+    codes = store.read_quality(times[0], 4)
+    assert list(codes[:, TEMP]) == [OBSERVED, MISSING, OBSERVED, OBSERVED]
+    assert (codes[:, RAIN] == MISSING).all()
+
+
+def test_skip_nan_keeps_stored_values_and_explicit_quality_is_kept(tmp_path):
+    store = HistoryStore(str(tmp_path), 'nyc')
+    times = hours('2024-05-01T00', 3)
+    store.write(times, {'temp_c': [1.0, 2.0, 3.0]})
+    store.write(times, {'temp_c': [np.nan, 20.0, np.nan]}, skip_nan=True)
+    np.testing.assert_array_equal(store.read(times[0], 3, ['temp_c'])[:, 0], [1.0, 20.0, 3.0])
+
+    store.write(times[1:2], {'temp_c': [2.5]}, quality={'temp_c': [INTERPOLATED]})
+    assert list(store.read_quality(times[0], 3)[:, TEMP]) == [OBSERVED, INTERPOLATED, OBSERVED]
+
+
+def write_giovanni_csv(path, variable, stamps, values, fill=-9999.0):
+    lines = [
+        'Title:,Time Series, Area-Averaged of test data',
+        f'Fill Value (mean_{variable}):,{fill}',
+        '',
+        f'time,{variable}',
+    ]
+    lines += [f'{t},{v}' for t, v in zip(stamps, values)]
+    path.write_text('\n'.join(lines) + '\n')
+
+
+def test_ingest_resamples_converts_units_and_fill_store_marks_interpolated(tmp_path):
+    csv = tmp_path / 'temp.csv'
+    stamps = ['2024-01-01 00:00:00', '2024-01-01 00:30:00', '2024-01-01 01:00:00',
+              '2024-01-01 02:00:00', '2024-01-01 04:00:00', '2024-01-01 05:00:00']
+    kelvin = [273.15, 275.15, 280.15, -9999.0, 285.15, 286.15]
+    write_giovanni_csv(csv, 'M2T1NXSLV_5_12_4_T2M', stamps, kelvin)
+    store = HistoryStore(str(tmp_path / 'store'), 'nyc')
+    ingest([str(csv)], store, chunk_rows=2, log=lambda *_: None, max_hold=3600.0)
+
+    start = np.datetime64('2024-01-01T00', 'h')
+    temps = store.read(start, 6, ['temp_c'])[:, 0]
+    np.testing.assert_allclose(temps[:2], [1.0, 7.0], atol=1e-4)  # half-hourly readings averaged, K -> C
+    assert np.isnan(temps[2]) and np.isnan(temps[3])  # the fill value is not a reading
+    np.testing.assert_allclose(temps[4:], [12.0, 13.0], atol=1e-4)
+
+    counts = fill_store(store, method='linear', max_gap=3, log=lambda *_: None)
+    assert counts == {'interpolated': 2}
+    np.testing.assert_allclose(store.read(start, 6, ['temp_c'])[2:4, 0], [8.666667, 10.333333], atol=1e-4)
+    assert list(store.read_quality(start, 6)[:, TEMP]) == [OBSERVED, OBSERVED, INTERPOLATED, INTERPOLATED,
+                                                           OBSERVED, OBSERVED]
@@ -0,0 +1,59 @@
+import os
+
+import numpy as np
+
+from observation_log import RECORD, ObservationLog
+
+
+def records(n, start=1_700_000_000):
+    out = np.zeros(n, dtype=RECORD)
+    out['ts'] = start + np.arange(n) * 3600
+    out['values'] = np.arange(n, dtype=np.float32)[:, None]
+    return out
+
+
+def test_append_read_and_rotate(tmp_path):
+    log = ObservationLog(str(tmp_path))
+    log.append('nyc', records(3))
+    assert log.rotate('nyc') == 1
+    log.append('nyc', records(2, start=1_800_000_000))
+    assert log.segments('nyc') == [0, 1]
+    assert len(log.read('nyc')) == 5
+    assert len(log.read('nyc', first_segment=1)) == 2
+    assert len(log.read('nyc', since_ts=1_800_000_000)) == 2
+    log.close()
+
+
+def test_recovers_from_a_truncated_record(tmp_path):
+    log = ObservationLog(str(tmp_path))
+    log.append('nyc', records(4))
+    path = os.path.join(log.worker_dir('nyc'), '0000000000.obs')
+    log.close()  # the process exits and releases its slot
+    with open(path, 'ab') as f:
+        f.write(records(1).tobytes()[:RECORD.itemsize // 2])  # crash mid-write
+
+    # Readers ignore the partial tail.
+    reader = ObservationLog(str(tmp_path))
+    np.testing.assert_array_equal(reader.read('nyc'), records(4))
+    reader.close()
+
+    # Reopening for writes drops it, so the next record stays aligned.
+    log = ObservationLog(str(tmp_path))
+    log.append('nyc', records(1, start=1_900_000_000))
+    assert os.path.getsize(path) == 5 * RECORD.itemsize
+    got = log.read('nyc')
+    log.close()
+    assert list(got['ts'][-2:]) == [records(4)['ts'][-1], 1_900_000_000]
+
+
+def test_each_log_writes_and_deletes_only_its_own_slot(tmp_path):
+    first, second = ObservationLog(str(tmp_path)), ObservationLog(str(tmp_path))
+    assert (first.worker, second.worker) == (0, 1)
+    first.append('nyc', records(2))
+    second.append('nyc', records(3))
+    assert first.rotate('nyc') == 1
+    assert first.delete_segments('nyc', below=1) == 1
+    assert first.segments('nyc') == [1]
+    assert len(second.read('nyc')) == 3
+    first.close()
+    second.close()
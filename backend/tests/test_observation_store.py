@@ -0,0 +1,143 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from history_store import CHANNELS, WEATHER_CHANNELS, HistoryStore
+from history_windows import HistoryWindows
+from observation_log import RECORD, ObservationLog
+from observation_store import ObservationStore
+from observations import EPOCH
+
+TEMP = WEATHER_CHANNELS.index('temp_c')
+STEPS = 24
+
+
+@pytest.fixture
+def bundle():
+    scaler = SimpleNamespace(mean_=np.zeros(len(CHANNELS)), scale_=np.ones(len(CHANNELS)))
+    return SimpleNamespace(city='nyc', window=STEPS, seq_features=list(CHANNELS), scaler=scaler, version='v1')
+
+
+def this_hour(hours_ago=0):
+    now = datetime.now(timezone.utc).replace(tzinfo=None, minute=0, second=0, microsecond=0)
+    return now - timedelta(hours=hours_ago)
+
+
+def readings(when, *temps):
+    out = np.zeros(len(temps), dtype=RECORD)
+    out['ts'] = int((when - EPOCH).total_seconds()) + np.arange(len(temps)) * 60
+    out['values'] = np.nan
+    out['values'][:, TEMP] = temps
+    return out
+
+
+def workers(tmp_path, n):
+    history = HistoryWindows(str(tmp_path / 'history'))
+    return [ObservationStore(ObservationLog(str(tmp_path / 'log')), history, interval=0) for _ in range(n)]
+
+
+def stored_temp(tmp_path, when):
+    return HistoryStore(str(tmp_path / 'history'), 'nyc').read(np.datetime64(when, 'h'), 1, ['temp_c'])[0, 0]
+
+
+def test_compaction_folds_every_slots_readings_of_an_hour(tmp_path, bundle):
+    first, second = workers(tmp_path, 2)
+    hour = this_hour(1)
+    for store, temps in ((first, (10.0, 12.0)), (second, (20.0,))):
+        store.open(bundle)
+        store.ingest('nyc', readings(hour, *temps))
+    assert (first.log.worker, second.log.worker) == (0, 1)
+
+    assert first.compact('nyc') and second.compact('nyc')
+    assert stored_temp(tmp_path, hour) == pytest.approx(14.0)  # not whichever slot compacted last
+
+    # A later reading of the same hour, after its earlier ones were compacted and deleted.
+    first.ingest('nyc', readings(hour + timedelta(minutes=30), 18.0))
+    assert first.compact('nyc')
+    assert stored_temp(tmp_path, hour) == pytest.approx(15.0)
+    assert first.log.read('nyc', worker=0).size == second.log.read('nyc', worker=1).size == 0
+    for store in (first, second):
+        store.log.close()
+
+
+def test_a_repeated_fold_after_a_crash_does_not_count_twice(tmp_path, bundle):
+    (store,) = workers(tmp_path, 1)
+    hour = this_hour(2)
+    store.open(bundle)
+    store.ingest('nyc', readings(hour, 10.0, 20.0))
+    end = store.log.rotate('nyc')
+    folded = store.load_folded('nyc')
+    # Crash after the history write but before the commit: the fold runs again from the old mark.
+    store._fold('nyc', store.log.read('nyc', end_segment=end), folded, STEPS)
+    assert store.compact('nyc')
+    assert stored_temp(tmp_path, hour) == pytest.approx(15.0)
+    assert store.load_folded('nyc')['counts'][:, TEMP].tolist() == [2]
+    store.log.close()
+
+
+def test_restart_restores_folded_hours_and_unfolded_segments_of_all_slots(tmp_path, bundle):
+    first, second = workers(tmp_path, 2)
+    hour = this_hour()
+    for store in (first, second):
+        store.open(bundle)
+    first.ingest('nyc', readings(hour, 10.0))
+    first.compact('nyc')
+    second.ingest('nyc', readings(hour, 20.0, 30.0))
+    for store in (first, second):
+        store.log.close()
+
+    (restarted,) = workers(tmp_path, 1)
+    ring = restarted.open(bundle)
+    assert restarted.recovery['nyc']['folded_hours'] == 1 and restarted.recovery['nyc']['replayed'] == 2
+    window = ring.raw[ring.head:ring.head + ring.steps]
+    assert window[-1, CHANNELS.index('temp_c')] == pytest.approx(20.0)
+    restarted.log.close()
+
+
+def test_orphaned_slots_are_adopted_and_keep_their_numbering(tmp_path, bundle):
+    first, second = workers(tmp_path, 2)
+    hour = this_hour(1)
+    for store, temp in ((first, 10.0), (second, 20.0)):
+        store.open(bundle)
+        store.ingest('nyc', readings(hour, temp))
+    second.log.close()  # the worker exits without compacting
+
+    assert first.compact('nyc')
+    assert stored_temp(tmp_path, hour) == pytest.approx(15.0)
+    mark = first.load_folded('nyc')['marks'][1]
+    assert first.log.segments('nyc', worker=1) == [mark]
+
+    (successor,) = workers(tmp_path, 1)  # claims the freed slot 1
+    successor.open(bundle)
+    successor.ingest('nyc', readings(hour + timedelta(minutes=30), 30.0))
+    assert successor.log.worker == 1 and successor.compact('nyc')
+    assert stored_temp(tmp_path, hour) == pytest.approx(20.0)
+    for store in (first, successor):
+        store.log.close()
+
+
+def test_a_worker_sees_readings_posted_to_another_right_away(tmp_path, bundle):
+    first, second = workers(tmp_path, 2)
+    hour = this_hour()
+    assert second.live(bundle) is None  # nothing logged for the city yet
+    first.open(bundle)
+    first.ingest('nyc', readings(hour, 10.0))
+    ring = second.live(bundle)
+    assert ring.covers(hour) and ring.raw[ring.head + ring.steps - 1, CHANNELS.index('temp_c')] == 10.0
+
+    second.ingest('nyc', readings(hour, 20.0))
+    first.ingest('nyc', readings(hour, 30.0))
+    assert first.live(bundle).readings == second.live(bundle).readings
+    for store in (first, second):
+        ring = store.live(bundle)
+        assert ring.raw[ring.head + ring.steps - 1, CHANNELS.index('temp_c')] == pytest.approx(20.0)
+
+    # The first worker compacts its segment before the second read all of it: the second rebuilds.
+    first.ingest('nyc', readings(hour, 40.0))
+    first.compact('nyc')
+    ring = second.live(bundle)
+    assert ring.raw[ring.head + ring.steps - 1, CHANNELS.index('temp_c')] == pytest.approx(25.0)
+    for store in (first, second):
+        store.log.close()
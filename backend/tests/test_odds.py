@@ -0,0 +1,61 @@
+import time
+
+import numpy as np
+import pytest
+
+from history_store import HOUR, HistoryStore
+from odds import OddsIndex, OddsIndexes
+
+START = np.datetime64('2022-01-01T00', 'h')
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = HistoryStore(str(tmp_path), 'nyc')
+    times = START + np.arange(2 * 8760) * HOUR
+    rng = np.random.default_rng(1)
+    store.write(times, {'wind_ms': rng.uniform(0, 10, len(times)).astype(np.float32)})
+    return store
+
+
+def brute_force(store, day, days, first_hour, last_hour, threshold):
+    times = START + np.arange(2 * 8760) * HOUR
+    wind = store.read(START, len(times), ['wind_ms'])[:, 0]
+    doy = (times.astype('datetime64[D]') - times.astype('datetime64[Y]')) // np.timedelta64(1, 'D')
+    hod = (times - times.astype('datetime64[D]')) // HOUR
+    window = (np.abs(doy - day) <= days) & (hod >= first_hour) & (hod <= last_hour)
+    return float((wind[window] >= np.float32(threshold)).mean())
+
+
+@pytest.mark.parametrize('threshold', [4.0, 5.0, 5.37])
+def test_thresholds_are_applied_exactly(store, threshold):
+    index = OddsIndex(store)
+    odds = index.query(40, 3, (10, 14), {'wind_ms': threshold})['thresholds']['wind_ms']
+    assert odds['threshold'] == threshold
+    assert odds['hours_fraction'] == pytest.approx(brute_force(store, 40, 3, 10, 14, threshold))
+    # 4.0 is a precomputed level; the others are built once and cached.
+    assert index.extra_builds == (0 if threshold == 4.0 else 1)
+    index.query(40, 3, (10, 14), {'wind_ms': threshold})
+    assert index.extra_builds == (0 if threshold == 4.0 else 1)
+
+
+def test_changed_store_is_rebuilt_in_the_background(store, tmp_path):
+    class History:
+        def store(self, city):
+            return self.current
+
+    history = History()
+    history.current = store
+    indexes = OddsIndexes(history)
+    first = indexes.get('nyc')
+    assert indexes.builds == 1
+
+    history.current = HistoryStore(str(tmp_path), 'nyc')  # what compaction publishes
+    assert indexes.get('nyc') is first  # still served while the new one builds
+    for _ in range(200):
+        if indexes.builds == 2:
+            break
+        time.sleep(0.01)
+    rebuilt = indexes.get('nyc')
+    assert indexes.builds == 2 and rebuilt is not first
+    assert indexes.get('nyc') is rebuilt
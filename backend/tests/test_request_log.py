@@ -0,0 +1,20 @@
+import gzip
+import json
+import os
+
+from request_log import RequestLogSink
+
+
+def test_sinks_rotating_together_never_share_a_file(tmp_path):
+    sinks = [RequestLogSink(str(tmp_path), compress=True) for _ in range(3)]
+    for i, sink in enumerate(sinks):
+        sink._write_batch([{'sink': i}])
+    for sink in sinks:
+        sink._close()
+    names = sorted(os.listdir(tmp_path))
+    assert len(names) == 3 and all(str(os.getpid()) in name for name in names)
+    records = []
+    for name in names:
+        with gzip.open(tmp_path / name, 'rt') as f:
+            records += [json.loads(line) for line in f]
+    assert sorted(r['sink'] for r in records) == [0, 1, 2]
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from resample import (CLIMATOLOGY, INTERPOLATED, MISSING, OBSERVED, HourlyResampler, climatology, dedupe,
+                      fill_gaps, resample_hourly)
+
+T0 = np.datetime64('2024-03-01T00:00:00', 's')
+
+
+def at(*minutes):
+    return T0 + np.array(minutes, dtype=np.int64) * np.timedelta64(60, 's')
+
+
+def test_dedupe_averages_readings_with_the_same_time_and_ignores_nan():
+    times = at(30, 0, 30, 30)
+    values = np.array([[1.0, np.nan], [5.0, 5.0], [3.0, np.nan], [np.nan, np.nan]])
+    unique, means = dedupe(times, values)
+    assert list(unique) == list(at(0, 30))
+    np.testing.assert_array_equal(means[0], [5.0, 5.0])
+    assert means[1, 0] == 2.0 and np.isnan(means[1, 1])
+
+
+def test_time_weighted_mean_carries_a_reading_into_the_next_hour():
+    # 10 holds :00-:50, 20 holds :50 until the next reading at 01:30.
+    hours, values, quality = resample_hourly(at(0, 50, 90), [10.0, 20.0, 30.0])
+    assert list(hours) == [np.datetime64('2024-03-01T00', 'h'), np.datetime64('2024-03-01T01', 'h')]
+    assert values[0, 0] == pytest.approx((10 * 50 + 20 * 10) / 60)
+    assert values[1, 0] == pytest.approx((20 * 30 + 30 * 30) / 60)
+    assert (quality == OBSERVED).all()
+    assert values.dtype == np.float32
+
+
+def test_max_hold_leaves_hours_without_coverage_missing():
+    hours, values, quality = resample_hourly(at(0, 180), [1.0, 2.0], max_hold=1800)
+    assert len(hours) == 4
+    assert values[0, 0] == 1.0 and values[3, 0] == 2.0
+    assert np.isnan(values[1:3, 0]).all()
+    assert (quality[1:3] == MISSING).all()
+
+
+def test_mean_method_ignores_hold():
+    _, values, _ = resample_hourly(at(0, 50, 70), [10.0, 20.0, 40.0], method='mean')
+    np.testing.assert_allclose(values[:, 0], [15.0, 40.0])
+
+
+def test_chunked_resampler_matches_one_shot():
+    rng = np.random.default_rng(0)
+    times = np.sort(T0 + rng.integers(0, 48 * 3600, 400) * np.timedelta64(1, 's'))
+    values = rng.normal(size=(400, 2))
+    expected = resample_hourly(times, values)
+
+    resampler = HourlyResampler()
+    parts = [resampler.feed(times[i:i + 37], values[i:i + 37]) for i in range(0, 400, 37)]
+    parts.append(resampler.flush())
+    hours = np.concatenate([p[0] for p in parts])
+    got = np.concatenate([p[1] for p in parts])
+    assert list(hours) == list(expected[0])
+    np.testing.assert_allclose(got, expected[1], rtol=1e-6)
+    assert resampler.late == 0
+
+
+def test_fill_gaps_interpolates_short_runs_only():
+    values = np.array([0.0, np.nan, np.nan, 3.0, np.nan, np.nan, np.nan, np.nan, 8.0, np.nan])
+    filled, quality = fill_gaps(values, max_gap=3)
+    np.testing.assert_allclose(filled[:4, 0], [0, 1, 2, 3])
+    assert (quality[1:3, 0] == INTERPOLATED).all()
+    assert np.isnan(filled[4:8, 0]).all() and (quality[4:8, 0] == MISSING).all()
+    # No observation after the last gap: nothing to interpolate towards.
+    assert np.isnan(filled[9, 0])
+    assert quality[0, 0] == OBSERVED and quality[8, 0] == OBSERVED
+
+
+def test_fill_gaps_uses_climatology_for_long_gaps():
+    hours = np.datetime64('2023-01-01T00', 'h') + np.arange(24 * 365) * np.timedelta64(1, 'h')
+    hour_of_day = ((hours - hours.astype('datetime64[D]')) // np.timedelta64(1, 'h')).astype(float)
+    table = climatology(hours, hour_of_day, smooth_days=0)
+    gappy = hour_of_day.copy()
+    gappy[100:130] = np.nan
+    filled, quality = fill_gaps(gappy, max_gap=6, climatology_table=table, hours=hours)
+    np.testing.assert_allclose(filled[:, 0], hour_of_day)
+    assert (quality[100:130, 0] == CLIMATOLOGY).all()
@@ -0,0 +1,31 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from timeparse import parse_datetime
+
+UTC = timezone.utc
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('2025-07-04T15:00:00', datetime(2025, 7, 4, 15)),
+    ('2025-07-04T15:00', datetime(2025, 7, 4, 15)),
+    ('2025-07-04', datetime(2025, 7, 4)),
+    ('2025-07-04T15:00:00Z', datetime(2025, 7, 4, 15, tzinfo=UTC)),
+    ('2025-07-04T15:00Z', datetime(2025, 7, 4, 15, tzinfo=UTC)),
+    ('2025-07-04T15:00:00.1Z', datetime(2025, 7, 4, 15, 0, 0, 100000, tzinfo=UTC)),
+    ('2025-07-04T11:00:00-04:00', datetime(2025, 7, 4, 11, tzinfo=timezone(timedelta(hours=-4)))),
+    ('20250704T150000', datetime(2025, 7, 4, 15)),
+    ('2025/07/04 15:00', datetime(2025, 7, 4, 15)),
+    ('07/04/2025 3:00 PM', datetime(2025, 7, 4, 15)),
+    ('July 4 2025 3pm', datetime(2025, 7, 4, 15)),
+    (' 2025-07-04T15:00:00 ', datetime(2025, 7, 4, 15)),
+])
+def test_accepted_forms(value, expected):
+    assert parse_datetime(value) == expected
+
+
+@pytest.mark.parametrize('value', ['', '   ', 'not a date', 'NaT', '2025-13-40'])
+def test_rejected_forms_raise_value_error(value):
+    with pytest.raises(ValueError):
+        parse_datetime(value)
@@ -0,0 +1,49 @@
+"""Fast datetime parsing for request bodies and query strings.
+
+The frontend sends ``YYYY-MM-DDTHH:MM:SS``; other clients send ISO 8601 with
+or without seconds, with fractional seconds, a ``Z`` or ``+HH:MM`` suffix, or
+just a date. ``datetime.fromisoformat`` handles those in C, so the common
+requests do not touch pandas. Before Python 3.11 it rejects a ``Z`` suffix, so
+that is rewritten to ``+00:00`` first. A few common non-ISO layouts are tried
+with ``strptime``; anything else (ISO basic format, odd fractional seconds on
+3.10, ``July 4 2025 3pm``) goes to ``pd.to_datetime`` as before, imported only
+when first needed.
+"""
+from datetime import datetime
+
+FALLBACK_FORMATS = (
+    '%Y/%m/%d %H:%M',
+    '%Y/%m/%d %H:%M:%S',
+    '%Y/%m/%d',
+    '%m/%d/%Y %H:%M',
+    '%m/%d/%Y %H:%M:%S',
+    '%m/%d/%Y',
+)
+
+
+def parse_datetime(value):
+    """Parse value into a datetime (aware if it carries an offset); raises ValueError."""
+    text = value.strip()
+    iso = text[:-1] + '+00:00' if text[-1:] in ('Z', 'z') else text
+    try:
+        return datetime.fromisoformat(iso)
+    except ValueError:
+        pass
+    for fmt in FALLBACK_FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    return _parse_with_pandas(value, text)
+
+
+def _parse_with_pandas(value, text):
+    import pandas as pd
+
+    try:
+        parsed = pd.to_datetime(text)
+    except (ValueError, OverflowError, TypeError):
+        parsed = pd.NaT
+    if not text or pd.isna(parsed):
+        raise ValueError(f'Unrecognised datetime: {value!r}')
+    return parsed.to_pydatetime()
@@ -0,0 +1,330 @@
+"""Train a city's forecast model from the hourly history store.
+
+    python train.py --city nyc [--history data/history] [--out models]
+
+Writes ``<city>_lstm_model.h5``, ``<city>_scaler.gz`` (with the training
+histogram drift.py compares live inputs with) and
+``<city>_label_encoder.gz`` in the layout ModelRegistry loads (see
+model_registry.py), plus a golden set of held-out windows with labels for
+hot-reload validation (``<out>/golden/<city>_golden.npz``).
+
+Nothing of size (N, window, 9) is ever materialized. The stored hours are
+read once into a (hours, 9) series (about 315 KB per year), the scalers are
+fitted with streaming mean/variance over chunks of it, and a tf.data
+pipeline turns shuffled batches of window end indices into model inputs with
+one gather per batch, mapped in parallel and prefetched while the model
+trains.
+
+A window ending at hour e is used when every hour in it has all weather
+channels (filled hours count, up to ``--max-filled-fraction`` of the window)
+and the hour e + ``--horizon`` was observed; that hour's class (labels.py) is
+the label. The last ``--val-fraction`` of the windows is held out in time
+order, after a gap that keeps training windows from overlapping it.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from drift import reference_histogram
+from history_store import CHANNELS, HOUR, HistoryStore, WEATHER_CHANNELS, year_start
+from hot_reload import GOLDEN_SUFFIX
+from labels import CLASSES, label_codes
+from model_registry import artifact_paths
+from resample import OBSERVED
+
+project_root = os.path.dirname(BACKEND_DIR)
+DEFAULT_HISTORY = os.path.join(project_root, 'data', 'history')
+DEFAULT_OUT = os.path.join(project_root, 'models')
+SEQ_FEATURES = list(CHANNELS)
+TIME_FEATURES = ['hour_sin', 'hour_cos', 'doy_sin', 'doy_cos', 'month', 'dayofweek']
+
+
+# -- data ----------------------------------------------------------------------
+
+
+def load_series(store, channels=SEQ_FEATURES):
+    """(hours, (n, len(channels)) float32 values, (n, len(WEATHER_CHANNELS)) quality) over all stored years."""
+    years = store.years()
+    if not years:
+        raise ValueError(f'no history for {store.city} under {store.root}')
+    start = year_start(years[0])
+    n = int((year_start(years[-1] + 1) - start) // HOUR)
+    return start + np.arange(n) * HOUR, store.read(start, n, channels), store.read_quality(start, n)
+
+
+def time_feature_array(hours, time_features=TIME_FEATURES):
+    """synthetic.time_feature_rows for a datetime64[h] array: (n, len(time_features))."""
+    days = hours.astype('datetime64[D]')
+    hour = (hours - days) // HOUR
+    doy = (days - hours.astype('datetime64[Y]')) // np.timedelta64(1, 'D') + 1
+    month = hours.astype('datetime64[M]').astype(np.int64) % 12 + 1
+    dow = (days.astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday; Monday = 0
+    feature_map = {
+        'hour_sin': np.sin(2 * np.pi * hour / 24),
+        'hour_cos': np.cos(2 * np.pi * hour / 24),
+        'doy_sin': np.sin(2 * np.pi * doy / 365),
+        'doy_cos': np.cos(2 * np.pi * doy / 365),
+        'month': month.astype(np.float64),
+        'dayofweek': dow.astype(np.float64),
+    }
+    return np.stack([feature_map[name] for name in time_features], axis=-1)
+
+
+def select_windows(values, quality, window, horizon=1, stride=1, max_filled_fraction=0.25,
+                   seq_features=SEQ_FEATURES):
+    """(end indices, label codes) of the usable windows; O(1) per window via prefix counts."""
+    weather = values[:, [seq_features.index(c) for c in WEATHER_CHANNELS]]
+    complete = ~np.isnan(weather).any(axis=1)
+    filled = complete & (quality != OBSERVED).any(axis=1)
+    complete_before = np.concatenate([[0], np.cumsum(complete)])
+    filled_before = np.concatenate([[0], np.cumsum(filled)])
+    ends = np.arange(window - 1, len(values) - horizon, stride)
+    first = ends - window + 1
+    ok = complete_before[ends + 1] - complete_before[first] == window
+    ok &= filled_before[ends + 1] - filled_before[first] <= max_filled_fraction * window
+    target = ends + horizon
+    codes = label_codes(weather[target])
+    ok &= (quality[target] == OBSERVED).all(axis=1) & (codes >= 0)
+    return ends[ok], codes[ok]
+
+
+def split_windows(ends, labels, val_fraction, gap):
+    """Chronological (train, validation) split of (ends, labels) with ``gap`` hours between them."""
+    cut = int(len(ends) * (1 - val_fraction))
+    if cut >= len(ends):
+        return (ends, labels), (ends[:0], labels[:0])
+    train = ends < ends[cut] - gap
+    return (ends[train], labels[train]), (ends[cut:], labels[cut:])
+
+
+class RunningMoments:
+    """Streaming per-feature mean and variance (Chan et al. pairwise update); NaN rows are skipped."""
+
+    def __init__(self, n_features):
+        self.count = 0
+        self.mean = np.zeros(n_features)
+        self.m2 = np.zeros(n_features)
+
+    def update(self, rows):
+        rows = np.asarray(rows, dtype=np.float64)
+        rows = rows[~np.isnan(rows).any(axis=1)]
+        n = len(rows)
+        if n == 0:
+            return
+        mean = rows.mean(axis=0)
+        m2 = ((rows - mean) ** 2).sum(axis=0)
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean = self.mean + delta * n / total
+        self.m2 = self.m2 + m2 + delta ** 2 * self.count * n / total
+        self.count = total
+
+    def scaler(self):
+        """A fitted sklearn StandardScaler with these moments."""
+        from sklearn.preprocessing import StandardScaler
+
+        var = self.m2 / max(self.count, 1)
+        scaler = StandardScaler()
+        scaler.mean_ = self.mean
+        scaler.var_ = var
+        scaler.scale_ = np.where(var > 0, np.sqrt(var), 1.0)
+        scaler.n_samples_seen_ = np.int64(self.count)
+        scaler.n_features_in_ = len(self.mean)
+        return scaler
+
+
+def fit_scalers(values, hours, train_ends, window, time_features=TIME_FEATURES, chunk=8192):
+    """(scaler, time_scaler) from the hours the training windows cover and their end times."""
+    seq = RunningMoments(values.shape[1])
+    for start in range(int(train_ends.min()) - window + 1, int(train_ends.max()) + 1, chunk):
+        seq.update(values[start:min(start + chunk, int(train_ends.max()) + 1)])
+    tim = RunningMoments(len(time_features))
+    for start in range(0, len(train_ends), chunk):
+        tim.update(time_feature_array(hours[train_ends[start:start + chunk]], time_features))
+    return seq.scaler(), tim.scaler()
+
+
+def drift_reference(series, train_ends, window):
+    """Histogram of the scaled training hours (the ones fit_scalers saw) that drift.py compares live inputs with."""
+    return reference_histogram(series[int(train_ends.min()) - window + 1:int(train_ends.max()) + 1])
+
+
+def make_dataset(series, time_inputs, ends, labels, window, batch_size, n_classes, shuffle=False, seed=0):
+    """tf.data pipeline of ((seq (B, window, F), time (B, T)), one-hot labels), gathered batch by batch."""
+    import tensorflow as tf
+
+    series = tf.constant(series, dtype=tf.float32)
+    time_inputs = tf.constant(time_inputs, dtype=tf.float32)
+    offsets = tf.range(-window + 1, 1, dtype=tf.int64)
+
+    def to_batch(end, label):
+        seq = tf.gather(series, end[:, None] + offsets[None, :])
+        return (seq, tf.gather(time_inputs, end)), tf.one_hot(label, n_classes)
+
+    ds = tf.data.Dataset.from_tensor_slices((ends.astype(np.int64), labels.astype(np.int32)))
+    if shuffle:
+        ds = ds.shuffle(len(ends), seed=seed, reshuffle_each_iteration=True)
+    return ds.batch(batch_size).map(to_batch, num_parallel_calls=tf.data.AUTOTUNE).prefetch(tf.data.AUTOTUNE)
+
+
+# -- model ---------------------------------------------------------------------
+
+
+def build_model(window, n_seq, n_time, n_classes, learning_rate=1e-3, units=256, dropout=0.3):
+    """The shipped architecture (with the defaults): LSTM(units) over the window, Dense(64) over the time features."""
+    from tensorflow import keras
+    from tensorflow.keras import layers
+
+    seq_input = keras.Input(shape=(window, n_seq), name='seq_input')
+    time_input = keras.Input(shape=(n_time,), name='time_input')
+    x = layers.Dropout(dropout)(layers.LSTM(units)(seq_input))
+    t = layers.Dropout(0.2)(layers.Dense(64, activation='relu')(time_input))
+    h = layers.Dropout(dropout)(layers.Dense(128, activation='relu')(layers.Concatenate()([x, t])))
+    output = layers.Dense(n_classes, activation='softmax')(h)
+    model = keras.Model([seq_input, time_input], output)
+    model.compile(optimizer=keras.optimizers.Adam(learning_rate), loss='categorical_crossentropy',
+                  metrics=['accuracy'])
+    return model
+
+
+def class_weights(labels, n_classes):
+    """'balanced' weights for the classes present in labels."""
+    counts = np.bincount(labels, minlength=n_classes)
+    present = counts > 0
+    weights = np.zeros(n_classes)
+    weights[present] = len(labels) / (present.sum() * counts[present])
+    return {i: float(w) for i, w in enumerate(weights) if present[i]}
+
+
+def write_artifacts(out_dir, city, model, scaler, time_scaler, seq_features, time_features, classes=CLASSES,
+                    drift_reference=None):
+    """Write the three artifacts ModelRegistry loads; each file is replaced atomically."""
+    import joblib
+    from sklearn.preprocessing import LabelEncoder
+
+    os.makedirs(out_dir, exist_ok=True)
+    paths = artifact_paths(out_dir, city)
+    tmp = {path: path[:path.rindex('.')] + '.tmp' + path[path.rindex('.'):] for path in paths.all()}
+    model.save(tmp[paths.model])
+    artifacts = {'scaler': scaler, 'time_scaler': time_scaler,
+                 'seq_features': list(seq_features), 'time_features': list(time_features)}
+    if drift_reference is not None:
+        artifacts['drift_reference'] = np.asarray(drift_reference)
+    joblib.dump(artifacts, tmp[paths.scaler])
+    joblib.dump(LabelEncoder().fit(list(classes)), tmp[paths.encoder])
+    for path in paths.all():
+        os.replace(tmp[path], path)
+    return paths
+
+
+def write_golden(out_dir, city, values, hours, ends, labels, window, n=256, time_features=TIME_FEATURES):
+    """Held-out raw windows with their labels, for hot-reload validation (see hot_reload.py)."""
+    if n <= 0 or len(ends) == 0:
+        return None
+    pick = np.unique(np.linspace(0, len(ends) - 1, min(n, len(ends))).astype(np.int64))
+    offsets = np.arange(-window + 1, 1)
+    golden_dir = os.path.join(out_dir, 'golden')
+    os.makedirs(golden_dir, exist_ok=True)
+    path = os.path.join(golden_dir, city + GOLDEN_SUFFIX)
+    np.savez_compressed(path, seq_raw=values[ends[pick, None] + offsets],
+                        time_raw=time_feature_array(hours[ends[pick]], time_features),
+                        labels=np.asarray(CLASSES)[labels[pick]])
+    return path
+
+
+# -- CLI -----------------------------------------------------------------------
+
+
+def train(store, out_dir, window=720, horizon=1, stride=1, epochs=20, batch_size=64, val_fraction=0.1,
+          patience=3, learning_rate=1e-3, balanced=False, max_filled_fraction=0.25, golden=256, seed=0,
+          units=256, dropout=0.3, log=print):
+    """Train on store's history and write the artifacts to out_dir; returns a summary dict."""
+    import tensorflow as tf
+
+    tf.keras.utils.set_random_seed(seed)
+    hours, values, quality = load_series(store)
+    ends, labels = select_windows(values, quality, window, horizon, stride, max_filled_fraction)
+    (train_ends, train_labels), (val_ends, val_labels) = split_windows(ends, labels, val_fraction, window + horizon)
+    if len(train_ends) == 0:
+        raise ValueError(f'no complete {window}-hour windows with observed labels in the history of {store.city}')
+    log(f'{store.city}: {len(hours)} hours, {len(train_ends)} training / {len(val_ends)} validation windows')
+    log('label counts: ' + ', '.join(f'{c}: {n}' for c, n in zip(CLASSES, np.bincount(labels, minlength=len(CLASSES)))))
+
+    scaler, time_scaler = fit_scalers(values, hours, train_ends, window)
+    series = ((values - scaler.mean_) / scaler.scale_).astype(np.float32)
+    time_inputs = time_scaler.transform(time_feature_array(hours)).astype(np.float32)
+    n_classes = len(CLASSES)
+    train_ds = make_dataset(series, time_inputs, train_ends, train_labels, window, batch_size, n_classes,
+                            shuffle=True, seed=seed)
+    val_ds = make_dataset(series, time_inputs, val_ends, val_labels, window, batch_size, n_classes) \
+        if len(val_ends) else None
+
+    model = build_model(window, len(SEQ_FEATURES), len(TIME_FEATURES), n_classes, learning_rate, units, dropout)
+    callbacks = []
+    if val_ds is not None and patience:
+        callbacks.append(tf.keras.callbacks.EarlyStopping(patience=patience, restore_best_weights=True))
+    started = time.perf_counter()
+    # train_ds is shuffled by tf.data already.
+    history = model.fit(train_ds, validation_data=val_ds, epochs=epochs, callbacks=callbacks, verbose=2, shuffle=False,
+                        class_weight=class_weights(train_labels, n_classes) if balanced else None)
+    summary = {
+        'city': store.city,
+        'train_windows': int(len(train_ends)),
+        'val_windows': int(len(val_ends)),
+        'epochs': len(history.history['loss']),
+        'train_seconds': round(time.perf_counter() - started, 1),
+    }
+    if val_ds is not None:
+        summary['val_loss'], summary['val_accuracy'] = (float(v) for v in model.evaluate(val_ds, verbose=0))
+
+    paths = write_artifacts(out_dir, store.city, model, scaler, time_scaler, SEQ_FEATURES, TIME_FEATURES,
+                            drift_reference=drift_reference(series, train_ends, window))
+    summary['artifacts'] = list(paths.all())
+    golden_path = write_golden(out_dir, store.city, values, hours, val_ends, val_labels, window, golden)
+    if golden_path:
+        summary['golden'] = golden_path
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python train.py', description=__doc__.split('\n')[0])
+    parser.add_argument('--city', required=True)
+    parser.add_argument('--history', default=os.environ.get('HISTORY_DIR', DEFAULT_HISTORY), help='history store root')
+    parser.add_argument('--out', default=os.environ.get('MODELS_DIR', DEFAULT_OUT), help='artifact directory')
+    parser.add_argument('--window', type=int, default=720, help='hours per input window')
+    parser.add_argument('--horizon', type=int, default=1, help='hours after the window end that are labelled')
+    parser.add_argument('--stride', type=int, default=1, help='hours between consecutive window ends')
+    parser.add_argument('--epochs', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--val-fraction', type=float, default=0.1)
+    parser.add_argument('--patience', type=int, default=3, help='early-stopping patience (0 disables)')
+    parser.add_argument('--learning-rate', type=float, default=1e-3)
+    parser.add_argument('--units', type=int, default=256, help='LSTM units')
+    parser.add_argument('--dropout', type=float, default=0.3)
+    parser.add_argument('--balanced', action='store_true', help='weight classes inversely to their frequency')
+    parser.add_argument('--max-filled-fraction', type=float, default=0.25,
+                        help='share of interpolated/climatology hours allowed in a window')
+    parser.add_argument('--golden', type=int, default=256, help='held-out windows saved for reload validation')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    try:
+        summary = train(HistoryStore(args.history, args.city), args.out, args.window, args.horizon, args.stride,
+                        args.epochs, args.batch_size, args.val_fraction, args.patience, args.learning_rate,
+                        args.balanced, args.max_filled_fraction, args.golden, args.seed, args.units, args.dropout)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    for key, value in summary.items():
+        print(f'{key}: {value}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())